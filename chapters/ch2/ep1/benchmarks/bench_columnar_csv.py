@@ -0,0 +1,95 @@
+"""
+Benchmark: reading deb-routes.csv with csv.DictReader, pandas.read_csv, and the memory-mapped columnar reader.
+
+Reports the read time, the peak memory allocated while reading (tracemalloc), and the memory still held by the
+result. Use --scale to repeat the routes file N times into a temp file, to simulate a larger production extract.
+
+usage: python bench_columnar_csv.py [--file ../data/deb-routes.csv] [--scale 10] [--runs 3]
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+# the benchmarks run from the source tree: make the ch2/ep1 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from columnar_csv import ROUTES_SCHEMA, read_routes
+
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data"))
+
+
+def read_dict_reader(path:str) -> list:
+    with open(path, "r", newline="") as csv_file:
+        return list(csv.DictReader(csv_file))
+
+
+def read_pandas(path:str):
+    import pandas as pd
+    return pd.read_csv(path, dtype={name: "category" if field_type == "category" else field_type
+                                    for name, field_type in ROUTES_SCHEMA.items()}, keep_default_na=False)
+
+
+def measure(func, path:str, runs:int) -> tuple:
+    """returns the best read time, the peak memory while reading, and the memory held by the result"""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        del result
+    tracemalloc.start()
+    result = func(path)
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, held, len(result)
+
+
+def scaled_copy(path:str, scale:int) -> str:
+    """writes the file's rows `scale` times into a temp file (one header line)"""
+    with open(path, "r") as csv_file:
+        header = csv_file.readline()
+        body = csv_file.read()
+    if not body.endswith("\n"):
+        body += "\n"
+    tmp = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+    with tmp:
+        tmp.write(header)
+        for _ in range(scale):
+            tmp.write(body)
+    return tmp.name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV readers benchmark")
+    parser.add_argument("-f", "--file", default=os.path.join(DATA_DIR, "deb-routes.csv"), help="routes csv file")
+    parser.add_argument("-s", "--scale", type=int, default=1, help="repeat the file rows N times")
+    parser.add_argument("-r", "--runs", type=int, default=3, help="runs per reader (the best time is reported)")
+    args = parser.parse_args()
+
+    path = args.file if args.scale == 1 else scaled_copy(args.file, args.scale)
+    readers = {"csv.DictReader": read_dict_reader, "columnar (mmap)": read_routes}
+    try:
+        import pandas
+        readers["pandas.read_csv"] = read_pandas
+    except ImportError:
+        print("pandas is not installed; skipping pandas.read_csv")
+
+    print(f"{path}: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+    try:
+        for name, func in readers.items():
+            elapsed, peak, held, rows = measure(func, path, args.runs)
+            print(f"  {name:<16s} {elapsed * 1000:9.1f} ms  {rows / elapsed / 1e6:6.2f} M rows/s  "
+                  f"peak {peak / 1024 / 1024:8.1f} MB  result {held / 1024 / 1024:8.1f} MB")
+    finally:
+        if path != args.file:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""
+Memory-mapped, typed columnar reader for CSV files such as `deb-routes.csv` and `deb-airports.csv`.
+
+`csv.DictReader` creates one python dict (and one string per field) for every row. This reader memory-maps the file
+and finds the field delimiters of a whole chunk of the file at once with numpy. Each column is then converted
+into one typed numpy array:
+
+    - `category` columns (IATA codes, airline codes) are dictionary encoded: an integer code per row plus
+      one small dictionary of unique values
+    - `int8`, `int16`, ... and `float32`, `float64` columns are parsed into numeric arrays
+    - `bytes` columns (free text such as airport names) are kept as fixed width byte strings
+
+The column arrays are read-only and returned without copying; slicing or filtering them creates numpy views or
+new arrays but no python objects per row.
+
+Limitations: fields can be quoted ("...") and contain commas and backslash escaped quotes (\\"), but quoted
+fields can NOT contain newlines or doubled ("") quotes.
+
+usage:
+    from columnar_csv import read_routes
+    routes = read_routes("../data/deb-routes.csv")
+    src = routes["src"]                         # DictColumn
+    pdx = routes.rows(src.codes == src.code_of("PDX"))
+"""
+
+import os
+import sys
+import mmap
+
+import numpy as np
+
+
+# field types and their numpy dtypes
+NUMERIC_TYPES = {"int8", "int16", "int32", "int64", "float32", "float64"}
+FIELD_TYPES = NUMERIC_TYPES | {"category", "bytes"}
+
+# column types of the course data files
+ROUTES_SCHEMA = {
+    "airline": "category",
+    "src": "category",
+    "dest": "category",
+    "codeshare": "category",
+    "stops": "int8",
+    "equipment": "category",
+}
+AIRPORTS_SCHEMA = {
+    "iata": "category",
+    "airport": "bytes",
+    "city": "category",
+    "state": "category",
+    "country": "category",
+    "lat": "float64",
+    "lon": "float64",
+}
+
+# ascii codes
+COMMA = ord(",")
+QUOTE = ord('"')
+BACKSLASH = ord("\\")
+NEWLINE = ord("\n")
+RETURN = ord("\r")
+MINUS = ord("-")
+ZERO = ord("0")
+
+# default number of bytes parsed at once (the temporary arrays are a few times larger than this)
+CHUNK_BYTES = 8 * 1024 * 1024
+
+
+class DictColumn:
+    """
+    Dictionary encoded column: an integer code per row pointing into a dictionary of unique values.
+    """
+
+    def __init__(self, codes:np.ndarray, dictionary:np.ndarray):
+        """
+        Args:
+            codes (np.ndarray): integer code of each row
+            dictionary (np.ndarray): unique values (numpy str array); `dictionary[code]` is the row value
+        """
+        self.codes = codes
+        self.dictionary = dictionary
+        # value to code lookup
+        self.index = {value: code for code, value in enumerate(dictionary.tolist())}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        """value of one row; or a numpy str array of values for a slice, mask, or list of rows"""
+        return self.dictionary[self.codes[row]]
+
+    def code_of(self, value:str) -> int:
+        """returns the code of a value; or -1 if the value is not present in this column"""
+        return self.index.get(value, -1)
+
+    def decode(self) -> np.ndarray:
+        """returns all the values as a numpy str array"""
+        return self.dictionary[self.codes]
+
+
+class ColumnarCSV:
+    """
+    Typed columns of a CSV file. Columns are accessed by name: `table["src"]`.
+    """
+
+    def __init__(self, columns:dict, num_rows:int):
+        """
+        Args:
+            columns (dict): column name to numpy array or DictColumn
+            num_rows (int): number of rows
+        """
+        self.columns = columns
+        self.num_rows = num_rows
+
+    @property
+    def fields(self) -> list:
+        return list(self.columns)
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, name:str):
+        return self.columns[name]
+
+    def nbytes(self) -> int:
+        """returns the memory used by the column arrays"""
+        total = 0
+        for column in self.columns.values():
+            if isinstance(column, DictColumn):
+                total += column.codes.nbytes + column.dictionary.nbytes
+            else:
+                total += column.nbytes
+        return total
+
+    def rows(self, selection=slice(None)) -> list:
+        """
+        Decodes rows into a list of dicts (for example to return them as json).
+
+        Args:
+            selection (optional): a slice, boolean mask, or array of row numbers. Defaults to all rows.
+
+        Returns:
+            list: list of dict rows
+        """
+        values = {}
+        for name, column in self.columns.items():
+            selected = column[selection]
+            if isinstance(column, DictColumn):
+                values[name] = selected.tolist()
+            elif selected.dtype.kind == "S":
+                values[name] = [_decode(value) for value in selected.tolist()]
+            else:
+                values[name] = selected.tolist()
+        return [dict(zip(values, row)) for row in zip(*values.values())]
+
+    @classmethod
+    def read(cls, path:str, schema:dict=None, chunk_bytes:int=CHUNK_BYTES) -> "ColumnarCSV":
+        """
+        Reads a CSV file (with a header line) into typed columns.
+
+        Args:
+            path (str): CSV file path
+            schema (dict, optional): column name to field type (see FIELD_TYPES). Columns missing from the
+                                     schema are read as `category`. Defaults to None.
+            chunk_bytes (int, optional): number of bytes to tokenize at once. Defaults to CHUNK_BYTES.
+
+        Returns:
+            ColumnarCSV: typed columns
+
+        Raises:
+            ValueError: unknown field type, or a row with the wrong number of fields or an invalid value
+        """
+        schema = schema or {}
+        with open(path, "rb") as csv_file:
+            if os.fstat(csv_file.fileno()).st_size == 0:
+                raise ValueError(f"Empty CSV file: {path}")
+            mapped = mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return cls._read_buffer(np.frombuffer(mapped, dtype=np.uint8), schema, chunk_bytes)
+            finally:
+                try:
+                    mapped.close()
+                except BufferError:
+                    # an exception traceback still references the buffer; it's unmapped when garbage collected
+                    pass
+
+    @classmethod
+    def _read_buffer(cls, buf:np.ndarray, schema:dict, chunk_bytes:int) -> "ColumnarCSV":
+        # parse the header line
+        header_end = _find_newline(buf, 0)
+        header = bytes(buf[:header_end]).decode("utf-8").rstrip("\r")
+        fields = [field.strip('"') for field in header.split(",")]
+        types = [schema.get(field, "category") for field in fields]
+        for field, field_type in zip(fields, types):
+            if field_type not in FIELD_TYPES:
+                raise ValueError(f"Unknown field type for {field}: {field_type}")
+        builders = [_COLUMN_BUILDERS[field_type](field_type) for field_type in types]
+
+        # tokenize the file in chunks of whole lines
+        num_rows = 0
+        start = header_end + 1
+        while start < len(buf):
+            end = _find_newline(buf, min(start + chunk_bytes, len(buf)))
+            chunk = buf[start:end + 1]
+            starts, ends = _tokenize(chunk, len(fields), first_line=num_rows + 2)
+            for col, builder in enumerate(builders):
+                builder.add(chunk, starts[:, col], ends[:, col])
+            num_rows += len(starts)
+            start = end + 1
+
+        columns = {field: builder.finish() for field, builder in zip(fields, builders)}
+        return cls(columns, num_rows)
+
+
+def _find_newline(buf:np.ndarray, pos:int) -> int:
+    """returns the position of the next newline at or after pos (or the last byte of the buffer)"""
+    while pos < len(buf):
+        found = np.flatnonzero(buf[pos:pos + 65536] == NEWLINE)
+        if found.size:
+            return pos + int(found[0])
+        pos += 65536
+    return len(buf) - 1
+
+
+def _tokenize(chunk:np.ndarray, num_fields:int, first_line:int) -> tuple:
+    """
+    Finds the start and end of every field in a chunk of whole lines.
+
+    Args:
+        chunk (np.ndarray): uint8 buffer
+        num_fields (int): number of fields per line
+        first_line (int): line number of the first line (for error messages)
+
+    Returns:
+        tuple: (starts, ends) int arrays of shape (rows, num_fields). The quotes and trailing \\r are excluded.
+    """
+    delims = np.flatnonzero((chunk == COMMA) | (chunk == NEWLINE))
+    # the field offsets fit into int32 for chunks up to 2GB (halves the temporary arrays)
+    offset_type = np.int32 if len(chunk) < 2 ** 31 else np.int64
+    delims = delims.astype(offset_type)
+    quotes = np.flatnonzero(chunk == QUOTE)
+    # skip escaped quotes (\")
+    quotes = quotes[(quotes == 0) | (chunk[quotes - 1] != BACKSLASH)]
+    if quotes.size:
+        # a delimiter is inside a quoted field when an odd number of quotes precede it
+        delims = delims[(np.searchsorted(quotes, delims) & 1) == 0]
+    if chunk[-1] != NEWLINE:
+        # last line of the file without a newline
+        delims = np.append(delims, len(chunk))
+    starts = np.append(offset_type(0), delims[:-1] + 1)
+    is_newline = np.append(chunk, NEWLINE)[delims] == NEWLINE
+    # skip empty lines: a newline right after the previous newline (or after a lone \r)
+    blank = (starts == delims) | ((delims == starts + 1) & (np.append(chunk, 0)[starts] == RETURN))
+    empty = is_newline & blank & np.append(True, is_newline[:-1])
+    if empty.any():
+        delims, starts, is_newline = delims[~empty], starts[~empty], is_newline[~empty]
+
+    if delims.size % num_fields or not is_newline[num_fields - 1::num_fields].all() \
+            or is_newline.sum() != delims.size // num_fields:
+        # find the first line with the wrong number of fields
+        line_ends = np.flatnonzero(is_newline)
+        counts = np.diff(np.append(-1, line_ends)) if line_ends.size else np.array([delims.size])
+        bad = int(np.flatnonzero(counts != num_fields)[0]) if (counts != num_fields).any() else len(counts)
+        raise ValueError(f"Line {first_line + bad}: expected {num_fields} fields")
+
+    ends = delims.reshape(-1, num_fields)
+    starts = starts.reshape(-1, num_fields)
+    # remove a trailing \r (windows line endings)
+    last = ends[:, -1]
+    last -= (last > starts[:, -1]) & (np.append(chunk, 0)[last - 1] == RETURN)
+    # remove the quotes around quoted fields
+    widths = ends - starts
+    quoted = (widths >= 2) & (chunk[np.minimum(starts, len(chunk) - 1)] == QUOTE)
+    starts += quoted
+    ends -= quoted
+    return starts, ends
+
+
+def _decode(value:bytes) -> str:
+    """decodes a field value and removes the backslash from escaped quotes"""
+    return value.decode("utf-8").replace('\\"', '"')
+
+
+def _gather(chunk:np.ndarray, starts:np.ndarray, ends:np.ndarray, right_align:bool=False,
+            multiple_of:int=1) -> np.ndarray:
+    """
+    Copies the bytes of each field into a (rows, width) uint8 matrix padded with zeros.
+
+    Args:
+        multiple_of (int, optional): round the matrix width up to a multiple of this number. Defaults to 1.
+
+    Returns:
+        np.ndarray: uint8 matrix; width is the longest field
+    """
+    widths = ends - starts
+    width = max(int(widths.max()) if widths.size else 0, 1)
+    width = -(-width // multiple_of) * multiple_of
+    offsets = np.arange(width, dtype=starts.dtype)
+    if right_align:
+        used = offsets >= (width - widths)[:, None]
+    else:
+        used = offsets < widths[:, None]
+    # position of every field byte: the field start plus the byte's offset inside the field
+    field_offsets = np.cumsum(widths) - widths
+    index = np.arange(int(widths.sum()), dtype=starts.dtype) + np.repeat(starts - field_offsets, widths)
+    matrix = np.zeros((len(starts), width), dtype=np.uint8)
+    matrix[used] = chunk[index]
+    return matrix
+
+
+def _unique_rows(matrix:np.ndarray) -> tuple:
+    """
+    Finds the unique rows of a zero padded uint8 matrix (width is a multiple of 8). Each row is hashed into
+    one uint64 key; sorting integer keys is much faster than sorting byte strings.
+
+    Returns:
+        tuple: (unique values as fixed width byte strings, inverse index of each row)
+    """
+    words = matrix.view(np.uint64)
+    keys = words[:, 0].copy()
+    for col in range(1, words.shape[1]):
+        # uint64 arithmetic wraps around
+        keys *= np.uint64(0x100000001B3)
+        keys ^= words[:, col]
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    unique = matrix[first]
+    if words.shape[1] > 1 and not (unique[inverse.ravel()] == matrix).all():
+        # hash collision: sort the byte strings instead
+        unique, inverse = np.unique(matrix.view(f"S{matrix.shape[1]}").ravel(), return_inverse=True)
+        return unique, inverse.ravel()
+    return unique.view(f"S{matrix.shape[1]}").ravel(), inverse.ravel()
+
+
+class _CategoryBuilder:
+    """dictionary encodes a column; each chunk's dictionary is merged into a global dictionary"""
+
+    def __init__(self, field_type:str):
+        self.index = {}
+        self.codes = []
+
+    def add(self, chunk, starts, ends):
+        unique, inverse = _unique_rows(_gather(chunk, starts, ends, multiple_of=8))
+        # map the chunk's codes to the global dictionary codes
+        mapping = np.array([self.index.setdefault(value, len(self.index)) for value in unique.tolist()],
+                           dtype=np.int32)
+        self.codes.append(mapping[inverse])
+
+    def finish(self) -> DictColumn:
+        dictionary = np.array([_decode(value) for value in self.index], dtype=str)
+        # use the smallest integer type that fits the dictionary
+        dtype = np.int8 if len(dictionary) <= 127 else np.int16 if len(dictionary) <= 32767 else np.int32
+        codes = np.concatenate(self.codes).astype(dtype) if self.codes else np.zeros(0, dtype=dtype)
+        codes.flags.writeable = False
+        dictionary.flags.writeable = False
+        return DictColumn(codes, dictionary)
+
+
+class _BytesBuilder:
+    """keeps a column as fixed width byte strings"""
+
+    def __init__(self, field_type:str):
+        self.chunks = []
+
+    def add(self, chunk, starts, ends):
+        matrix = _gather(chunk, starts, ends)
+        self.chunks.append(matrix.view(f"S{matrix.shape[1]}").ravel())
+
+    def finish(self) -> np.ndarray:
+        # numpy pads the shorter chunks to the widest byte string
+        values = np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype="S1")
+        values.flags.writeable = False
+        return values
+
+
+class _IntBuilder:
+    """parses a column of integers without creating python objects"""
+
+    def __init__(self, field_type:str):
+        self.dtype = np.dtype(field_type)
+        self.chunks = []
+
+    def add(self, chunk, starts, ends):
+        negative = (ends > starts) & (chunk[np.minimum(starts, len(chunk) - 1)] == MINUS)
+        matrix = _gather(chunk, starts + negative, ends, right_align=True)
+        digits = matrix.astype(np.int64) - ZERO
+        digits[matrix == 0] = 0
+        if ((digits < 0) | (digits > 9))[matrix != 0].any() or (ends <= starts + negative).any():
+            raise ValueError(f"Invalid {self.dtype} value")
+        powers = 10 ** np.arange(matrix.shape[1] - 1, -1, -1, dtype=np.int64)
+        values = digits @ powers
+        values[negative] *= -1
+        info = np.iinfo(self.dtype)
+        if values.size and (values.min() < info.min or values.max() > info.max):
+            raise ValueError(f"{self.dtype} value out of range")
+        self.chunks.append(values.astype(self.dtype))
+
+    def finish(self) -> np.ndarray:
+        values = np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=self.dtype)
+        values.flags.writeable = False
+        return values
+
+
+class _FloatBuilder(_IntBuilder):
+    """parses a column of floats; numpy converts the fixed width byte strings in C"""
+
+    def add(self, chunk, starts, ends):
+        matrix = _gather(chunk, starts, ends)
+        self.chunks.append(matrix.view(f"S{matrix.shape[1]}").ravel().astype(self.dtype))
+
+
+_COLUMN_BUILDERS = {
+    "category": _CategoryBuilder,
+    "bytes": _BytesBuilder,
+    "int8": _IntBuilder,
+    "int16": _IntBuilder,
+    "int32": _IntBuilder,
+    "int64": _IntBuilder,
+    "float32": _FloatBuilder,
+    "float64": _FloatBuilder,
+}
+
+
+def read_routes(path:str) -> ColumnarCSV:
+    """reads deb-routes.csv into typed columns (see ROUTES_SCHEMA)"""
+    return ColumnarCSV.read(path, ROUTES_SCHEMA)
+
+
+def read_airports(path:str) -> ColumnarCSV:
+    """reads deb-airports.csv into typed columns (see AIRPORTS_SCHEMA)"""
+    return ColumnarCSV.read(path, AIRPORTS_SCHEMA)
+
+
+def main():
+    """
+    Prints the columns of a CSV file. usage: python columnar_csv.py file_name [routes|airports]
+    """
+    args = sys.argv
+    if len(args) not in (2, 3):
+        print("usage: python3 columnar_csv.py file_name [routes|airports]")
+        sys.exit(1)
+    schema = {"routes": ROUTES_SCHEMA, "airports": AIRPORTS_SCHEMA}.get(args[2] if len(args) == 3 else None)
+    table = ColumnarCSV.read(args[1], schema)
+    print(f"Read {len(table)} rows, {table.nbytes() / 1024:.1f} KB")
+    for name, column in table.columns.items():
+        if isinstance(column, DictColumn):
+            print(f"  {name:<12s} category[{column.codes.dtype}], {len(column.dictionary)} unique values")
+        else:
+            print(f"  {name:<12s} {column.dtype}")
+    print(table.rows(slice(0, 3)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Validate that the src and dest airports of every route exist in the airports file.
+
+Splits deb-routes.csv into an OK and a Reject file, the same way `process_profiles.py` does. The airports file is
+loaded into a hash set of iata codes and the routes file is streamed one line at a time (a streaming hash join),
+so memory only grows with the airports file and not with the routes file.
+
+usage: python3 validate_routes.py airports_file routes_file print_lines
+"""
+
+# imports
+import sys
+import csv
+import time
+from collections import Counter
+from datetime import datetime
+
+
+# the route fields that must be present
+ROUTE_FIELDS = ["airline", "src", "dest", "codeshare", "stops", "equipment"]
+
+# reject reasons
+UNKNOWN_SRC = "unknown_src"
+UNKNOWN_DEST = "unknown_dest"
+MISSING_FIELDS = "missing_fields"
+INVALID_STOPS = "invalid_stops"
+
+
+def load_airport_codes(file_name:str) -> set:
+    """
+    Reads the iata codes of an airports CSV file into a set (the build side of the hash join).
+
+    Args:
+        file_name (str): airports file path (for example: deb-airports.csv)
+
+    Returns:
+        set: iata codes
+    """
+    with open(file_name, "r", encoding="utf-8", newline="") as csv_file:
+        # the airports file escapes quotes inside the airport names with a backslash
+        reader = csv.DictReader(csv_file, escapechar="\\", doublequote=False)
+        return {row["iata"] for row in reader}
+
+
+def check_route(row:list, positions:dict, airport_codes:set) -> list:
+    """
+    Checks a route row. Returns a list of reject reasons (empty if the row is valid):
+        - missing_fields: the row doesn't have the same number of fields as the header
+        - invalid_stops: stops is not a number
+        - unknown_src: src is not an airport iata code
+        - unknown_dest: dest is not an airport iata code
+
+    Args:
+        row (list): route row fields
+        positions (dict): position of each route field in the row (from the header)
+        airport_codes (set): airport iata codes
+
+    Returns:
+        list: reject reasons
+    """
+    if len(row) != len(positions):
+        return [MISSING_FIELDS]
+    reasons = []
+    if not row[positions["stops"]].isdigit():
+        reasons.append(INVALID_STOPS)
+    # probe the airports hash set
+    if row[positions["src"]] not in airport_codes:
+        reasons.append(UNKNOWN_SRC)
+    if row[positions["dest"]] not in airport_codes:
+        reasons.append(UNKNOWN_DEST)
+    return reasons
+
+
+def run(airports_file:str, routes_file:str, print_lines:bool=False) -> Counter:
+    """
+    Validates the routes against the airports and writes them into an OK and a Reject CSV file. Rejected rows
+    include an extra `error` column with the line number and reject reasons.
+
+    Args:
+        airports_file (str): airports file path
+        routes_file (str): routes file path
+        print_lines (bool): print the ok and rejected lines to console
+
+    Returns:
+        Counter: reject counts by reason
+
+    Raises:
+        ValueError: the routes file header is missing a route field
+    """
+    # keep track or row counts
+    line_num = 0            # total number of rows
+    ok_count = 0            # number of rows without errors
+    reject_count = 0        # number of rows with errors
+    reasons_count = Counter()
+    start = time.perf_counter()
+
+    # build side: load the (small) airports file into memory
+    airport_codes = load_airport_codes(airports_file)
+    print(f"Loaded {len(airport_codes)} airport codes")
+
+    # prepare a ok & reject file
+    # -------------------------------------
+    # add a timestamp to files
+    file_timestamp = datetime.utcnow().strftime("%Y%m%d")
+    # get the file name without it's extension
+    file_name_without_extension = routes_file.rpartition('.')[0]
+    # create ok and reject file names inclusing the timestamp
+    ok_file_name = f"{file_name_without_extension}_{file_timestamp}_ok.csv"
+    reject_file_name = f"{file_name_without_extension}_{file_timestamp}_reject.csv"
+
+    with open(routes_file, "r", encoding="utf-8", newline="") as csv_file, \
+            open(ok_file_name, "w", encoding="utf-8", newline="") as ok_file, \
+            open(reject_file_name, "w", encoding="utf-8", newline="") as reject_file:
+        # probe side: stream the routes one row at a time
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        missing = [field for field in ROUTE_FIELDS if field not in header]
+        if missing:
+            raise ValueError(f"Missing route fields in the header: {missing}")
+        positions = {field: i for i, field in enumerate(header)}
+        ok_writer = csv.writer(ok_file)
+        reject_writer = csv.writer(reject_file)
+        ok_writer.writerow(header)
+        reject_writer.writerow(header + ["error"])
+        for row in reader:
+            reasons = check_route(row, positions, airport_codes)
+            if not reasons:
+                ok_writer.writerow(row)
+                if print_lines:
+                    print(f"[{line_num:02d}][OK]: {row}")
+                ok_count += 1
+            else:
+                # add error and line number to the row
+                err_msg = f"[{line_num:02d}][ERR]: {', '.join(reasons)}"
+                reject_writer.writerow(row + [err_msg])
+                if print_lines:
+                    print(err_msg, row)
+                reasons_count.update(reasons)
+                reject_count += 1
+            line_num += 1
+
+    # print line count summary at the end
+    elapsed = time.perf_counter() - start
+    print(f"Read {line_num} rows in {elapsed:.1f}s ({line_num / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(f"OK rows: {ok_count:02d}, Rejected rows: {reject_count:02d}")
+    for reason, count in reasons_count.most_common():
+        print(f"  {reason}: {count}")
+    return reasons_count
+
+
+def main():
+    """
+    The main execution method. Get command line args and call the `run()` method.
+    """
+    args = sys.argv     # command line arguments into our script
+    if len(args) != 4:
+        # print help
+        help = "usage: python3 validate_routes.py airports_file routes_file print_lines\nprint_lines can be 'yes' or 'no'"
+        print(help)
+        sys.exit(1)
+    # get the command line args
+    airports_file = args[1]
+    routes_file = args[2]
+    print_lines = str(args[3]).lower() in {'yes', 'true'}
+    # call our run method
+    run(airports_file, routes_file, print_lines)
+
+
+# call our main function to parse command line args
+if __name__ == '__main__':
+    main()
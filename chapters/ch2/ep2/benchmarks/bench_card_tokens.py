@@ -0,0 +1,81 @@
+"""
+Benchmark: overhead of the card number tokenization stage of src/process_profiles.py (src/card_tokens.py).
+
+Generates --rows profile rows (src/generate_data.py). --unique-cards of the cards get a new random card number, the
+others are drawn from a pool of --pool-size cards, like repeat customers. Then measures the seconds per million rows
+of:
+
+    - baseline: json.loads + json.dumps of the rows (the minimum an ETL stage costs)
+    - tokenization of the rows in batches of --batch-size, with and without the LRU cache, with 1 and --workers
+      hashing threads
+
+usage: python bench_card_tokens.py [--rows 200000] [--unique-cards 0.2] [--pool-size 2000] [--batch-size 10000]
+                                   [--workers 4]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+# the benchmarks run from the source tree: make the ch2/ep2 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from card_tokens import DEFAULT_BATCH_SIZE, DEFAULT_CACHE_SIZE, CardTokenizer
+from generate_data import Pools, profile_row
+
+
+def make_lines(num_rows:int, unique_cards:float, pool_size:int, seed:int=42) -> list:
+    """returns json lines of profile rows"""
+    rnd = random.Random(seed)
+    pools = Pools(seed, pool_size)
+    lines = []
+    for _ in range(num_rows):
+        row = profile_row(pools, rnd, 0)
+        for card in row["credit_cards"]:
+            if rnd.random() < unique_cards:
+                card["card_number"] = str(rnd.randrange(10 ** 15, 10 ** 16))
+        lines.append(json.dumps(row, default=str))
+    return lines
+
+
+def per_million(label:str, elapsed:float, num_rows:int, baseline:float=None) -> float:
+    seconds = elapsed / num_rows * 1_000_000
+    overhead = f"  {seconds / baseline:6.1%} of baseline" if baseline else ""
+    print(f"  {label:<32s} {seconds:8.2f} s per million rows{overhead}")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="card tokenization overhead benchmark")
+    parser.add_argument("--rows", type=int, default=200_000, help="number of rows")
+    parser.add_argument("--unique-cards", type=float, default=0.2, help="fraction of never seen card numbers")
+    parser.add_argument("--pool-size", type=int, default=2000, help="repeated card numbers")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per batch")
+    parser.add_argument("--workers", type=int, default=4, help="hashing threads")
+    args = parser.parse_args()
+
+    lines = make_lines(args.rows, args.unique_cards, args.pool_size)
+    print(f"{args.rows} rows, {args.unique_cards:.0%} unique cards, batches of {args.batch_size} rows")
+
+    start = time.perf_counter()
+    for line in lines:
+        json.dumps(json.loads(line))
+    baseline = per_million("baseline (json loads + dumps)", time.perf_counter() - start, args.rows)
+
+    configs = [("no cache, 1 thread", 0, 1), (f"no cache, {args.workers} threads", 0, args.workers),
+               ("cache, 1 thread", DEFAULT_CACHE_SIZE, 1), (f"cache, {args.workers} threads", DEFAULT_CACHE_SIZE,
+                                                            args.workers)]
+    for label, cache_size, workers in configs:
+        rows = [json.loads(line) for line in lines]
+        with CardTokenizer(b"benchmark key", cache_size, workers) as tokenizer:
+            start = time.perf_counter()
+            for batch_start in range(0, len(rows), args.batch_size):
+                tokenizer.tokenize_rows(rows[batch_start:batch_start + args.batch_size])
+            per_million(label, time.perf_counter() - start, args.rows, baseline)
+            print(f"    {tokenizer.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: uid deduplication with a python set vs the Bloom filter + on-disk index of src/dedupe.py.
+
+Simulates --runs daily runs of --rows uids each. Every run repeats --dup-rate of the uids of the earlier runs (or
+of the same run). For each method, prints the uids/s of every run, the duplicates found, and the memory used
+(measured in a separate pass, since tracemalloc slows python down). For the Bloom filter, also the false positives
+(uids that needed an index lookup but were new) and the size of the state directory. The memory of the Bloom filter
+method is the filter plus the buffer of new uids, bounded by --flush-size.
+
+usage: python bench_dedupe.py [--rows 1000000] [--runs 3] [--dup-rate 0.05] [--fpr 0.001] [--max-memory-mb 64]
+                              [--flush-size 1000000]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+# the benchmarks run from the source tree: make the ch2/ep2 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from dedupe import DEFAULT_FLUSH_SIZE, UidDeduper
+
+
+def make_runs(num_rows:int, num_runs:int, dup_rate:float, seed:int=42) -> list:
+    """returns the uids of each run; duplicates are picked from all the uids generated so far"""
+    rnd = random.Random(seed)
+    seen, runs = [], []
+    for _ in range(num_runs):
+        uids = []
+        for _ in range(num_rows):
+            if seen and rnd.random() < dup_rate:
+                uids.append(rnd.choice(seen))
+            else:
+                uid = f"{rnd.getrandbits(128):032x}"
+                seen.append(uid)
+                uids.append(uid)
+        runs.append(uids)
+    return runs
+
+
+def directory_mb(directory:str) -> float:
+    return sum(entry.stat().st_size for entry in os.scandir(directory)) / 1024 / 1024
+
+
+def traced_peak(func) -> float:
+    """returns the peak MB allocated by func (tracemalloc slows python down: not used for timings)"""
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def set_runs(runs:list, report:bool=False) -> None:
+    seen = set()
+    for run_num, uids in enumerate(runs):
+        start = time.perf_counter()
+        duplicates = 0
+        for uid in uids:
+            if uid in seen:
+                duplicates += 1
+            else:
+                seen.add(uid)
+        elapsed = time.perf_counter() - start
+        if report:
+            print(f"  run {run_num}: {len(uids) / elapsed:12,.0f} uids/s  {duplicates:8d} duplicates")
+
+
+def deduper_runs(runs:list, state_dir:str, capacity:int, args, report:bool=False) -> UidDeduper:
+    for run_num, uids in enumerate(runs):
+        start = time.perf_counter()
+        # a new process every run: the state is loaded from the directory
+        deduper = UidDeduper(state_dir, capacity, args.fpr, args.max_memory_mb, args.flush_size)
+        duplicates = sum(deduper.check_and_add(uid) for uid in uids)
+        deduper.flush()
+        elapsed = time.perf_counter() - start
+        if report:
+            print(f"  run {run_num}: {len(uids) / elapsed:12,.0f} uids/s  {duplicates:8d} duplicates  "
+                  f"false positives {deduper.false_positives:6d}  index lookups {deduper.index.lookups:8d}  "
+                  f"state {directory_mb(state_dir):8.1f} MB")
+    return deduper
+
+
+def main():
+    parser = argparse.ArgumentParser(description="uid dedupe benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="uids per run")
+    parser.add_argument("--runs", type=int, default=3, help="number of runs")
+    parser.add_argument("--dup-rate", type=float, default=0.05, help="fraction of duplicate uids")
+    parser.add_argument("--fpr", type=float, default=0.001, help="Bloom filter false positive rate")
+    parser.add_argument("--max-memory-mb", type=float, default=None, help="Bloom filter memory budget")
+    parser.add_argument("--flush-size", type=int, default=DEFAULT_FLUSH_SIZE, help="new uids buffered in memory")
+    args = parser.parse_args()
+
+    runs = make_runs(args.rows, args.runs, args.dup_rate)
+    capacity = args.rows * args.runs
+    state_dir = tempfile.mkdtemp(prefix="dedupe_")
+    try:
+        print(f"{args.runs} runs of {args.rows} uids, {args.dup_rate:.0%} duplicates")
+        print(f"python set (kept in memory between runs), memory {traced_peak(lambda: set_runs(runs)):.1f} MB:")
+        set_runs(runs, report=True)
+
+        print(f"Bloom filter + index (capacity {capacity}, fpr {args.fpr}), peak memory per run "
+              f"{traced_peak(lambda: deduper_runs(runs[:1], state_dir, capacity, args)):.1f} MB:")
+        shutil.rmtree(state_dir)
+        deduper = deduper_runs(runs, state_dir, capacity, args, report=True)
+        print(f"  {deduper.summary()}")
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: one OK file vs Hive-style partitions (src/partitioned_writer.py).
+
+Generates --rows profile rows (src/generate_data.py) with their address parsed like `process_profiles.py` does,
+then measures:
+
+    - writing them into one file, and into partitions (--partition-by) with several open file limits: the fewer
+      open files, the more often a partition file is closed and reopened
+    - reading the rows of one state (--state): scanning the whole file vs reading the matching partitions only
+
+usage: python bench_partitioned_writer.py [--rows 200000] [--partition-by state,zip:3] [--state CA]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+# the benchmarks run from the source tree: make the ch2/ep2 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from generate_data import Pools, profile_row
+from process_profiles import transform_address
+from partitioned_writer import PartitionedWriter, read_partitions
+
+
+def make_rows(num_rows:int, seed:int=42) -> list:
+    rnd = random.Random(seed)
+    pools = Pools(seed)
+    rows = []
+    for _ in range(num_rows):
+        row = profile_row(pools, rnd, 0)
+        transform_address(row)
+        rows.append(json.loads(json.dumps(row, default=str)))
+    return rows
+
+
+def measure(label:str, func) -> float:
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<36s} {elapsed:8.3f} s  {result}")
+    return elapsed
+
+
+def write_file(rows:list, file_name:str) -> str:
+    with open(file_name, "w", encoding="utf-8") as ok_file:
+        for row in rows:
+            ok_file.write(json.dumps(row) + "\n")
+    return f"{os.path.getsize(file_name) / 1024 / 1024:.1f} MB"
+
+
+def write_partitions(rows:list, directory:str, partition_by:str, max_open_files:int) -> str:
+    with PartitionedWriter(directory, partition_by, max_open_files, overwrite=True) as writer:
+        for row in rows:
+            writer.write(row)
+    return f"{len(writer.partitions)} partitions, {writer.files_opened} file opens"
+
+
+def scan_file(file_name:str, state:str) -> str:
+    with open(file_name, "r", encoding="utf-8") as ok_file:
+        matches = sum(1 for line in ok_file if json.loads(line)["state"] == state)
+    return f"{matches} rows"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="partitioned writer benchmark")
+    parser.add_argument("--rows", type=int, default=200_000, help="number of rows")
+    parser.add_argument("--partition-by", default="state,zip:3", help="partition specs")
+    parser.add_argument("--state", default="CA", help="state to read")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    work_dir = tempfile.mkdtemp(prefix="partitions_")
+    try:
+        file_name = os.path.join(work_dir, "profiles_ok.json")
+        directory = os.path.join(work_dir, "profiles_ok")
+        print(f"write {args.rows} rows:")
+        measure("one file", lambda: write_file(rows, file_name))
+        for max_open_files in (1024, 64, 8):
+            measure(f"partitions, {max_open_files} open files",
+                    lambda: write_partitions(rows, directory, args.partition_by, max_open_files))
+
+        print(f"read the rows of state={args.state}:")
+        scan = measure("scan one file", lambda: scan_file(file_name, args.state))
+        pruned = measure("read matching partitions",
+                         lambda: f"{sum(1 for _ in read_partitions(directory, state=args.state))} rows")
+        print(f"  speedup {scan / pruned:.0f}x")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: profiling a JSON rows file with pandas vs the streaming profiler of src/profile_data.py.
+
+Generates --rows profile rows (src/generate_data.py), then in a new process for each method measures the time and the
+peak memory (max RSS) of:
+
+    - pandas: `read_json(lines=True)`, then the null rate and exact distinct count of every column
+    - streaming: `profile_files()` with --workers processes (the max RSS of the main process and of one worker)
+
+and compares the approximate distinct counts of the profiler with the exact ones.
+
+usage: python bench_profile_data.py [--rows 200000] [--workers 2]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+# the benchmarks run from the source tree: make the ch2/ep2 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+import generate_data
+from profile_data import profile_files
+
+
+def max_rss_mb(who:int=resource.RUSAGE_SELF) -> float:
+    # kilobytes on linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def pandas_profile(file_name:str, queue) -> None:
+    import pandas as pd
+    start = time.perf_counter()
+    frame = pd.read_json(file_name, lines=True, dtype=False)
+    # lists can't be hashed: count them as strings
+    distinct = {column: int(frame[column].astype(str).where(frame[column].notna()).nunique())
+                for column in frame.columns}
+    frame.isna().mean()
+    queue.put((time.perf_counter() - start, max_rss_mb(), distinct))
+
+
+def streaming_profile(file_name:str, workers:int, queue) -> None:
+    start = time.perf_counter()
+    summary = profile_files([file_name], workers).summary()
+    rss = max(max_rss_mb(), max_rss_mb(resource.RUSAGE_CHILDREN))
+    distinct = {name: stats.get("distinct") for name, stats in summary["fields"].items()}
+    queue.put((time.perf_counter() - start, rss, distinct))
+
+
+def measure(label:str, target, *args) -> dict:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=target, args=(*args, queue))
+    process.start()
+    elapsed, rss, distinct = queue.get()
+    process.join()
+    print(f"  {label:<24s} {elapsed:8.2f} s  max RSS {rss:8.1f} MB")
+    return distinct
+
+
+def main():
+    parser = argparse.ArgumentParser(description="data profiler benchmark")
+    parser.add_argument("--rows", type=int, default=200_000, help="number of rows")
+    parser.add_argument("--workers", type=int, default=2, help="profiler worker processes")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="profile_")
+    try:
+        generate_data.run("profiles", os.path.join(work_dir, "profiles"), args.rows, num_shards=1, workers=1,
+                          compression="none")
+        file_name = os.path.join(work_dir, os.listdir(work_dir)[0])
+        print(f"profile {args.rows} rows ({os.path.getsize(file_name) / 1024 / 1024:.1f} MB):")
+        exact = measure("pandas", pandas_profile, file_name)
+        approximate = measure(f"streaming, {args.workers} workers", streaming_profile, file_name, args.workers)
+        print("distinct values (exact / approximate):")
+        for column, count in exact.items():
+            estimate = approximate.get(column)
+            if estimate is not None and count:
+                print(f"  {column:<16s} {count:10d} {estimate:10d}  {(estimate - count) / count:+7.2%}")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
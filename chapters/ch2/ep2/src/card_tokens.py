@@ -0,0 +1,182 @@
+"""
+Tokenization of the credit card numbers of profile rows.
+
+The OK and reject files of `process_profiles.py` shouldn't contain raw card numbers. `CardTokenizer` replaces each
+`card_number` with a token, the keyed HMAC-SHA256 of the number (see the hashing section of the security chapter,
+`chapters/ch2/ep4/README.MD`), and drops the `cvc`:
+
+    - the same card number always gets the same token with the same key, so tokens can still be joined and counted
+    - without the key, a token can't be reversed by hashing every possible card number (a plain SHA-256 can)
+
+The key is read from the CARD_TOKEN_KEY environment variable. Without it, a random key has to be asked for explicitly
+(`--random-key`): the tokens of a random key can't be joined with the tokens of another run.
+
+Rows are tokenized in batches: the card numbers of a batch are deduplicated, the ones missing from an LRU cache of
+recent tokens are hashed (split across a thread pool when `workers` > 1), and the rows are updated. Note that hashlib
+only releases the GIL for buffers of more than 2 KB: 16 digit card numbers are hashed one at a time whatever the
+number of threads, so the default is to hash them in the calling thread.
+
+usage: CARD_TOKEN_KEY=secret python card_tokens.py card_number [card_number ...] [--random-key]     (prints the tokens)
+"""
+
+# imports
+import os
+import hmac
+import logging
+import secrets
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+TOKEN_KEY_ENV = "CARD_TOKEN_KEY"
+TOKEN_PREFIX = "tok_"
+DEFAULT_CACHE_SIZE = 100_000
+DEFAULT_BATCH_SIZE = 10_000
+# card numbers hashed per thread pool task
+CHUNK_SIZE = 2_000
+
+
+def token_key(random_key:bool=False) -> bytes:
+    """
+    Returns the tokenization key from the CARD_TOKEN_KEY environment variable.
+
+    Args:
+        random_key (bool, optional): if CARD_TOKEN_KEY isn't set, generate a random key: the tokens are still safe,
+                                     but they change from one run to the next. Defaults to False.
+
+    Raises:
+        ValueError: CARD_TOKEN_KEY isn't set and random_key is False
+
+    Returns:
+        bytes: HMAC key
+    """
+    key = os.environ.get(TOKEN_KEY_ENV)
+    if key:
+        return key.encode("utf-8")
+    if not random_key:
+        raise ValueError(f"{TOKEN_KEY_ENV} is not set: set it to get the same card tokens in every run, "
+                         f"or use --random-key")
+    logger.warning("%s is not set, using a random key: card tokens can't be joined across runs", TOKEN_KEY_ENV)
+    return secrets.token_bytes(32)
+
+
+class CardTokenizer:
+    """
+    Replaces card numbers with HMAC-SHA256 tokens, with an LRU cache of recent tokens. See the module docs.
+    """
+
+    def __init__(self, key:bytes, cache_size:int=DEFAULT_CACHE_SIZE, workers:int=1):
+        """
+        Args:
+            key (bytes): HMAC key
+            cache_size (int, optional): number of recent tokens cached. Defaults to DEFAULT_CACHE_SIZE.
+            workers (int, optional): hashing threads. Defaults to 1: hash in the calling thread.
+        """
+        self.key = key
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(workers) if workers > 1 else None
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        if self.pool:
+            self.pool.shutdown()
+
+    def _hash(self, card_numbers:list) -> list:
+        key = self.key
+        return [TOKEN_PREFIX + hmac.digest(key, number.encode("utf-8"), "sha256").hex() for number in card_numbers]
+
+    def tokens(self, card_numbers) -> dict:
+        """
+        Tokenizes card numbers.
+
+        Args:
+            card_numbers (iterable): card numbers (str)
+
+        Returns:
+            dict: the token of each card number
+        """
+        cache = self.cache
+        tokens, missing = {}, []
+        for number in card_numbers:
+            if number in tokens:
+                # repeated in this batch
+                self.hits += 1
+                continue
+            token = cache.get(number)
+            if token is None:
+                missing.append(number)
+                tokens[number] = None
+            else:
+                cache.move_to_end(number)
+                tokens[number] = token
+                self.hits += 1
+        if missing:
+            self.misses += len(missing)
+            if self.pool and len(missing) > CHUNK_SIZE:
+                chunks = [missing[start:start + CHUNK_SIZE] for start in range(0, len(missing), CHUNK_SIZE)]
+                hashed = [token for chunk in self.pool.map(self._hash, chunks) for token in chunk]
+            else:
+                hashed = self._hash(missing)
+            for number, token in zip(missing, hashed):
+                tokens[number] = token
+                cache[number] = token
+            # evict the least recently used tokens
+            for _ in range(len(cache) - self.cache_size):
+                cache.popitem(last=False)
+        return tokens
+
+    def tokenize_rows(self, rows:list) -> None:
+        """
+        Replaces the `card_number` of the `credit_cards` of rows with its token and drops the `cvc`. Rows without
+        credit cards, or with malformed ones (rejected rows), are tokenized as far as possible.
+
+        Args:
+            rows (list): data rows, updated in place
+        """
+        cards = [card for row in rows if isinstance(row, dict) and isinstance(row.get("credit_cards"), list)
+                 for card in row["credit_cards"] if isinstance(card, dict)]
+        numbers = [str(card["card_number"]) for card in cards if card.get("card_number") is not None]
+        tokens = self.tokens(numbers)
+        for card in cards:
+            card.pop("cvc", None)
+            if card.get("card_number") is not None:
+                card["card_number"] = tokens[str(card["card_number"])]
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return f"{lookups} card numbers tokenized, {self.misses} hashed, cache hit rate {hit_rate:.1%}"
+
+
+def main():
+    """
+    Prints the tokens of the card numbers given on the command line.
+    """
+    parser = argparse.ArgumentParser(description=f"Print the tokens of card numbers, with the {TOKEN_KEY_ENV} key")
+    parser.add_argument("card_numbers", nargs="+", help="card numbers")
+    parser.add_argument("--random-key", action="store_true", help=f"use a random key if {TOKEN_KEY_ENV} is not set")
+    args = parser.parse_args()
+    try:
+        key = token_key(args.random_key)
+    except ValueError as err:
+        parser.error(str(err))
+    tokenizer = CardTokenizer(key)
+    for number, token in tokenizer.tokens(args.card_numbers).items():
+        print(f"{number}: {token}")
+
+
+# call our main function to parse command line args
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+Bounded memory deduplication of uids, within a file and across daily runs.
+
+Keeping every uid ever seen in a python set doesn't fit in memory at scale. `UidDeduper` keeps its state in a
+directory instead:
+
+    - a Bloom filter (`bloom.bin`): a bit array sized for the expected number of uids and the target false positive
+      rate. Every uid sets `num_hashes` bits. A uid with a clear bit was never seen: this is the answer for almost
+      every new uid, without touching the disk.
+    - a hashed, sorted uid index (`uids-NNN.bin`): the 16 byte hash of every uid, split into buckets by hash and
+      sorted within each bucket. When the Bloom filter says "maybe seen", the index confirms it with a binary search
+      of one bucket file, so false positives are never rejected. New uids are buffered in memory and merged into the
+      bucket files when the buffer is full and at the end of the run.
+
+Memory use is the Bloom filter (about 1.2 bytes per uid for a 1% false positive rate) plus the new uid buffer.
+
+usage: python dedupe.py state_dir     (prints the state of a dedupe directory)
+"""
+
+# imports
+import os
+import sys
+import json
+import math
+import mmap
+import hashlib
+
+import numpy as np
+
+
+DEFAULT_CAPACITY = 10_000_000
+DEFAULT_FPR = 0.001
+DEFAULT_NUM_BUCKETS = 256
+# new uids buffered in memory before they are merged into the index files
+DEFAULT_FLUSH_SIZE = 1_000_000
+
+DIGEST_SIZE = 16
+STATE_FILE = "dedupe.json"
+BLOOM_FILE = "bloom.bin"
+
+
+def uid_digest(uid:str) -> bytes:
+    """
+    Returns the 16 byte hash of a uid.
+
+    Raises:
+        TypeError: the uid isn't a string (a numeric uid would need a canonical text form to dedupe reliably)
+    """
+    if not isinstance(uid, str):
+        raise TypeError(f"uid must be a str, not {type(uid).__name__}: {uid!r}")
+    return hashlib.blake2b(uid.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+
+def _replace(path:str, data) -> None:
+    """writes a file atomically: a partially written file never replaces the previous one"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, path)
+
+
+class BloomFilter:
+    """
+    Bit array Bloom filter. The bit positions of a key are derived from its 16 byte hash (double hashing).
+    """
+
+    def __init__(self, num_bits:int, num_hashes:int, bits:bytearray=None):
+        """
+        Args:
+            num_bits (int): size of the bit array
+            num_hashes (int): bits set per key
+            bits (bytearray, optional): existing bits. Defaults to all clear.
+        """
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity:int, fpr:float, max_bytes:int=None) -> "BloomFilter":
+        """
+        Creates a filter sized for `capacity` keys at a false positive rate of `fpr`.
+
+        Args:
+            capacity (int): expected number of keys
+            fpr (float): target false positive rate (for example 0.001)
+            max_bytes (int, optional): memory budget; the filter is made smaller (with a higher false positive
+                                       rate) if it doesn't fit. Defaults to no limit.
+
+        Returns:
+            BloomFilter: empty filter
+        """
+        if not 0 < fpr < 1:
+            raise ValueError(f"Invalid false positive rate: {fpr}")
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(fpr) / math.log(2) ** 2)
+        if max_bytes:
+            num_bits = min(num_bits, max_bytes * 8)
+        num_hashes = max(round(num_bits / capacity * math.log(2)), 1)
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, digest:bytes):
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:16], "little") | 1
+        return [(first + i * step) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, digest:bytes) -> bool:
+        """
+        Adds a key hash.
+
+        Returns:
+            bool: True if all the bits were already set (the key was maybe added before)
+        """
+        bits = self.bits
+        seen = True
+        for position in self._positions(digest):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                seen = False
+                bits[byte] |= mask
+        return seen
+
+    def __contains__(self, digest:bytes) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def false_positive_rate(self, count:int) -> float:
+        """returns the expected false positive rate after adding `count` keys"""
+        return (1 - math.exp(-self.num_hashes * count / self.num_bits)) ** self.num_hashes
+
+    def save(self, path:str) -> None:
+        _replace(path, self.bits)
+
+    @classmethod
+    def load(cls, path:str, num_bits:int, num_hashes:int) -> "BloomFilter":
+        with open(path, "rb") as bloom_file:
+            bits = bytearray(bloom_file.read())
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError(f"Bloom filter file {path} doesn't match its size of {num_bits} bits")
+        return cls(num_bits, num_hashes, bits)
+
+
+class UidIndex:
+    """
+    On-disk index of uid hashes: one file of sorted 16 byte hashes per bucket, plus a buffer of new hashes.
+    """
+
+    def __init__(self, directory:str, num_buckets:int=DEFAULT_NUM_BUCKETS):
+        """
+        Args:
+            directory (str): index directory
+            num_buckets (int, optional): number of bucket files. Defaults to DEFAULT_NUM_BUCKETS.
+        """
+        self.directory = directory
+        self.num_buckets = num_buckets
+        self.pending = {}
+        self.num_pending = 0
+        self.lookups = 0
+
+    def _bucket(self, digest:bytes) -> int:
+        return int.from_bytes(digest[-4:], "little") % self.num_buckets
+
+    def bucket_file(self, bucket:int) -> str:
+        return os.path.join(self.directory, f"uids-{bucket:03d}.bin")
+
+    def _search_file(self, bucket:int, digest:bytes) -> bool:
+        """binary search of the sorted hashes of a bucket file"""
+        path = self.bucket_file(bucket)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return False
+        with open(path, "rb") as bucket_file, \
+                mmap.mmap(bucket_file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+            low, high = 0, len(records) // DIGEST_SIZE
+            while low < high:
+                middle = (low + high) // 2
+                record = records[middle * DIGEST_SIZE:(middle + 1) * DIGEST_SIZE]
+                if record < digest:
+                    low = middle + 1
+                elif record > digest:
+                    high = middle
+                else:
+                    return True
+        return False
+
+    def __contains__(self, digest:bytes) -> bool:
+        self.lookups += 1
+        bucket = self._bucket(digest)
+        return digest in self.pending.get(bucket, ()) or self._search_file(bucket, digest)
+
+    def add(self, digest:bytes) -> None:
+        """adds a hash (buffered until `flush()`); it must not be in the index already"""
+        self.pending.setdefault(self._bucket(digest), set()).add(digest)
+        self.num_pending += 1
+
+    def flush(self) -> None:
+        """merges the buffered hashes into the bucket files"""
+        os.makedirs(self.directory, exist_ok=True)
+        for bucket, digests in self.pending.items():
+            path = self.bucket_file(bucket)
+            existing = b""
+            if os.path.exists(path):
+                with open(path, "rb") as bucket_file:
+                    existing = bucket_file.read()
+            # fixed width byte strings sort like the raw bytes
+            records = np.concatenate([np.frombuffer(existing, dtype=f"S{DIGEST_SIZE}"),
+                                      np.array(sorted(digests), dtype=f"S{DIGEST_SIZE}")])
+            records.sort(kind="stable")
+            _replace(path, records.tobytes())
+        self.pending = {}
+        self.num_pending = 0
+
+
+class UidDeduper:
+    """
+    Detects duplicate uids with a persisted Bloom filter and uid index. See the module docs.
+    """
+
+    def __init__(self, directory:str, capacity:int=DEFAULT_CAPACITY, fpr:float=DEFAULT_FPR, max_memory_mb:float=None,
+                 flush_size:int=DEFAULT_FLUSH_SIZE):
+        """
+        Opens (or creates) the dedupe state in a directory. The Bloom filter size is fixed when the directory is
+        created: `capacity`, `fpr` and `max_memory_mb` are ignored for an existing directory.
+
+        Args:
+            directory (str): state directory
+            capacity (int, optional): expected number of uids over all the runs. Defaults to DEFAULT_CAPACITY.
+            fpr (float, optional): target Bloom filter false positive rate. Defaults to DEFAULT_FPR.
+            max_memory_mb (float, optional): Bloom filter memory budget in MB. Defaults to no limit.
+            flush_size (int, optional): new uids buffered in memory. Defaults to DEFAULT_FLUSH_SIZE.
+        """
+        self.directory = directory
+        state_path = os.path.join(directory, STATE_FILE)
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as state_file:
+                self.state = json.load(state_file)
+            self.bloom = BloomFilter.load(os.path.join(directory, BLOOM_FILE), self.state["num_bits"],
+                                          self.state["num_hashes"])
+        else:
+            max_bytes = int(max_memory_mb * 1024 * 1024) if max_memory_mb else None
+            self.bloom = BloomFilter.for_capacity(capacity, fpr, max_bytes)
+            self.state = {"capacity": capacity, "fpr": fpr, "num_bits": self.bloom.num_bits,
+                          "num_hashes": self.bloom.num_hashes, "num_buckets": DEFAULT_NUM_BUCKETS, "count": 0}
+        self.index = UidIndex(directory, self.state["num_buckets"])
+        self.flush_size = flush_size
+        self.duplicates = 0
+        self.false_positives = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    @property
+    def count(self) -> int:
+        """number of unique uids seen"""
+        return self.state["count"]
+
+    def check_and_add(self, uid:str) -> bool:
+        """
+        Checks if a uid was seen before, and adds it if not.
+
+        Args:
+            uid (str): uid
+
+        Returns:
+            bool: True if the uid is a duplicate
+        """
+        digest = uid_digest(uid)
+        if self.bloom.add(digest):
+            # maybe seen: confirm with the index
+            if digest in self.index:
+                self.duplicates += 1
+                return True
+            self.false_positives += 1
+        self.index.add(digest)
+        self.state["count"] += 1
+        if self.index.num_pending >= self.flush_size:
+            self.flush()
+        return False
+
+    def flush(self) -> None:
+        """
+        Writes the Bloom filter, the new uids, and the state, in that order. The Bloom filter is saved before the
+        index, so it never misses a uid of the index: a crash in between only leaves it with extra bits (a few
+        more false positives), never a duplicate uid reported as new.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.bloom.save(os.path.join(self.directory, BLOOM_FILE))
+        self.index.flush()
+        _replace(os.path.join(self.directory, STATE_FILE), json.dumps(self.state, indent=2).encode("utf-8"))
+
+    def summary(self) -> str:
+        bloom_mb = len(self.bloom.bits) / 1024 / 1024
+        expected_fpr = self.bloom.false_positive_rate(self.count)
+        text = (f"{self.count} unique uids, Bloom filter {bloom_mb:.1f} MB ({self.bloom.num_hashes} hashes, "
+                f"expected false positive rate {expected_fpr:.4%})")
+        if self.count > self.state["capacity"]:
+            text += f". Warning: over the capacity of {self.state['capacity']} uids"
+        return text
+
+
+def main():
+    """
+    Prints the state of a dedupe directory.
+    """
+    args = sys.argv
+    if len(args) != 2 or not os.path.exists(os.path.join(args[1], STATE_FILE)):
+        print("usage: python3 dedupe.py state_dir")
+        sys.exit(1)
+    deduper = UidDeduper(args[1])
+    print(deduper.summary())
+
+
+# call our main function to parse command line args
+if __name__ == '__main__':
+    main()
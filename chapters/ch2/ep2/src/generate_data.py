@@ -0,0 +1,347 @@
+"""
+Generate large synthetic profiles and vehicles files for load testing the ETL.
+
+The notebook generator (`misc/data_generator.ipynb`) calls Faker for every field of every row in a single loop: a
+few thousand rows/s. This script generates the same JSON rows (`profiles_complex.json`, `vehicles_complex.json`)
+much faster:
+
+    - Faker is only used to fill pools of values (names, addresses, credit cards, vehicles, ...) once per shard.
+      Rows are composed by picking values from the pools with a seeded random generator.
+    - the rows are split into shards that a pool of worker processes generate in parallel. Every shard has its own
+      seed, derived from --seed and the shard number: the same --rows, --shards and --seed always write the same
+      files, whatever the number of workers. The default number of shards only depends on --rows (one shard per
+      DEFAULT_SHARD_ROWS rows).
+    - every shard is streamed as JSON rows or CSV straight into a compressed file (gzip, bz2 or xz)
+    - bad addresses (addresses that `process_profiles.transform_address()` rejects) and null values are injected
+      at configurable rates, to exercise the reject paths of the ETL
+
+The shard files are named `{output_prefix}-{shard:05d}.json.gz` (or .csv, .bz2, .xz). The rows/s of each shard
+and of each worker process are printed.
+
+usage: python generate_data.py profiles ../data/profiles_big --rows 1000000 [--shards 16] [--workers 4]
+       [--seed 42] [--format json|csv] [--compression gzip|bz2|xz|none] [--bad-address-rate 0.02] [--null-rate 0.02]
+"""
+
+# imports
+import os
+import bz2
+import csv
+import io
+import gzip
+import json
+import lzma
+import time
+import random
+import string
+import argparse
+from datetime import date, timedelta
+from multiprocessing import Pool
+
+from faker import Faker
+from faker_vehicle import VehicleProvider
+
+from process_profiles import transform_address
+
+
+LOCALE = ["en-US"]
+DEFAULT_POOL_SIZE = 2000
+# the dates are relative to a fixed day, so the same seed always generates the same rows
+TODAY = date(2022, 6, 1)
+# rows per write
+WRITE_BATCH = 5000
+# rows per shard file when the number of shards isn't given; not derived from the number of workers, so that the
+# same command writes the same files on any machine
+DEFAULT_SHARD_ROWS = 100_000
+
+# shortuuid alphabet (no look-alike characters), like the uids of the notebook. A 128 bit uid is 22 characters, or
+# 11 pairs of characters.
+UID_ALPHABET = "23456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+UID_PAIRS = [first + second for first in UID_ALPHABET for second in UID_ALPHABET]
+
+
+def open_gzip(path:str):
+    # fast compression level; mtime=0 keeps the same rows in the same file bytes
+    return io.TextIOWrapper(gzip.GzipFile(path, "wb", compresslevel=1, mtime=0), encoding="utf-8", newline="")
+
+
+COMPRESSIONS = {
+    "gzip": (".gz", open_gzip),
+    "bz2": (".bz2", lambda path: bz2.open(path, "wt", encoding="utf-8", newline="")),
+    "xz": (".xz", lambda path: lzma.open(path, "wt", encoding="utf-8", newline="", preset=1)),
+    "none": ("", lambda path: open(path, "w", encoding="utf-8", newline="")),
+}
+
+
+def is_valid_address(address:str) -> bool:
+    """returns True if the ETL can parse the address (see `process_profiles.transform_address()`)"""
+    try:
+        return transform_address({"address": address})
+    except ValueError:
+        return False
+
+
+def bad_address(address:str, rnd:random.Random) -> str:
+    """returns a broken copy of a valid address"""
+    street, _, city_line = address.partition("\n")
+    city, _, state_zip = city_line.rpartition(", ")
+    state, _, zip_code = state_zip.partition(" ")
+    return rnd.choice([
+        # missing the second line (like the notebook's vehicles)
+        street,
+        # on one line
+        f"{street}, {city_line}",
+        # lowercase state and a short zip code
+        f"{street}\n{city}, {state.lower()} {zip_code[:4]}",
+    ])
+
+
+class Pools:
+    """
+    Lists of Faker values used to compose the rows of a shard.
+    """
+
+    def __init__(self, seed:int, size:int=DEFAULT_POOL_SIZE, vehicles:bool=False):
+        """
+        Args:
+            seed (int): Faker seed
+            size (int, optional): number of values per pool. Defaults to DEFAULT_POOL_SIZE.
+            vehicles (bool, optional): add the vehicle pools. Defaults to False.
+        """
+        fake = Faker(locale=LOCALE)
+        fake.seed_instance(seed)
+        rnd = random.Random(seed)
+        self.male_names = [fake.name_male() for _ in range(size)]
+        self.female_names = [fake.name_female() for _ in range(size)]
+        self.names = self.male_names + self.female_names
+        addresses = [fake.address() for _ in range(size)]
+        self.addresses = [address for address in addresses if is_valid_address(address)]
+        # Faker's military addresses (APO, FPO, DPO) don't parse either
+        self.bad_addresses = [address for address in addresses if not is_valid_address(address)]
+        self.bad_addresses += [bad_address(address, rnd) for address in self.addresses[:size // 2]]
+        self.geo_locations = [list(fake.local_latlng(country_code="US")[:2]) for _ in range(size)]
+        self.cards = [(fake.credit_card_provider(), fake.credit_card_number()) for _ in range(size)]
+        if vehicles:
+            fake.add_provider(VehicleProvider)
+            self.vehicles = [fake.vehicle_object() for _ in range(size)]
+            self.colors = [fake.safe_color_name() for _ in range(size)]
+
+    def address(self, rnd:random.Random, bad_rate:float) -> str:
+        return rnd.choice(self.bad_addresses if rnd.random() < bad_rate else self.addresses)
+
+
+def random_uid(rnd:random.Random) -> str:
+    number = rnd.getrandbits(128)
+    pairs = []
+    for _ in range(11):
+        number, pair = divmod(number, len(UID_PAIRS))
+        pairs.append(UID_PAIRS[pair])
+    return "".join(pairs)
+
+
+def random_date(rnd:random.Random, first:date, last:date) -> date:
+    return date.fromordinal(rnd.randint(first.toordinal(), last.toordinal()))
+
+
+def add_cent_to_dollar(rnd:random.Random, dollar_value:int) -> float:
+    return float(f"{dollar_value}.{rnd.randint(0, 99):02d}")
+
+
+def profile_row(pools:Pools, rnd:random.Random, bad_address_rate:float) -> dict:
+    """composes a profile row (like the notebook's ComplexPersonGenerator)"""
+    gender = rnd.choice(("M", "F"))
+    name = rnd.choice(pools.male_names if gender == "M" else pools.female_names)
+    return {
+        "uid": random_uid(rnd),
+        "name": name,
+        "gender": gender,
+        "email": name.lower().replace(" ", ".") + "@gmail.com",
+        "birthdate": random_date(rnd, TODAY - timedelta(days=365 * 115), TODAY).isoformat(),
+        "address": pools.address(rnd, bad_address_rate),
+        "geo_location": rnd.choice(pools.geo_locations),
+        "credit_cards": [
+            {"card_type": card_type, "card_number": card_number,
+             "exp_date": f"{rnd.randint(1, 12):02d}/{(TODAY.year + rnd.randint(0, 9)) % 100:02d}",
+             "cvc": f"{rnd.randint(0, 999):03d}"}
+            for card_type, card_number in rnd.choices(pools.cards, k=rnd.choice((1, 1, 1, 2)))
+        ],
+    }
+
+
+def vehicle_row(pools:Pools, rnd:random.Random, bad_address_rate:float) -> dict:
+    """composes a vehicle row with its sales records (like the notebook's ComplexVehicleRegistrationGenerator)"""
+    vehicle = rnd.choice(pools.vehicles)
+    row = {
+        "license_plate": "".join(rnd.choices(string.ascii_uppercase, k=3)) + "-" + f"{rnd.randint(0, 9999):04d}",
+        "make_model": vehicle["Make"] + ", " + vehicle["Model"],
+        "year": vehicle["Year"],
+        "color": rnd.choice(pools.colors),
+        "registered_date": random_date(rnd, TODAY - timedelta(days=365 * 5), TODAY).isoformat(),
+        "registered_name": rnd.choice(pools.names),
+        "registered_address": pools.address(rnd, bad_address_rate),
+        "sales_record": [],
+    }
+    price = add_cent_to_dollar(rnd, rnd.randint(10000, 40000))
+    last_date = random_date(rnd, TODAY - timedelta(days=365 * 3), TODAY)
+    last_name = row["registered_name"]
+    for i in range(rnd.randint(0, 3)):
+        previous_owner = rnd.choice(pools.names)
+        price += round(i * add_cent_to_dollar(rnd, rnd.randint(1000, 3000)), 2)
+        last_date -= timedelta(rnd.randint(100, 356 * 4))
+        row["sales_record"].append({"new_owner": last_name, "previous_owner": previous_owner,
+                                    "sale_price": price, "sale_date": last_date.isoformat()})
+        last_name = previous_owner
+    return row
+
+
+# dataset: (row function, fields (the CSV header), fields that get null values)
+DATASETS = {
+    "profiles": (profile_row, ["uid", "name", "gender", "email", "birthdate", "address", "geo_location",
+                               "credit_cards"], ["uid", "name", "email", "birthdate"]),
+    "vehicles": (vehicle_row, ["license_plate", "make_model", "year", "color", "registered_date",
+                               "registered_name", "registered_address", "sales_record"],
+                 ["license_plate", "color", "registered_name"]),
+}
+
+
+def shard_seed(seed:int, shard:int) -> int:
+    """returns the seed of a shard; it only depends on the run seed and the shard number"""
+    return random.Random(f"{seed}:{shard}").getrandbits(64)
+
+
+def shard_file_name(output_prefix:str, shard:int, output_format:str, compression:str) -> str:
+    return f"{output_prefix}-{shard:05d}.{output_format}{COMPRESSIONS[compression][0]}"
+
+
+def generate_shard(task:dict) -> dict:
+    """
+    Generates the rows of a shard into its compressed file.
+
+    Args:
+        task (dict): dataset, file_name, rows, seed, output_format, compression, bad_address_rate, null_rate,
+                     pool_size
+
+    Returns:
+        dict: shard stats: file_name, rows, bytes, seconds, and the worker's pid
+    """
+    start = time.perf_counter()
+    make_row, fields, nullable = DATASETS[task["dataset"]]
+    rnd = random.Random(task["seed"])
+    pools = Pools(task["seed"], task["pool_size"], vehicles=task["dataset"] == "vehicles")
+    bad_address_rate, null_rate = task["bad_address_rate"], task["null_rate"]
+
+    with COMPRESSIONS[task["compression"]][1](task["file_name"]) as output:
+        writer = None
+        if task["output_format"] == "csv":
+            writer = csv.writer(output)
+            writer.writerow(fields)
+        remaining = task["rows"]
+        while remaining > 0:
+            batch = []
+            for _ in range(min(WRITE_BATCH, remaining)):
+                row = make_row(pools, rnd, bad_address_rate)
+                if rnd.random() < null_rate:
+                    row[rnd.choice(nullable)] = None
+                batch.append(row)
+            if writer:
+                # nested fields are written as JSON strings
+                writer.writerows([[json.dumps(value) if isinstance(value, list) else value
+                                   for value in (row[field] for field in fields)] for row in batch])
+            else:
+                output.write("".join(json.dumps(row) + "\n" for row in batch))
+            remaining -= len(batch)
+
+    return {"file_name": task["file_name"], "rows": task["rows"], "bytes": os.path.getsize(task["file_name"]),
+            "seconds": time.perf_counter() - start, "pid": os.getpid()}
+
+
+def run(dataset:str, output_prefix:str, num_rows:int, num_shards:int=None, workers:int=None, seed:int=42,
+        output_format:str="json", compression:str="gzip", bad_address_rate:float=0.02, null_rate:float=0.02,
+        pool_size:int=DEFAULT_POOL_SIZE) -> list:
+    """
+    Generates `num_rows` rows of a dataset into compressed shard files.
+
+    Args:
+        dataset (str): profiles or vehicles
+        output_prefix (str): path prefix of the shard files
+        num_rows (int): total number of rows
+        num_shards (int, optional): number of shard files. Defaults to one per DEFAULT_SHARD_ROWS rows.
+        workers (int, optional): number of worker processes. Defaults to the number of CPUs.
+        seed (int, optional): run seed. Defaults to 42.
+        output_format (str, optional): json (JSON rows) or csv. Defaults to "json".
+        compression (str, optional): gzip, bz2, xz or none. Defaults to "gzip".
+        bad_address_rate (float, optional): fraction of rows with a bad address. Defaults to 0.02.
+        null_rate (float, optional): fraction of rows with a null value. Defaults to 0.02.
+        pool_size (int, optional): Faker values per pool. Defaults to DEFAULT_POOL_SIZE.
+
+    Returns:
+        list: stats of each shard (see `generate_shard()`)
+    """
+    workers = workers or os.cpu_count() or 1
+    num_shards = num_shards or max(-(-num_rows // DEFAULT_SHARD_ROWS), 1)
+    tasks = [{
+        "dataset": dataset,
+        "file_name": shard_file_name(output_prefix, shard, output_format, compression),
+        "rows": num_rows * (shard + 1) // num_shards - num_rows * shard // num_shards,
+        "seed": shard_seed(seed, shard),
+        "output_format": output_format,
+        "compression": compression,
+        "bad_address_rate": bad_address_rate,
+        "null_rate": null_rate,
+        "pool_size": pool_size,
+    } for shard in range(num_shards)]
+
+    start = time.perf_counter()
+    pool = Pool(min(workers, num_shards)) if workers > 1 and num_shards > 1 else None
+    try:
+        results = pool.imap_unordered(generate_shard, tasks) if pool else map(generate_shard, tasks)
+        shards = []
+        for shard in results:
+            print(f"  {shard['file_name']}  worker {shard['pid']}  {shard['rows']} rows  {shard['seconds']:.1f}s  "
+                  f"{shard['rows'] / shard['seconds']:,.0f} rows/s  {shard['bytes'] / 1024 / 1024:.1f} MB")
+            shards.append(shard)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - start
+
+    # rows/s of each worker process
+    per_worker = {}
+    for shard in shards:
+        rows, seconds = per_worker.get(shard["pid"], (0, 0.0))
+        per_worker[shard["pid"]] = (rows + shard["rows"], seconds + shard["seconds"])
+    for pid, (rows, seconds) in sorted(per_worker.items()):
+        print(f"Worker {pid}: {rows} rows in {seconds:.1f}s ({rows / seconds:,.0f} rows/s)")
+    total_bytes = sum(shard["bytes"] for shard in shards)
+    print(f"Wrote {num_rows} rows into {len(shards)} files ({total_bytes / 1024 / 1024:.1f} MB) in {elapsed:.1f}s "
+          f"({num_rows / elapsed:,.0f} rows/s)")
+    return shards
+
+
+def main():
+    """
+    The main execution method. Get command line args and call the `run()` method.
+    """
+    parser = argparse.ArgumentParser(description="Generate synthetic profiles and vehicles files")
+    parser.add_argument("dataset", choices=list(DATASETS))
+    parser.add_argument("output_prefix", help="path prefix of the output files, for example: ../data/profiles_big")
+    parser.add_argument("-n", "--rows", type=int, required=True, help="total number of rows")
+    parser.add_argument("--shards", type=int, default=None,
+                        help=f"number of output files (default: one per {DEFAULT_SHARD_ROWS:,} rows)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=42, help="run seed (the same seed writes the same files)")
+    parser.add_argument("-f", "--format", choices=["json", "csv"], default="json", help="output file format")
+    parser.add_argument("-c", "--compression", choices=list(COMPRESSIONS), default="gzip")
+    parser.add_argument("--bad-address-rate", type=float, default=0.02, help="fraction of rows with a bad address")
+    parser.add_argument("--null-rate", type=float, default=0.02, help="fraction of rows with a null field")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="Faker values per pool")
+    args = parser.parse_args()
+    if args.pool_size < 2:
+        parser.error("--pool-size must be at least 2")
+    run(args.dataset, args.output_prefix, args.rows, args.shards, args.workers, args.seed, args.format,
+        args.compression, args.bad_address_rate, args.null_rate, args.pool_size)
+
+
+# call our main function to parse command line args
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+Hive-style partitioned output for JSON rows.
+
+Instead of one big `_ok.json` file, `PartitionedWriter` writes the rows into one directory per partition value, named
+like Hive / Spark partitions so those tools (and `read_partitions()` below) can skip the partitions they don't need:
+
+    profiles_20220601_ok/
+        state=CA/zip3=945/part-00000.json
+        state=CA/zip3=945/part-00001.json     (a new part file every `target_file_mb`)
+        state=NY/zip3=100/part-00000.json
+        _manifest.json                         (partitions, files and row counts; written last)
+
+A partition is a list of fields (`state`) or field prefixes (`zip:3`, the first 3 digits of the zip code, in a
+`zip3=` directory). Only `max_open_files` part files are open at a time: when a new partition needs a file, the least
+recently written file is closed (and reopened in append mode if its partition comes back). Rows are buffered per
+partition and written `buffer_rows` at a time, so a file is opened once per flush of its partition rather than once
+per row when there are more partitions than open files.
+
+usage: python partitioned_writer.py output_dir [field=value ...]     (prints the partitions matching the filters)
+"""
+
+# imports
+import os
+import sys
+import json
+import shutil
+from collections import OrderedDict
+from datetime import datetime
+
+
+MANIFEST_FILE = "_manifest.json"
+DEFAULT_MAX_OPEN_FILES = 64
+DEFAULT_TARGET_FILE_MB = 128
+# rows buffered (over all the partitions) before they are written
+DEFAULT_BUFFER_ROWS = 50_000
+# Hive's directory name for null partition values
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def parse_partition_by(partition_by) -> list:
+    """
+    Parses partition specs like "state" or "zip:3" (first 3 characters of zip).
+
+    Args:
+        partition_by (list or str): partition specs, or a comma separated string of specs
+
+    Returns:
+        list: (column name, field, prefix length or None) tuples
+    """
+    if isinstance(partition_by, str):
+        partition_by = partition_by.split(",")
+    columns = []
+    for spec in partition_by:
+        field, _, prefix = spec.strip().partition(":")
+        if not field or (prefix and not prefix.isdigit()):
+            raise ValueError(f"Invalid partition: {spec}. Expected field or field:prefix_length")
+        columns.append((f"{field}{prefix}", field, int(prefix) if prefix else None))
+    return columns
+
+
+def partition_value(value, prefix:int=None) -> str:
+    """returns a value as a directory name part"""
+    if value is None or value == "":
+        return NULL_PARTITION
+    value = str(value)[:prefix] if prefix else str(value)
+    # keep the directory tree flat and valid
+    return value.replace("/", "_").replace("=", "_")
+
+
+class PartitionedWriter:
+    """
+    Writes rows into partition directories with a bounded number of open files. See the module docs.
+    """
+
+    def __init__(self, directory:str, partition_by, max_open_files:int=DEFAULT_MAX_OPEN_FILES,
+                 target_file_mb:float=DEFAULT_TARGET_FILE_MB, encode=json.dumps, overwrite:bool=False,
+                 buffer_rows:int=DEFAULT_BUFFER_ROWS):
+        """
+        Args:
+            directory (str): output directory
+            partition_by (list or str): partition specs, for example ["state", "zip:3"] or "state,zip:3"
+            max_open_files (int, optional): open part files limit. Defaults to DEFAULT_MAX_OPEN_FILES.
+            target_file_mb (float, optional): size at which a new part file is started. Defaults to
+                                              DEFAULT_TARGET_FILE_MB.
+            encode (callable, optional): encodes a row to a JSON string. Defaults to json.dumps.
+            overwrite (bool, optional): replace the partitions of an existing output directory. Defaults to False.
+            buffer_rows (int, optional): rows buffered before they are written. Defaults to DEFAULT_BUFFER_ROWS.
+
+        Raises:
+            FileExistsError: if the directory already has partitions and overwrite is False
+        """
+        self.directory = directory
+        self.columns = parse_partition_by(partition_by)
+        self.max_open_files = max(max_open_files, 1)
+        self.target_bytes = int(target_file_mb * 1024 * 1024)
+        self.encode = encode
+        self._prepare_directory(overwrite)
+        # partition path -> {"values", "files": [{"path", "rows", "bytes"}]}
+        self.partitions = {}
+        # partition path -> open part file, least recently written first
+        self.open_files = OrderedDict()
+        # row field values -> (partition path, partition values)
+        self.paths = {}
+        # partition path -> (partition values, encoded rows waiting to be written)
+        self.buffers = {}
+        self.buffer_rows = buffer_rows
+        self.buffered = 0
+        self.rows = 0
+        self.files_opened = 0
+
+    def _prepare_directory(self, overwrite:bool) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        existing = [entry for entry in os.scandir(self.directory)
+                    if entry.name == MANIFEST_FILE or (entry.is_dir() and "=" in entry.name)]
+        if existing and not overwrite:
+            raise FileExistsError(f"Output directory {self.directory} already has partitions")
+        for entry in existing:
+            if entry.is_dir():
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def partition_of(self, row:dict) -> tuple:
+        """returns the partition path of a row, and its partition values"""
+        key = tuple(row.get(field) for _, field, _ in self.columns)
+        partition = self.paths.get(key)
+        if partition is None:
+            values = {name: partition_value(value, prefix) for (name, _, prefix), value in zip(self.columns, key)}
+            path = os.path.join(*(f"{name}={value}" for name, value in values.items()))
+            partition = self.paths[key] = (path, values)
+        return partition
+
+    def _file(self, path:str, values:dict):
+        """returns the open part file of a partition, opening or rolling a part file if needed"""
+        part_file = self.open_files.get(path)
+        if part_file is not None:
+            self.open_files.move_to_end(path)
+            if self.partitions[path]["files"][-1]["bytes"] < self.target_bytes:
+                return part_file
+            # roll to a new part file
+            part_file.close()
+            del self.open_files[path]
+        partition = self.partitions.setdefault(path, {"values": values, "files": []})
+        files = partition["files"]
+        if not files or files[-1]["bytes"] >= self.target_bytes:
+            files.append({"path": os.path.join(path, f"part-{len(files):05d}.json"), "rows": 0, "bytes": 0})
+            os.makedirs(os.path.join(self.directory, path), exist_ok=True)
+        # close the least recently written files
+        while len(self.open_files) >= self.max_open_files:
+            _, oldest = self.open_files.popitem(last=False)
+            oldest.close()
+        part_file = open(os.path.join(self.directory, files[-1]["path"]), "a", encoding="utf-8")
+        self.open_files[path] = part_file
+        self.files_opened += 1
+        return part_file
+
+    def write(self, row:dict) -> None:
+        """
+        Writes a row into its partition (buffered until `flush()`).
+
+        Args:
+            row (dict): data row
+        """
+        path, values = self.partition_of(row)
+        buffer = self.buffers.get(path)
+        if buffer is None:
+            buffer = self.buffers[path] = (values, [])
+        buffer[1].append(self.encode(row) + "\n")
+        self.buffered += 1
+        if self.buffered >= self.buffer_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """writes the buffered rows into their part files"""
+        target_bytes = self.target_bytes
+        for path, (values, lines) in self.buffers.items():
+            start = 0
+            while start < len(lines):
+                part_file = self._file(path, values)
+                stats = self.partitions[path]["files"][-1]
+                # the lines that fit in the part file (at least one)
+                end, size = start, stats["bytes"]
+                while end < len(lines) and size < target_bytes:
+                    line = lines[end]
+                    size += len(line) if line.isascii() else len(line.encode("utf-8"))
+                    end += 1
+                part_file.writelines(lines[start:end])
+                stats["rows"] += end - start
+                stats["bytes"] = size
+                start = end
+            self.rows += len(lines)
+        self.buffers = {}
+        self.buffered = 0
+
+    def manifest(self) -> dict:
+        """returns the manifest: partition columns, and the files and row counts of every partition"""
+        return {
+            "created": datetime.utcnow().isoformat(),
+            "partition_by": [name for name, _, _ in self.columns],
+            "rows": self.rows,
+            "partitions": [
+                {"path": path, "values": partition["values"], "rows": sum(f["rows"] for f in partition["files"]),
+                 "files": partition["files"]}
+                for path, partition in sorted(self.partitions.items())
+            ],
+        }
+
+    def close(self) -> dict:
+        """
+        Writes the buffered rows, closes the open files and writes the manifest.
+
+        Returns:
+            dict: the manifest
+        """
+        self.flush()
+        for part_file in self.open_files.values():
+            part_file.close()
+        self.open_files.clear()
+        manifest = self.manifest()
+        manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        return manifest
+
+
+def load_manifest(directory:str) -> dict:
+    with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)
+
+
+def matching_partitions(directory:str, **filters) -> list:
+    """
+    Returns the partitions of a partitioned output matching the filters, without listing the directories.
+
+    Args:
+        directory (str): partitioned output directory
+        filters: partition column values, for example state="CA"
+
+    Returns:
+        list: manifest entries of the matching partitions
+    """
+    return [partition for partition in load_manifest(directory)["partitions"]
+            if all(partition["values"].get(name) == str(value) for name, value in filters.items())]
+
+
+def read_partitions(directory:str, **filters):
+    """
+    Reads the rows of the partitions matching the filters; the other partitions are never opened.
+
+    Args:
+        directory (str): partitioned output directory
+        filters: partition column values, for example state="CA"
+
+    Yields:
+        dict: data rows
+    """
+    for partition in matching_partitions(directory, **filters):
+        for part in partition["files"]:
+            with open(os.path.join(directory, part["path"]), "r", encoding="utf-8") as part_file:
+                for line in part_file:
+                    yield json.loads(line)
+
+
+def main():
+    """
+    Prints the partitions of a partitioned output, filtered by field=value args.
+    """
+    args = sys.argv
+    if len(args) < 2 or not os.path.exists(os.path.join(args[1], MANIFEST_FILE)):
+        print("usage: python3 partitioned_writer.py output_dir [field=value ...]")
+        sys.exit(1)
+    filters = dict(arg.split("=", 1) for arg in args[2:])
+    partitions = matching_partitions(args[1], **filters)
+    for partition in partitions:
+        print(f"{partition['path']}: {partition['rows']} rows in {len(partition['files'])} files")
+    print(f"{len(partitions)} partitions, {sum(p['rows'] for p in partitions)} rows")
+
+
+# call our main function to parse command line args
+if __name__ == '__main__':
+    main()
@@ -4,15 +4,41 @@ Process JSON Row profiles into an OK and Reject file.
 Args:
     file_name: _description_
     print_lines: either true or false to print ok lines. 
+    dedupe_dir: (optional) directory to keep the uids seen across runs; rows with a duplicate uid are rejected
+    --dedupe-capacity, --dedupe-fpr, --dedupe-max-mb: (optional) size of the Bloom filter of a new dedupe_dir: expected
+                    number of uids over all the runs, false positive rate and memory budget (see `dedupe.py`)
+    --partition-by: (optional) write the OK rows into Hive-style partition directories instead of one file, for
+                    example `--partition-by state,zip:3` (see `partitioned_writer.py`)
+
+    --random-key: (optional) tokenize the card numbers with a random key if CARD_TOKEN_KEY isn't set
+
+Card numbers are replaced with tokens in both output files (see `card_tokens.py`): set the CARD_TOKEN_KEY
+environment variable to get the same tokens in every run (or use `--random-key`).
+
+Rejected (and printed OK) lines are logged to stderr by a background thread, as json lines (see the shared
+`chapters/common/dsa_common/logs.py`): set LOG_SAMPLE_RATE=0.01 to only log 1% of them, or LOG_FORMAT=text.
 """
 
 # imports
-import sys
 import re
+import sys
+import argparse
 import json
+import logging
 from json import JSONEncoder
 from datetime import datetime
 import shortuuid
+# the shared `dsa_common` package (chapters/common): `pip install -r requirements.txt` installs it
+from dsa_common.logs import sampled, setup_logging
+
+from dedupe import DEFAULT_CAPACITY, DEFAULT_FPR, UidDeduper
+from card_tokens import DEFAULT_BATCH_SIZE, CardTokenizer, token_key
+from partitioned_writer import DEFAULT_MAX_OPEN_FILES, DEFAULT_TARGET_FILE_MB, PartitionedWriter
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+# one log per row: sampled (LOG_SAMPLE_RATE environment variable)
+rows_logger = sampled(logger)
 
 
 # STAGES -------------------
@@ -171,6 +197,50 @@ def add_num_cards(row:dict) -> None:
         row["num_cards"] = 0
 
 
+# STAGES -------------------
+#   0) read the file into json rows
+#   1) add metadata columns
+#   2) Data Quality checks:
+#       - schema check
+#       - null check
+#   5) transformatios:
+#       - parse address into street_address, city, state, zip fields
+#       - add a num_cards field
+#   6) deduplicate: reject uids already seen in this file or in previous runs
+
+
+def dedupe_check(row:dict, deduper:UidDeduper) -> bool:
+    """
+    Checks that the uid of the row was never seen before, in this file or in previous runs (see `dedupe.py`).
+    New uids are remembered. Run this check last: only the uids of OK rows are remembered.
+
+    Args:
+        row (dict): data row
+        deduper (UidDeduper): uids seen so far
+
+    Returns:
+        bool: True if the uid is new
+
+    Raises:
+        ValueError: if the uid was already seen
+    """
+    if deduper.check_and_add(row["uid"]):
+        raise ValueError(f"Duplicate uid: {row['uid']}")
+    return True
+
+
+# STAGES -------------------
+#   0) read the file into json rows
+#   1) add metadata columns
+#   2) Data Quality checks:
+#       - schema check
+#       - null check
+#   5) transformatios:
+#       - parse address into street_address, city, state, zip fields
+#       - add a num_cards field
+#   6) deduplicate: reject uids already seen in this file or in previous runs
+#   7) tokenize: replace card numbers with tokens and drop the cvc, in OK and rejected rows. Rows are written in
+#      batches, so the card numbers of a batch are tokenized together (see `card_tokens.py`)
 
 
 class DatetimeEncoder(JSONEncoder):
@@ -197,13 +267,95 @@ class DatetimeEncoder(JSONEncoder):
         super(DatetimeEncoder, self).default(value)
 
 
-def run(file_name:str, print_lines:bool=False) -> None:
+def process_line(line, line_num:int, deduper:UidDeduper=None) -> tuple:
+    """
+    Runs the checks & transformations of stages 0 to 6 on one json row line.
+
+    Args:
+        line (str or bytes): json row line
+        line_num (int): line number (for the error message)
+        deduper (UidDeduper, optional): uids seen so far. Defaults to None: no deduplication.
+
+    Returns:
+        tuple: (row, err_msg); err_msg is None for OK rows. Rejected rows get an `error` field with err_msg.
+    """
+    row = {}
+    try:
+        row = json.loads(line.strip())
+        # checks & transformations
+        add_metadata(row)
+        schema_check(row)
+        null_check(row)
+        transform_address(row)
+        add_num_cards(row)
+        if deduper:
+            dedupe_check(row, deduper)
+        return row, None
+    except Exception as err:
+        # add error and line number to the json row
+        err_msg = f"[{line_num:02d}][ERR]: {str(err)}"
+        if not isinstance(row, dict):
+            # valid json, but not a json object
+            row = {"value": row}
+        row["error"] = err_msg
+        return row, err_msg
+
+
+def write_batch(batch:list, tokenizer:CardTokenizer, ok_file, reject_file, print_lines:bool=False,
+                log_rejects:bool=True) -> None:
+    """
+    Tokenizes the card numbers of a batch of rows, then writes them to the OK or reject file.
+
+    Args:
+        batch (list): (line_num, row, err_msg) tuples; err_msg is None for OK rows
+        tokenizer (CardTokenizer): card number tokenizer
+        ok_file (file or PartitionedWriter): OK rows file, or partitioned output
+        reject_file (file): rejected rows file
+        print_lines (bool): log OK lines
+        log_rejects (bool, optional): log rejected lines. Defaults to True.
+    """
+    tokenizer.tokenize_rows([row for _, row, _ in batch])
+    for line_num, row, err_msg in batch:
+        if err_msg is None:
+            if isinstance(ok_file, PartitionedWriter):
+                ok_file.write(row)
+            else:
+                json.dump(row, ok_file, cls=DatetimeEncoder)     # write the json row
+                ok_file.write("\n")         # write endline character
+            if print_lines:
+                rows_logger.info("[%02d][OK]: %s", line_num, row, extra={"line_num": line_num})
+        else:
+            # write the error line to reject file
+            json.dump(row, reject_file, cls=DatetimeEncoder)
+            reject_file.write('\n')
+            if log_rejects:
+                # the row is only formatted by the logging thread
+                rows_logger.info("%s %s", err_msg, row, extra={"line_num": line_num})
+    batch.clear()
+
+
+def run(file_name:str, print_lines:bool=False, dedupe_dir:str=None, tokenizer:CardTokenizer=None,
+        batch_size:int=DEFAULT_BATCH_SIZE, partition_by:list=None, max_open_files:int=DEFAULT_MAX_OPEN_FILES,
+        target_file_mb:float=DEFAULT_TARGET_FILE_MB, dedupe_capacity:int=DEFAULT_CAPACITY,
+        dedupe_fpr:float=DEFAULT_FPR, dedupe_max_mb:float=None) -> None:
     """
     Reads user profiles from a JSON row formated file.
 
     Args:
         file_name (str): file path to read
         print_lines (bool): print lines to console
+        dedupe_dir (str, optional): directory of the uids seen across runs (see `dedupe.py`). Defaults to None:
+                                    no deduplication.
+        tokenizer (CardTokenizer, optional): card number tokenizer. Defaults to one with the CARD_TOKEN_KEY key.
+        batch_size (int, optional): rows tokenized and written together. Defaults to DEFAULT_BATCH_SIZE.
+        partition_by (list, optional): partition specs of the OK rows, for example ["state", "zip:3"]. Defaults to
+                                       None: one OK file.
+        max_open_files (int, optional): open partition files limit. Defaults to DEFAULT_MAX_OPEN_FILES.
+        target_file_mb (float, optional): size of the partition files. Defaults to DEFAULT_TARGET_FILE_MB.
+        dedupe_capacity (int, optional): expected number of uids over all the runs, to size the Bloom filter of a new
+                                         dedupe_dir. Defaults to DEFAULT_CAPACITY.
+        dedupe_fpr (float, optional): Bloom filter false positive rate of a new dedupe_dir. Defaults to DEFAULT_FPR.
+        dedupe_max_mb (float, optional): Bloom filter memory budget of a new dedupe_dir. Defaults to no limit.
     """
     # keep track or row counts
     line_num = 0            # total number of rows
@@ -220,42 +372,47 @@ def run(file_name:str, print_lines:bool=False) -> None:
     ok_file_name = f"{file_name_without_extension}_{file_timestamp}_ok.json"
     reject_file_name = f"{file_name_without_extension}_{file_timestamp}_reject.json"
     # open files for writing
-    ok_file = open(ok_file_name, "w", encoding="utf-8")
+    if partition_by:
+        # a directory of partitions instead of the ok file
+        ok_file_name = ok_file_name.rpartition('.')[0]
+        ok_file = PartitionedWriter(ok_file_name, partition_by, max_open_files, target_file_mb,
+                                    encode=lambda row: json.dumps(row, cls=DatetimeEncoder), overwrite=True)
+    else:
+        ok_file = open(ok_file_name, "w", encoding="utf-8")
     reject_file = open(reject_file_name, "w", encoding="utf-8")
+    # uids seen in previous runs
+    deduper = UidDeduper(dedupe_dir, dedupe_capacity, dedupe_fpr, dedupe_max_mb) if dedupe_dir else None
+    tokenizer = tokenizer or CardTokenizer(token_key())
+    # rows waiting to be tokenized and written
+    batch = []
 
     with open(file_name, "r") as json_file:
         for line in json_file:
-            try:
-                row = json.loads(line.strip())
-                # checks & transformations
-                add_metadata(row)
-                schema_check(row)
-                null_check(row)
-                transform_address(row)
-                add_num_cards(row)
-                # write to ok file
-                json.dump(row, ok_file, cls=DatetimeEncoder)     # write the json row
-                ok_file.write("\n")         # write endline character
-
-                if print_lines:
-                    print(f"[{line_num:02d}][OK]: {row}")
+            row, err_msg = process_line(line, line_num, deduper)
+            # queue for the ok or reject file
+            batch.append((line_num, row, err_msg))
+            if err_msg is None:
                 ok_count += 1
-            except Exception as err:
-                # add error and line number to the json row
-                err_msg = f"[{line_num:02d}][ERR]: {str(err)}"
-                row["error"] = err_msg
-                # write the error line to reject file
-                json.dump(row, reject_file, cls=DatetimeEncoder)
-                reject_file.write('\n')
-                print(err_msg, row)
+            else:
                 reject_count += 1
-            finally:
-                line_num += 1
+            line_num += 1
+            if len(batch) >= batch_size:
+                write_batch(batch, tokenizer, ok_file, reject_file, print_lines)
+    write_batch(batch, tokenizer, ok_file, reject_file, print_lines)
     # print line count summary at the end
     print(f"Read {line_num} rows")
     print(f"OK rows: {ok_count:02d}, Rejected rows: {reject_count:02d}")
-    # close files
-    ok_file.close()
+    if deduper:
+        # save the uids of this run
+        deduper.flush()
+        print(f"Duplicate uids: {deduper.duplicates}. {deduper.summary()}")
+    print(f"Card tokens: {tokenizer.summary()}")
+    # close files: the partitioned writer writes its buffered rows and its manifest
+    if partition_by:
+        manifest = ok_file.close()
+        print(f"Wrote {len(manifest['partitions'])} partitions into {ok_file_name}")
+    else:
+        ok_file.close()
     reject_file.close()
 
 
@@ -263,17 +420,35 @@ def main():
     """
     The main execution method. Get command line args and call the `run()` method.
     """
-    args = sys.argv     # command line arguments into our script
-    if len(args) != 3:
-        # print help
-        help = "usage: python3.7 process_profiles.py file_name print_lines\nprint_lines can be 'yes' or 'no'"
-        print(help)
-        sys.exit(1)
-    # get the command line args
-    file_name = args[1]
-    print_lines = str(args[2]).lower() in {'yes', 'true'}     # see if second argument is either true or yes, otherwise False
+    parser = argparse.ArgumentParser(description="Process JSON Row profiles into an OK and Reject file")
+    parser.add_argument("file_name", help="JSON rows file to process")
+    parser.add_argument("print_lines", help="print the OK lines: 'yes' or 'no'")
+    parser.add_argument("dedupe_dir", nargs="?", default=None, help="directory of the uids seen across runs")
+    parser.add_argument("--dedupe-capacity", type=int, default=DEFAULT_CAPACITY,
+                        help="expected number of uids over all the runs (sizes a new dedupe_dir)")
+    parser.add_argument("--dedupe-fpr", type=float, default=DEFAULT_FPR,
+                        help="Bloom filter false positive rate of a new dedupe_dir")
+    parser.add_argument("--dedupe-max-mb", type=float, default=None,
+                        help="Bloom filter memory budget of a new dedupe_dir in MB")
+    parser.add_argument("--partition-by", default=None, help="partition the OK rows, for example state,zip:3")
+    parser.add_argument("--max-open-files", type=int, default=DEFAULT_MAX_OPEN_FILES,
+                        help="open partition files limit")
+    parser.add_argument("--target-file-mb", type=float, default=DEFAULT_TARGET_FILE_MB,
+                        help="size of the partition files")
+    parser.add_argument("--random-key", action="store_true",
+                        help="tokenize the card numbers with a random key if CARD_TOKEN_KEY is not set")
+    args = parser.parse_args()
+    setup_logging()
+    try:
+        tokenizer = CardTokenizer(token_key(args.random_key))
+    except ValueError as err:
+        parser.error(str(err))
+    print_lines = str(args.print_lines).lower() in {'yes', 'true'}     # see if second argument is either true or yes, otherwise False
+    partition_by = args.partition_by.split(",") if args.partition_by else None
     # call our run method
-    run(file_name, print_lines)
+    run(args.file_name, print_lines, args.dedupe_dir, tokenizer, partition_by=partition_by,
+        max_open_files=args.max_open_files, target_file_mb=args.target_file_mb, dedupe_capacity=args.dedupe_capacity,
+        dedupe_fpr=args.dedupe_fpr, dedupe_max_mb=args.dedupe_max_mb)
 
 
 # call our main function to parse command line args
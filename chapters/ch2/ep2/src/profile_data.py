@@ -0,0 +1,478 @@
+"""
+Single pass, constant memory profiler of JSON row files.
+
+Before tuning `REQUIRED_SCHEMA_FIELDS` and `NOT_NULL_FIELDS` of `process_profiles.py`, we need to know what the
+incoming files look like. pandas loads the whole file in memory; this script reads it one line at a time and keeps,
+for every field (nested fields are named `address.city`, list elements `credit_cards[].card_type`):
+
+    - the count of rows with the field, of null values, and of each inferred type: JSON types, plus strings that
+      look like an int, a float, a date or a datetime
+    - the approximate number of distinct values: a HyperLogLog sketch (16 KB, about 1% error)
+    - the approximate top values: a count-min sketch of the value counts and the most frequent candidates
+    - a histogram of the string lengths (powers of 2), the min/max lengths and the min/max numbers
+
+Every sketch has a fixed size, whatever the size of the file. Sketches of the same field add up, so large files are
+split into byte ranges of whole lines, profiled by worker processes, and the profiles are merged. Compressed files
+(.gz, .bz2, .xz) are profiled by one worker each.
+
+usage: python profile_data.py file_name [file_name ...] [--workers 4] [--top 10] [--output profile.json]
+"""
+
+# imports
+import os
+import re
+import bz2
+import gzip
+import json
+import lzma
+import math
+import time
+import hashlib
+import argparse
+from functools import reduce
+from multiprocessing import Pool
+
+import numpy as np
+
+
+HLL_PRECISION = 14
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+DEFAULT_TOP = 10
+# top value candidates kept per field, as a multiple of the number of top values reported
+CANDIDATE_FACTOR = 4
+# values of a field hashed together
+HASH_BATCH = 4096
+# string length histogram buckets: 0, 1, 2-3, 4-7, ..., 2^19 and more
+LENGTH_BUCKETS = 21
+
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+# string subtypes: the name of the matching group is the type
+STRING_TYPES = re.compile(
+    r"(?P<int_string>[+-]?\d+)"
+    r"|(?P<float_string>[+-]?(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?)"
+    r"|(?P<datetime_string>\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?.*)"
+    r"|(?P<date_string>\d{4}-\d{2}-\d{2}|\d{2}/\d{2}(?:/\d{2,4})?)"
+)
+JSON_TYPES = {type(None): "null", bool: "bool", int: "int", float: "float", list: "list", dict: "object"}
+
+
+def value_hash(value:str) -> int:
+    """returns a 64 bit hash of a value; the same in every process (unlike `hash()`)"""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct count sketch: 2^precision registers of the longest run of leading zeros of the hashes.
+    """
+
+    def __init__(self, precision:int=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes:list) -> None:
+        """adds 64 bit hashes"""
+        precision = self.precision
+        rest_bits = 64 - precision
+        rest_mask = (1 << rest_bits) - 1
+        buckets = [h >> rest_bits for h in hashes]
+        # position of the first 1 bit of the other bits
+        ranks = [rest_bits - (h & rest_mask).bit_length() + 1 for h in hashes]
+        np.maximum.at(self.registers, buckets, ranks)
+
+    def merge(self, other:"HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        """returns the estimated number of distinct values"""
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * size and zeros:
+            # small counts: linear counting of the empty registers
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+
+class CountMinSketch:
+    """
+    Count-min sketch of value counts, plus the candidates for the most frequent values. Counts are estimated with
+    count-mean-min: the expected collisions of each row are subtracted, which keeps the counts of mostly unique
+    values (uids) close to 1 instead of the average count of a table cell.
+    """
+
+    def __init__(self, width:int=CMS_WIDTH, depth:int=CMS_DEPTH, max_candidates:int=DEFAULT_TOP * CANDIDATE_FACTOR):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+        self.max_candidates = max_candidates
+        # value -> estimated count
+        self.candidates = {}
+
+    def _columns(self, hashes) -> np.ndarray:
+        """returns the (depth, len(hashes)) table columns of hashes (double hashing)"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        first, step = hashes & np.uint64(0xFFFFFFFF), (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((first[None, :] + rows * step[None, :]) % np.uint64(self.width)).astype(np.intp)
+
+    def estimate(self, hashes) -> np.ndarray:
+        """returns the estimated counts of hashed values"""
+        counts = self.table[np.arange(self.depth)[:, None], self._columns(hashes)]
+        # the other values spread evenly over the other cells of each row
+        noise = (self.total - counts) / (self.width - 1)
+        corrected = np.round(np.median(counts - noise, axis=0)).astype(np.int64)
+        return np.clip(corrected, 0, counts.min(axis=0))
+
+    def add(self, values:list, hashes:list) -> None:
+        """adds values and their hashes, and updates the top value candidates"""
+        columns = self._columns(hashes)
+        np.add.at(self.table, (np.repeat(np.arange(self.depth), len(hashes)), columns.ravel()), 1)
+        self.total += len(hashes)
+        distinct = dict(zip(values, hashes))
+        self._update_candidates(list(distinct), list(distinct.values()))
+
+    def _update_candidates(self, values:list, hashes:list) -> None:
+        candidates = self.candidates
+        for value in candidates:
+            if value not in values:
+                values.append(value)
+                hashes.append(value_hash(value))
+        estimates = self.estimate(hashes)
+        best = np.argsort(-estimates, kind="stable")[:self.max_candidates]
+        self.candidates = {values[i]: int(estimates[i]) for i in best}
+
+    def merge(self, other:"CountMinSketch") -> None:
+        self.table += other.table
+        self.total += other.total
+        values = list(other.candidates)
+        self._update_candidates(values, [value_hash(value) for value in values])
+
+    def error(self) -> int:
+        """returns the count-min error bound: estimates are within it of the real counts (with 98% probability)"""
+        return math.ceil(math.e / self.width * self.total)
+
+    def top(self, k:int) -> list:
+        """returns the k most frequent (value, estimated count)"""
+        return sorted(self.candidates.items(), key=lambda item: -item[1])[:k]
+
+
+def value_type(value) -> str:
+    """returns the inferred type of a JSON value"""
+    if type(value) is str:
+        match = STRING_TYPES.fullmatch(value)
+        return match.lastgroup if match else "string"
+    return JSON_TYPES.get(type(value), "object")
+
+
+class FieldProfile:
+    """
+    Statistics of one field. Values are buffered and hashed `HASH_BATCH` at a time.
+    """
+
+    def __init__(self, top:int=DEFAULT_TOP):
+        self.count = 0
+        self.nulls = 0
+        self.types = {}
+        self.lengths = [0] * LENGTH_BUCKETS
+        self.min_length = None
+        self.max_length = None
+        self.min_number = None
+        self.max_number = None
+        self.distinct = HyperLogLog()
+        self.frequent = CountMinSketch(max_candidates=top * CANDIDATE_FACTOR)
+        self.pending = []
+
+    def add(self, value) -> None:
+        self.count += 1
+        kind = value_type(value)
+        self.types[kind] = self.types.get(kind, 0) + 1
+        if value is None:
+            self.nulls += 1
+            return
+        if kind == "list" or kind == "object":
+            return
+        if type(value) is str:
+            length = len(value)
+            self.lengths[min(length.bit_length(), LENGTH_BUCKETS - 1)] += 1
+            if self.min_length is None or length < self.min_length:
+                self.min_length = length
+            if self.max_length is None or length > self.max_length:
+                self.max_length = length
+        elif kind != "bool":
+            if self.min_number is None or value < self.min_number:
+                self.min_number = value
+            if self.max_number is None or value > self.max_number:
+                self.max_number = value
+        self.pending.append(value if type(value) is str else json.dumps(value))
+        if len(self.pending) >= HASH_BATCH:
+            self.flush()
+
+    def flush(self) -> None:
+        """adds the buffered values to the sketches"""
+        if not self.pending:
+            return
+        hashes = [value_hash(value) for value in self.pending]
+        self.distinct.add_hashes(hashes)
+        self.frequent.add(self.pending, hashes)
+        self.pending = []
+
+    def merge(self, other:"FieldProfile") -> None:
+        self.flush()
+        other.flush()
+        self.count += other.count
+        self.nulls += other.nulls
+        for kind, count in other.types.items():
+            self.types[kind] = self.types.get(kind, 0) + count
+        self.lengths = [count + other_count for count, other_count in zip(self.lengths, other.lengths)]
+        self.min_length = _min(self.min_length, other.min_length)
+        self.max_length = _max(self.max_length, other.max_length)
+        self.min_number = _min(self.min_number, other.min_number)
+        self.max_number = _max(self.max_number, other.max_number)
+        self.distinct.merge(other.distinct)
+        self.frequent.merge(other.frequent)
+
+    def summary(self, rows:int=None, top:int=DEFAULT_TOP) -> dict:
+        """
+        Args:
+            rows (int, optional): number of rows, for the missing count of top level fields. Defaults to None.
+            top (int, optional): number of top values. Defaults to DEFAULT_TOP.
+
+        Returns:
+            dict: field statistics
+        """
+        self.flush()
+        summary = {
+            "count": self.count,
+            "nulls": self.nulls,
+            "null_rate": self.nulls / self.count if self.count else 0,
+            "types": dict(sorted(self.types.items(), key=lambda item: -item[1])),
+        }
+        # lists and objects aren't counted: their elements and fields are
+        scalars = self.count - self.nulls - self.types.get("list", 0) - self.types.get("object", 0)
+        if scalars:
+            summary["distinct"] = min(self.distinct.count(), scalars)
+            summary["top"] = self.frequent.top(top)
+            summary["top_error"] = self.frequent.error()
+        if rows is not None:
+            summary["missing"] = rows - self.count
+        if self.max_length is not None:
+            buckets = {(f"{1 << (bucket - 1)}-{(1 << bucket) - 1}" if bucket > 1 else str(bucket)): int(count)
+                       for bucket, count in enumerate(self.lengths) if count}
+            summary["length"] = {"min": self.min_length, "max": self.max_length, "histogram": buckets}
+        if self.max_number is not None:
+            summary["number"] = {"min": self.min_number, "max": self.max_number}
+        return summary
+
+
+def _min(first, second):
+    return second if first is None else first if second is None else min(first, second)
+
+
+def _max(first, second):
+    return second if first is None else first if second is None else max(first, second)
+
+
+class DataProfile:
+    """
+    Statistics of every field of a JSON rows file (or part of it).
+    """
+
+    def __init__(self, top:int=DEFAULT_TOP):
+        self.top = top
+        self.rows = 0
+        self.invalid_lines = 0
+        self.fields = {}
+
+    def _field(self, name:str) -> FieldProfile:
+        field = self.fields.get(name)
+        if field is None:
+            field = self.fields[name] = FieldProfile(self.top)
+        return field
+
+    def add_value(self, name:str, value) -> None:
+        """adds a field value, and the values of its nested fields and list elements"""
+        self._field(name).add(value)
+        if isinstance(value, dict):
+            for key, item in value.items():
+                self.add_value(f"{name}.{key}", item)
+        elif isinstance(value, list):
+            for item in value:
+                self.add_value(f"{name}[]", item)
+
+    def add_line(self, line) -> None:
+        """adds a JSON row line"""
+        if not line.strip():
+            return
+        try:
+            row = json.loads(line)
+        except ValueError:
+            self.invalid_lines += 1
+            return
+        if not isinstance(row, dict):
+            self.invalid_lines += 1
+            return
+        self.rows += 1
+        for name, value in row.items():
+            self.add_value(name, value)
+
+    def merge(self, other:"DataProfile") -> "DataProfile":
+        self.rows += other.rows
+        self.invalid_lines += other.invalid_lines
+        for name, field in other.fields.items():
+            if name in self.fields:
+                self.fields[name].merge(field)
+            else:
+                field.flush()
+                self.fields[name] = field
+        return self
+
+    def summary(self) -> dict:
+        """returns the statistics of every field, and the schema suggestions"""
+        fields = {name: field.summary(self.rows if _is_top_level(name) else None, self.top)
+                  for name, field in sorted(self.fields.items())}
+        top_level = {name: stats for name, stats in fields.items() if _is_top_level(name)}
+        return {
+            "rows": self.rows,
+            "invalid_lines": self.invalid_lines,
+            "fields": fields,
+            # candidates for REQUIRED_SCHEMA_FIELDS and NOT_NULL_FIELDS of process_profiles.py
+            "always_present": sorted(name for name, stats in top_level.items() if stats["missing"] == 0),
+            "never_null": sorted(name for name, stats in top_level.items()
+                                 if stats["missing"] == 0 and stats["nulls"] == 0),
+        }
+
+
+def _is_top_level(name:str) -> bool:
+    return "." not in name and "[]" not in name
+
+
+def shard_ranges(file_name:str, num_shards:int) -> list:
+    """
+    Splits a file into about `num_shards` byte ranges of whole lines.
+
+    Returns:
+        list: (start, end) byte offsets of each non empty shard
+    """
+    size = os.path.getsize(file_name)
+    bounds = [0]
+    with open(file_name, "rb") as json_file:
+        for shard in range(1, num_shards):
+            json_file.seek(max(size * shard // num_shards, bounds[-1]))
+            # move the boundary to the start of the next line
+            json_file.readline()
+            bounds.append(min(json_file.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def profile_shard(file_name:str, start:int=0, end:int=None, top:int=DEFAULT_TOP) -> DataProfile:
+    """
+    Profiles the lines of a byte range of a file, or a whole compressed file.
+
+    Args:
+        file_name (str): JSON rows file
+        start (int, optional): first byte. Defaults to 0.
+        end (int, optional): end byte. Defaults to None: the end of the file.
+        top (int, optional): number of top values. Defaults to DEFAULT_TOP.
+
+    Returns:
+        DataProfile: profile of the lines
+    """
+    profile = DataProfile(top)
+    opener = OPENERS.get(os.path.splitext(file_name)[1], open)
+    with opener(file_name, "rb") as json_file:
+        if end is None:
+            for line in json_file:
+                profile.add_line(line)
+        else:
+            json_file.seek(start)
+            position = start
+            while position < end:
+                line = json_file.readline()
+                if not line:
+                    break
+                position += len(line)
+                profile.add_line(line)
+    for field in profile.fields.values():
+        field.flush()
+    return profile
+
+
+def profile_files(file_names:list, workers:int=None, top:int=DEFAULT_TOP) -> DataProfile:
+    """
+    Profiles JSON rows files with worker processes.
+
+    Args:
+        file_names (list): JSON rows files (plain or compressed)
+        workers (int, optional): number of worker processes. Defaults to the number of CPUs.
+        top (int, optional): number of top values. Defaults to DEFAULT_TOP.
+
+    Returns:
+        DataProfile: merged profile of all the files
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = []
+    for file_name in file_names:
+        if os.path.splitext(file_name)[1] in OPENERS:
+            tasks.append((file_name, 0, None, top))
+        else:
+            # a few shards per worker, so a slow shard doesn't hold up the others
+            tasks += [(file_name, start, end, top) for start, end in shard_ranges(file_name, workers * 4)]
+    if workers > 1 and len(tasks) > 1:
+        with Pool(min(workers, len(tasks))) as pool:
+            profiles = pool.starmap(profile_shard, tasks)
+    else:
+        profiles = [profile_shard(*task) for task in tasks]
+    return reduce(DataProfile.merge, profiles, DataProfile(top))
+
+
+def print_summary(summary:dict) -> None:
+    print(f"{summary['rows']} rows, {summary['invalid_lines']} invalid lines")
+    for name, stats in summary["fields"].items():
+        types = ", ".join(f"{kind} {count / stats['count']:.0%}" for kind, count in stats["types"].items())
+        missing = f"  missing {stats['missing']}" if stats.get("missing") else ""
+        distinct = f"  ~{stats['distinct']} distinct" if "distinct" in stats else ""
+        print(f"{name}: {stats['count']} values{missing}  null {stats['null_rate']:.1%}{distinct}  types: {types}")
+        if "length" in stats:
+            length = stats["length"]
+            histogram = " ".join(f"{bucket}:{count}" for bucket, count in length["histogram"].items())
+            print(f"    length {length['min']}-{length['max']}  [{histogram}]")
+        if "number" in stats:
+            print(f"    range {stats['number']['min']} to {stats['number']['max']}")
+        if stats.get("top"):
+            top = ", ".join(f"{value[:30]!r} ~{count}" for value, count in stats["top"][:5])
+            print(f"    top (+/- {stats['top_error']}): {top}")
+    print(f"always present: {summary['always_present']}")
+    print(f"never null: {summary['never_null']}")
+
+
+def main():
+    """
+    The main execution method. Get command line args and profile the files.
+    """
+    parser = argparse.ArgumentParser(description="Profile JSON rows files in one pass")
+    parser.add_argument("file_names", nargs="+", help="JSON rows files (.json, .gz, .bz2 or .xz)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="number of top values per field")
+    parser.add_argument("-o", "--output", default=None, help="write the profile to a JSON file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = profile_files(args.file_names, args.workers, args.top).summary()
+    elapsed = time.perf_counter() - start
+    print_summary(summary)
+    print(f"Profiled {summary['rows']} rows in {elapsed:.1f}s ({summary['rows'] / elapsed:,.0f} rows/s)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(summary, output, indent=2)
+        print(f"Profile: {args.output}")
+
+
+# call our main function to parse command line args
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""
+Incremental sale price statistics per make_model and year.
+
+Instead of re-scanning every vehicles JSON Row file to compute the average, min and max `sale_price`, this script keeps
+running statistics in a state file (json):
+
+    - count, sum, min and max of the sale prices
+    - a quantile sketch: sale prices are counted in logarithmic buckets, so any quantile (median, p90, ...) can
+      be estimated within 1% (relative error) using a few hundred buckets per group
+
+New files update the state without reprocessing the files already in it. The state remembers how many bytes of each
+file (by path) were processed, and a hash of their beginning: a file that was appended to only adds its new lines,
+and a file that was truncated or replaced is refused (its old sales can't be taken out of the statistics: rebuild
+the state from all the files instead). Partial states created by parallel workers can be merged, as long as the
+workers processed different files.
+
+usage:
+    python aggregate_sales.py update sales_state.json ../data/vehicles_complex.json [more files ...]
+    python aggregate_sales.py merge sales_state.json worker1_state.json worker2_state.json
+    python aggregate_sales.py report sales_state.json [--quantiles 0.5 0.9]
+"""
+
+# imports
+import os
+import sys
+import json
+import math
+import hashlib
+import argparse
+from datetime import datetime
+
+
+# quantile sketch relative accuracy (1%)
+RELATIVE_ACCURACY = 0.01
+STATE_VERSION = 2
+# bytes hashed at the beginning of a processed file, to detect a replaced file
+HEAD_SIZE = 4096
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch (similar to DDSketch). Positive values are counted in buckets with exponentially
+    growing sizes: bucket `i` holds the values between gamma^(i-1) and gamma^i. Any quantile estimate is within
+    `relative_accuracy` of the real value. Zero and negative values (for example a -1.00 placeholder price) are
+    counted in their own buckets.
+    """
+
+    def __init__(self, relative_accuracy:float=RELATIVE_ACCURACY):
+        """
+        Args:
+            relative_accuracy (float, optional): relative error of the quantile estimates. Defaults to 1%.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}      # bucket index >> count
+        self.negative = {}      # bucket index of -value >> count
+        self.zeros = 0
+        self.count = 0
+
+    def bucket(self, value:float) -> int:
+        """returns the bucket index of a positive value"""
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def bucket_value(self, index:int) -> float:
+        """returns the representative value of a bucket (the relative error is the same to both bucket ends)"""
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value:float, count:int=1) -> None:
+        if value > 0:
+            index = self.bucket(value)
+            self.positive[index] = self.positive.get(index, 0) + count
+        elif value < 0:
+            index = self.bucket(-value)
+            self.negative[index] = self.negative.get(index, 0) + count
+        else:
+            self.zeros += count
+        self.count += count
+
+    def merge(self, other:"QuantileSketch") -> None:
+        """adds the counts of another sketch (with the same relative accuracy) into this sketch"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Can not merge sketches with different relative accuracy")
+        for index, count in other.positive.items():
+            self.positive[index] = self.positive.get(index, 0) + count
+        for index, count in other.negative.items():
+            self.negative[index] = self.negative.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q:float) -> float:
+        """
+        Estimates a quantile.
+
+        Args:
+            q (float): quantile between 0 and 1 (for example: 0.5 for the median)
+
+        Returns:
+            float: estimated value; or None if the sketch is empty
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # walk the buckets from the smallest to the largest value
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self.bucket_value(index)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self.bucket_value(index)
+        return self.bucket_value(max(self.positive))
+
+    def to_dict(self) -> dict:
+        # json keys must be strings
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "positive": {str(index): count for index, count in self.positive.items()},
+            "negative": {str(index): count for index, count in self.negative.items()},
+            "zeros": self.zeros,
+        }
+
+    @classmethod
+    def from_dict(cls, data:dict) -> "QuantileSketch":
+        sketch = cls(data["relative_accuracy"])
+        sketch.positive = {int(index): count for index, count in data["positive"].items()}
+        sketch.negative = {int(index): count for index, count in data["negative"].items()}
+        sketch.zeros = data["zeros"]
+        sketch.count = sum(sketch.positive.values()) + sum(sketch.negative.values()) + sketch.zeros
+        return sketch
+
+
+class PriceStats:
+    """
+    Running count, sum, min, max and quantile sketch of sale prices.
+    """
+
+    def __init__(self, relative_accuracy:float=RELATIVE_ACCURACY):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q:float) -> float:
+        """estimates a quantile; the estimate is kept within the exact min and max"""
+        value = self.sketch.quantile(q)
+        return None if value is None else min(max(value, self.min), self.max)
+
+    def add(self, price:float) -> None:
+        self.count += 1
+        self.sum += price
+        self.min = price if self.min is None else min(self.min, price)
+        self.max = price if self.max is None else max(self.max, price)
+        self.sketch.add(price)
+
+    def merge(self, other:"PriceStats") -> None:
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max, "sketch": self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data:dict) -> "PriceStats":
+        stats = cls()
+        stats.count, stats.sum, stats.min, stats.max = data["count"], data["sum"], data["min"], data["max"]
+        stats.sketch = QuantileSketch.from_dict(data["sketch"])
+        return stats
+
+
+def file_head(file_name:str, offset:int) -> str:
+    """returns the hash of the first bytes of a file (up to `offset` and HEAD_SIZE bytes)"""
+    with open(file_name, "rb") as open_file:
+        return hashlib.sha256(open_file.read(min(offset, HEAD_SIZE))).hexdigest()
+
+
+class SalesAggregator:
+    """
+    Sale price statistics grouped by (make_model, year), and the list of files they were computed from.
+    """
+
+    def __init__(self, relative_accuracy:float=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.groups = {}            # (make_model, year) >> PriceStats
+        self.processed_files = {}   # absolute path >> {"offset": bytes processed, "head": file_head()}
+
+    def add_sale(self, make_model:str, year:int, price:float) -> None:
+        key = (make_model, year)
+        stats = self.groups.get(key)
+        if stats is None:
+            stats = self.groups[key] = PriceStats(self.relative_accuracy)
+        stats.add(price)
+
+    def processed_offset(self, file_name:str) -> int:
+        """
+        Returns the number of bytes of a file already added to the state: 0 for a new file, the file size if it
+        has no new lines.
+
+        Raises:
+            ValueError: the file is shorter than, or doesn't start like, the part that was processed
+        """
+        entry = self.processed_files.get(os.path.abspath(file_name))
+        if entry is None:
+            return 0
+        offset = entry["offset"]
+        if os.path.getsize(file_name) < offset or file_head(file_name, offset) != entry["head"]:
+            raise ValueError(f"{file_name} was truncated or replaced since it was processed: "
+                             "rebuild the state from all the files")
+        return offset
+
+    def update_file(self, file_name:str) -> int:
+        """
+        Adds the sale prices of a vehicles JSON Row file (one line at a time): the whole file the first time, then
+        only the lines appended since. Rows with invalid JSON and sales without a finite numeric price (missing, a
+        bool, NaN or Infinity) are skipped. A last line without a newline is left for the next update unless it's a
+        complete JSON row (it may still be written).
+
+        Args:
+            file_name (str): vehicles JSON Row file path
+
+        Returns:
+            int: number of sale prices added
+
+        Raises:
+            ValueError: the file was truncated or replaced since it was processed
+        """
+        offset = self.processed_offset(file_name)
+        sales_count = 0
+        with open(file_name, "rb") as json_file:
+            json_file.seek(offset)
+            for line in json_file:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    if not line.endswith(b"\n"):
+                        # an incomplete last line
+                        break
+                    row = None
+                offset += len(line)
+                if not isinstance(row, dict):
+                    continue
+                for sale in row.get("sales_record") or []:
+                    price = sale.get("sale_price")
+                    # json.loads parses NaN and Infinity, which would turn the group's sum and average into NaN
+                    if isinstance(price, (int, float)) and not isinstance(price, bool) and math.isfinite(price):
+                        self.add_sale(row.get("make_model"), row.get("year"), float(price))
+                        sales_count += 1
+        self.processed_files[os.path.abspath(file_name)] = {"offset": offset, "head": file_head(file_name, offset)}
+        return sales_count
+
+    def merge(self, other:"SalesAggregator") -> None:
+        """
+        Merges a partial state (for example from another worker) into this state.
+
+        Raises:
+            ValueError: both states include (part of) the same file: its first lines would be counted twice
+        """
+        overlap = sorted(path for path in other.processed_files if path in self.processed_files)
+        if overlap:
+            raise ValueError(f"Files processed in both states: {overlap}")
+        for key, stats in other.groups.items():
+            if key not in self.groups:
+                self.groups[key] = PriceStats(self.relative_accuracy)
+            self.groups[key].merge(stats)
+        self.processed_files.update(other.processed_files)
+
+    def report(self, quantiles:list=(0.5, 0.9)) -> list:
+        """
+        Returns the statistics of each group as a list of dict rows (ordered by make_model and year).
+        """
+        rows = []
+        ordered = sorted(self.groups.items(), key=lambda item: (str(item[0][0]), str(item[0][1])))
+        for (make_model, year), stats in ordered:
+            row = {"make_model": make_model, "year": year, "count": stats.count, "avg": stats.mean,
+                   "min": stats.min, "max": stats.max}
+            for q in quantiles:
+                row[f"p{q * 100:g}"] = stats.quantile(q)
+            rows.append(row)
+        return rows
+
+    def to_dict(self) -> dict:
+        return {
+            "version": STATE_VERSION,
+            "relative_accuracy": self.relative_accuracy,
+            "updated": datetime.utcnow().isoformat(),
+            "processed_files": [{"path": path, **entry} for path, entry in self.processed_files.items()],
+            "groups": [{"make_model": make_model, "year": year, **stats.to_dict()}
+                       for (make_model, year), stats in self.groups.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data:dict) -> "SalesAggregator":
+        if data.get("version") != STATE_VERSION:
+            raise ValueError(f"Unknown state version: {data.get('version')}")
+        aggregator = cls(data["relative_accuracy"])
+        aggregator.processed_files = {entry["path"]: {"offset": entry["offset"], "head": entry["head"]}
+                                      for entry in data["processed_files"]}
+        for group in data["groups"]:
+            aggregator.groups[(group["make_model"], group["year"])] = PriceStats.from_dict(group)
+        return aggregator
+
+    @classmethod
+    def load(cls, state_file:str) -> "SalesAggregator":
+        """loads a state file; returns an empty state if the file doesn't exist"""
+        if not os.path.exists(state_file):
+            return cls()
+        with open(state_file, "r", encoding="utf-8") as open_file:
+            return cls.from_dict(json.load(open_file))
+
+    def save(self, state_file:str) -> None:
+        """writes the state to a temp file and then replaces the state file (a crash never leaves a partial state)"""
+        tmp_file = f"{state_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as open_file:
+            json.dump(self.to_dict(), open_file)
+        os.replace(tmp_file, state_file)
+
+
+def update(state_file:str, file_names:list) -> None:
+    """adds new files, and the new lines of the files already in the state, to the state file"""
+    aggregator = SalesAggregator.load(state_file)
+    for file_name in file_names:
+        offset = aggregator.processed_offset(file_name)
+        if offset == os.path.getsize(file_name):
+            print(f"Skipping {file_name}: already processed")
+            continue
+        sales_count = aggregator.update_file(file_name)
+        print(f"Added {sales_count} sales from {file_name}" + (f" (new lines after byte {offset})" if offset else ""))
+    aggregator.save(state_file)
+    print(f"Saved {len(aggregator.groups)} groups to {state_file}")
+
+
+def merge(state_file:str, partial_files:list) -> None:
+    """merges partial worker states into the state file"""
+    aggregator = SalesAggregator.load(state_file)
+    for partial_file in partial_files:
+        aggregator.merge(SalesAggregator.load(partial_file))
+        print(f"Merged {partial_file}")
+    aggregator.save(state_file)
+    print(f"Saved {len(aggregator.groups)} groups to {state_file}")
+
+
+def report(state_file:str, quantiles:list) -> None:
+    """prints the statistics of each group"""
+    rows = SalesAggregator.load(state_file).report(quantiles)
+    if not rows:
+        print("No sales")
+        return
+    for row in rows:
+        values = "  ".join(f"{key}: {value:,.2f}" if isinstance(value, float) else f"{key}: {value}"
+                           for key, value in row.items())
+        print(values)
+
+
+def main():
+    """
+    The main execution method. Get command line args and call the update, merge or report functions.
+    """
+    parser = argparse.ArgumentParser(description="Incremental sale price statistics per make_model and year")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update_parser = commands.add_parser("update", help="add new vehicles JSON Row files to the state")
+    update_parser.add_argument("state_file")
+    update_parser.add_argument("file_names", nargs="+")
+    merge_parser = commands.add_parser("merge", help="merge partial worker states into the state")
+    merge_parser.add_argument("state_file")
+    merge_parser.add_argument("partial_files", nargs="+")
+    report_parser = commands.add_parser("report", help="print the statistics")
+    report_parser.add_argument("state_file")
+    report_parser.add_argument("-q", "--quantiles", nargs="+", type=float, default=[0.5, 0.9])
+    args = parser.parse_args()
+
+    try:
+        if args.command == "update":
+            update(args.state_file, args.file_names)
+        elif args.command == "merge":
+            merge(args.state_file, args.partial_files)
+        else:
+            report(args.state_file, args.quantiles)
+    except (FileNotFoundError, ValueError) as err:
+        print(f"Error: {err}")
+        sys.exit(1)
+
+
+# call our main function to parse command line args
+if __name__ == '__main__':
+    main()
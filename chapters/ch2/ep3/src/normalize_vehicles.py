@@ -0,0 +1,267 @@
+"""
+Normalize the vehicles JSON Row file into a `vehicles` table and a `sales` child table.
+
+Each line of `vehicles_complex.json` is a vehicle with a nested `sales_record` list. This script streams the file one
+line at a time and splits every vehicle into:
+
+    - vehicles: one row per vehicle (without the sales records)
+    - sales:    one row per sale record, keyed by the vehicle's license_plate
+
+Rows are buffered in bounded batches (--batch-size rows per table) and written to CSV or Parquet files, so memory
+does not grow with the input file. Vehicles without a license plate (the key of the sales table), vehicles with a
+value that doesn't match its column type (in the vehicle or in one of its sales) and invalid JSON lines are written to
+a reject JSON Row file: a rejected vehicle adds no row to either table. The rows/s and MB written are reported per output table.
+
+usage: python normalize_vehicles.py ../data/vehicles_complex.json [--format csv|parquet] [--batch-size 10000]
+(the parquet format requires pyarrow)
+"""
+
+# imports
+import os
+import csv
+import json
+import math
+import time
+import argparse
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+
+# output table fields
+VEHICLE_FIELDS = ["license_plate", "make_model", "year", "color", "registered_date", "registered_name",
+                  "registered_address"]
+SALE_FIELDS = ["license_plate", "sale_num", "new_owner", "previous_owner", "sale_price", "sale_date"]
+# parquet column types (pyarrow type names)
+FIELD_TYPES = {"year": "int64", "sale_num": "int32", "sale_price": "float64"}
+# python types of the values of each column type (None is allowed in every column)
+PYTHON_TYPES = {"int64": int, "int32": int, "float64": (int, float), "string": str}
+INT_BITS = {"int64": 64, "int32": 32}
+
+DEFAULT_BATCH_SIZE = 10_000
+
+
+def check_types(row:dict) -> dict:
+    """
+    Checks each value of a table row against its column type (FIELD_TYPES, string by default), so that a bad value
+    rejects its vehicle instead of failing the write of the batch it's in.
+
+    Args:
+        row (dict): vehicles or sales table row
+
+    Returns:
+        dict: the same row
+
+    Raises:
+        ValueError: a value doesn't match its column type
+    """
+    for field, value in row.items():
+        if value is None:
+            continue
+        column_type = FIELD_TYPES.get(field, "string")
+        valid = isinstance(value, PYTHON_TYPES[column_type]) and not isinstance(value, bool)
+        if valid and column_type in INT_BITS:
+            valid = -2 ** (INT_BITS[column_type] - 1) <= value < 2 ** (INT_BITS[column_type] - 1)
+        elif valid and column_type == "float64":
+            valid = math.isfinite(value)
+        if not valid:
+            raise ValueError(f"Invalid {field}: {value!r} is not a {column_type}")
+    return row
+
+
+def flatten(row:dict) -> tuple:
+    """
+    Splits a vehicle row into a vehicles table row and its sales table rows.
+
+    Args:
+        row (dict): vehicle json row
+
+    Returns:
+        tuple: (vehicle dict, list of sale dicts)
+
+    Raises:
+        ValueError: the vehicle has no license_plate, or a value doesn't match its column type (see `check_types()`)
+    """
+    license_plate = row.get("license_plate")
+    if not license_plate:
+        raise ValueError("Missing license_plate")
+    vehicle = check_types({field: row.get(field) for field in VEHICLE_FIELDS})
+    sales = []
+    for sale_num, sale in enumerate(row.get("sales_record") or []):
+        if not isinstance(sale, dict):
+            raise ValueError(f"Invalid sales_record: {sale!r} is not an object")
+        sales.append(check_types({
+            "license_plate": license_plate,
+            # position of the sale in the sales_record list (0 is the most recent sale)
+            "sale_num": sale_num,
+            "new_owner": sale.get("new_owner"),
+            "previous_owner": sale.get("previous_owner"),
+            "sale_price": sale.get("sale_price"),
+            "sale_date": sale.get("sale_date"),
+        }))
+    return vehicle, sales
+
+
+class BatchWriter(ABC):
+    """
+    Buffers rows and writes them to a file in batches of `batch_size` rows. Keeps track of the rows and bytes
+    written and the time spent writing. Subclasses implement `write_batch()` for their file format.
+    """
+
+    def __init__(self, file_name:str, fields:list, batch_size:int=DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            file_name (str): output file path
+            fields (list): table fields
+            batch_size (int, optional): rows per batch. Defaults to DEFAULT_BATCH_SIZE.
+        """
+        self.file_name = file_name
+        self.fields = fields
+        self.batch_size = batch_size
+        self.batch = []
+        self.rows = 0
+        self.write_seconds = 0.0
+
+    def add(self, row:dict) -> None:
+        """add a row; writes the batch when it's full"""
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """write the buffered rows"""
+        if self.batch:
+            # a batch that fails to write is not written again by the next flush
+            batch, self.batch = self.batch, []
+            start = time.perf_counter()
+            self.write_batch(batch)
+            self.write_seconds += time.perf_counter() - start
+            self.rows += len(batch)
+
+    @abstractmethod
+    def write_batch(self, rows:list) -> None:
+        """write a batch of rows to the file"""
+
+    def close(self) -> None:
+        """write the remaining rows and close the file"""
+        self.flush()
+
+    def bytes_written(self) -> int:
+        return os.path.getsize(self.file_name) if os.path.exists(self.file_name) else 0
+
+
+class CsvBatchWriter(BatchWriter):
+    """Writes batches of rows to a CSV file"""
+
+    def __init__(self, file_name:str, fields:list, batch_size:int=DEFAULT_BATCH_SIZE):
+        super().__init__(file_name, fields, batch_size)
+        self.file = open(file_name, "w", encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=fields)
+        self.writer.writeheader()
+
+    def write_batch(self, rows:list) -> None:
+        self.writer.writerows(rows)
+
+    def close(self) -> None:
+        super().close()
+        self.file.close()
+
+
+class ParquetBatchWriter(BatchWriter):
+    """Writes each batch of rows as a row group of a Parquet file (requires pyarrow)"""
+
+    def __init__(self, file_name:str, fields:list, batch_size:int=DEFAULT_BATCH_SIZE):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Writing parquet files requires pyarrow: pip install pyarrow")
+        super().__init__(file_name, fields, batch_size)
+        self.pa = pa
+        self.schema = pa.schema([(field, getattr(pa, FIELD_TYPES.get(field, "string"))()) for field in fields])
+        self.writer = pq.ParquetWriter(file_name, self.schema)
+
+    def write_batch(self, rows:list) -> None:
+        columns = {field: [row[field] for row in rows] for field in self.fields}
+        self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self) -> None:
+        super().close()
+        self.writer.close()
+
+
+WRITERS = {"csv": CsvBatchWriter, "parquet": ParquetBatchWriter}
+
+
+def run(file_name:str, output_format:str="csv", batch_size:int=DEFAULT_BATCH_SIZE) -> dict:
+    """
+    Streams the vehicles JSON Row file into the vehicles and sales tables.
+
+    Args:
+        file_name (str): vehicles JSON Row file path
+        output_format (str, optional): csv or parquet. Defaults to "csv".
+        batch_size (int, optional): rows per batch. Defaults to DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: number of rows written per table (and rejected vehicles)
+    """
+    # add a timestamp to the output files
+    file_timestamp = datetime.utcnow().strftime("%Y%m%d")
+    file_name_without_extension = file_name.rpartition('.')[0]
+    output_prefix = f"{file_name_without_extension}_{file_timestamp}"
+    writer_class = WRITERS[output_format]
+    tables = {
+        "vehicles": writer_class(f"{output_prefix}_vehicles.{output_format}", VEHICLE_FIELDS, batch_size),
+        "sales": writer_class(f"{output_prefix}_sales.{output_format}", SALE_FIELDS, batch_size),
+    }
+    reject_count = 0
+    line_num = 0
+    row = None
+    start = time.perf_counter()
+
+    with open(file_name, "r", encoding="utf-8") as json_file, \
+            open(f"{output_prefix}_reject.json", "w", encoding="utf-8") as reject_file:
+        for line in json_file:
+            try:
+                row = json.loads(line)
+                # checks the vehicle and all its sales before adding any of them
+                vehicle, sales = flatten(row)
+                tables["vehicles"].add(vehicle)
+                for sale in sales:
+                    tables["sales"].add(sale)
+            except Exception as err:
+                # write the line and error to the reject file
+                reject = row if isinstance(row, dict) else {"line": line.strip()}
+                reject["error"] = f"[{line_num:02d}][ERR]: {str(err)}"
+                json.dump(reject, reject_file)
+                reject_file.write("\n")
+                reject_count += 1
+            finally:
+                row = None
+                line_num += 1
+        for table in tables.values():
+            table.close()
+    elapsed = time.perf_counter() - start
+
+    # print the throughput of each output table
+    print(f"Read {line_num} rows in {elapsed:.2f}s, rejected rows: {reject_count}")
+    for name, table in tables.items():
+        print(f"  {name:<10s} {table.rows:10d} rows  {table.rows / elapsed:12,.0f} rows/s  "
+              f"{table.bytes_written() / 1024 / 1024:8.2f} MB  (writing {table.write_seconds:.2f}s)  {table.file_name}")
+    return {**{name: table.rows for name, table in tables.items()}, "rejects": reject_count}
+
+
+def main():
+    """
+    The main execution method. Get command line args and call the `run()` method.
+    """
+    parser = argparse.ArgumentParser(description="Normalize vehicles into vehicles and sales tables")
+    parser.add_argument("file_name", help="vehicles JSON Row file")
+    parser.add_argument("-f", "--format", choices=list(WRITERS), default="csv", help="output file format")
+    parser.add_argument("-b", "--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per output batch")
+    args = parser.parse_args()
+    run(args.file_name, args.format, args.batch_size)
+
+
+# call our main function to parse command line args
+if __name__ == '__main__':
+    main()
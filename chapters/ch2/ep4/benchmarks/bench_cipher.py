@@ -0,0 +1,128 @@
+"""
+Benchmark: the per-character ciphers of the exercises vs the streaming ciphers of src/cipher.py.
+
+Writes a text file of --size-mb (secret_message.txt and some non-ASCII text, repeated) and measures the MB/s of:
+
+    - naive caesar:   read the whole file, shift one character at a time with the alphabet's `.find()`
+    - naive reverse:  read the whole file, copy the characters from the last to the first
+    - streaming caesar and reverse (src/cipher.py)
+
+The naive versions only process the first --naive-mb (about a million characters per MB) of the file, since they
+are much slower. The outputs are checked against each other.
+
+usage: python bench_cipher.py [--size-mb 200] [--naive-mb 10] [--chunk-size 1048576]
+"""
+
+import os
+import sys
+import time
+import string
+import argparse
+import tempfile
+
+# the benchmarks run from the source tree: make the ch2/ep4 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from cipher import CHUNK_SIZE, caesar_file, reverse_file
+
+
+SECRET_MESSAGE = os.path.abspath(os.path.join(os.path.dirname(__file__), "../secret_message.txt"))
+KEY = 3
+
+
+# the exercise versions -----------------------------------------------------------------------------------------
+
+def caesar_naive(text:str, key:int) -> str:
+    """shifts each letter by its index in the alphabet (secret_cipher2.md)"""
+    output = []
+    for char in text:
+        alphabet = string.ascii_lowercase if char.islower() else string.ascii_uppercase
+        index = alphabet.find(char)
+        output.append(alphabet[(index + key) % 26] if index >= 0 else char)
+    return "".join(output)
+
+
+def reverse_naive(text:str) -> str:
+    """copies the characters from the last to the first (secret_cipher1.md)"""
+    output = []
+    for index in range(len(text) - 1, -1, -1):
+        output.append(text[index])
+    return "".join(output)
+
+
+def naive_file(input_file:str, output_file:str, transform, limit:int) -> int:
+    with open(input_file, "r", encoding="utf-8", newline="") as source:
+        text = source.read(limit)
+    with open(output_file, "w", encoding="utf-8", newline="") as output:
+        output.write(transform(text))
+    return len(text.encode("utf-8"))
+
+
+# benchmark -----------------------------------------------------------------------------------------------------
+
+def write_text(size_mb:float) -> str:
+    """writes a temp text file of about size_mb"""
+    with open(SECRET_MESSAGE, encoding="utf-8") as message:
+        line = message.read().strip() + ". Ça coûte 5 € — naïve café!\n"
+    block = line * max(1024 * 1024 // len(line), 1)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt", delete=False) as tmp:
+        for _ in range(max(int(size_mb * 1024 * 1024) // len(block.encode("utf-8")), 1)):
+            tmp.write(block)
+    return tmp.name
+
+
+def measure(label:str, func) -> float:
+    start = time.perf_counter()
+    processed = func()
+    elapsed = time.perf_counter() - start
+    size_mb = processed / 1024 / 1024
+    print(f"  {label:<20s} {size_mb:8.1f} MB {elapsed:8.2f} s {size_mb / elapsed:10.1f} MB/s")
+    return processed / elapsed
+
+
+def same_prefix(file_name:str, other:str, size:int) -> bool:
+    with open(file_name, "rb") as first, open(other, "rb") as second:
+        return first.read(size) == second.read(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cipher throughput benchmark")
+    parser.add_argument("--size-mb", type=float, default=200, help="text file size in MB")
+    parser.add_argument("--naive-mb", type=float, default=10, help="MB processed by the naive versions")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="bytes per chunk")
+    args = parser.parse_args()
+
+    text_file = write_text(args.size_mb)
+    outputs = {name: tempfile.mktemp(suffix=f"_{name}.txt") for name in ("naive", "caesar", "reverse", "decrypted")}
+    try:
+        size = os.path.getsize(text_file)
+        naive_chars = int(args.naive_mb * 1024 * 1024)
+        print(f"text file: {size / 1024 / 1024:.1f} MB")
+
+        print("caesar:")
+        naive = measure("naive", lambda: naive_file(text_file, outputs["naive"],
+                                                    lambda text: caesar_naive(text, KEY), naive_chars))
+        naive_size = os.path.getsize(outputs["naive"])
+        streaming = measure("streaming", lambda: caesar_file(text_file, outputs["caesar"], KEY,
+                                                             chunk_size=args.chunk_size))
+        caesar_file(outputs["caesar"], outputs["decrypted"], KEY, decrypt=True, chunk_size=args.chunk_size)
+        same = same_prefix(outputs["naive"], outputs["caesar"], naive_size)
+        print(f"  speedup {streaming / naive:.0f}x, same output: {same}, "
+              f"decrypts back: {same_prefix(text_file, outputs['decrypted'], size)}")
+
+        print("reverse:")
+        # the naive version reverses the start of the file: compare it with the end of the streaming output
+        naive = measure("naive", lambda: naive_file(text_file, outputs["naive"], reverse_naive, naive_chars))
+        naive_size = os.path.getsize(outputs["naive"])
+        streaming = measure("streaming", lambda: reverse_file(text_file, outputs["reverse"], args.chunk_size))
+        with open(outputs["reverse"], "rb") as reversed_output, open(outputs["naive"], "rb") as naive_output:
+            reversed_output.seek(size - naive_size)
+            same = reversed_output.read() == naive_output.read()
+        print(f"  speedup {streaming / naive:.0f}x, same output: {same}")
+    finally:
+        for file_name in [text_file, *outputs.values()]:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+
+if __name__ == "__main__":
+    main()
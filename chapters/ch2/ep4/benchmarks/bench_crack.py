@@ -0,0 +1,97 @@
+"""
+Benchmark: cracking a Caesar cipher file (src/crack_caesar.py) with one process vs worker processes.
+
+Writes an encrypted text file of --size-mb (the README files, repeated) and measures:
+
+    - full count:  every byte of the file, in one process and with --workers processes. The letter counts must be the
+                   same: the sampled slices cover the whole file when --sample-mb is larger than the file
+    - sampled:     --sample-mb of the file, in one process and with --workers processes
+    - confidence:  the key and confidence found from the first N letters of the text, for a few N
+
+usage: python bench_crack.py [--size-mb 500] [--sample-mb 64] [--workers 4]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+
+# the benchmarks run from the source tree: make the ch2/ep4 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from cipher import caesar_table
+from crack_caesar import DEFAULT_SAMPLE_MB, confidence, crack, letter_histogram, score_keys
+
+
+TEXT_FILES = [os.path.abspath(os.path.join(os.path.dirname(__file__), "..", name))
+              for name in ("README.MD", "secret_cipher1.md", "secret_cipher2.md")]
+KEY = 11
+PREFIX_LETTERS = (10, 20, 41, 100, 1000)
+
+
+def read_text() -> bytes:
+    text = b""
+    for file_name in TEXT_FILES:
+        with open(file_name, "rb") as source:
+            text += source.read()
+    return text
+
+
+def write_encrypted(text:bytes, size_mb:float) -> str:
+    """writes a temp file of about size_mb: the text encrypted with KEY, repeated"""
+    block = text.translate(caesar_table(KEY))
+    block = block * max(1024 * 1024 // len(block), 1)
+    with tempfile.NamedTemporaryFile("wb", suffix=".txt", delete=False) as tmp:
+        for _ in range(max(int(size_mb * 1024 * 1024) // len(block), 1)):
+            tmp.write(block)
+    return tmp.name
+
+
+def measure(label:str, file_name:str, workers:int, sample_mb:float) -> dict:
+    start = time.perf_counter()
+    result = crack(file_name, workers, sample_mb)
+    elapsed = time.perf_counter() - start
+    sampled_mb = result["sampled_bytes"] / 1024 / 1024
+    print(f"  {label:<12s} {workers:3d} workers {sampled_mb:8.1f} MB {elapsed:8.2f} s {sampled_mb / elapsed:10.1f} MB/s"
+          f"   key {result['key']:2d}  confidence {result['confidence']:.4f}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caesar cipher cracking benchmark")
+    parser.add_argument("--size-mb", type=float, default=500, help="encrypted file size in MB")
+    parser.add_argument("--sample-mb", type=float, default=DEFAULT_SAMPLE_MB, help="MB of the file to sample")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    args = parser.parse_args()
+
+    text = read_text()
+    encrypted_file = write_encrypted(text, args.size_mb)
+    try:
+        size_mb = os.path.getsize(encrypted_file) / 1024 / 1024
+        print(f"encrypted file: {size_mb:.1f} MB, key {KEY}")
+
+        print("full count:")
+        single = measure("full", encrypted_file, 1, size_mb + 1)
+        parallel = measure("full", encrypted_file, args.workers, size_mb + 1)
+        print(f"  same letter count: {single['letters'] == parallel['letters']}, "
+              f"same ranking: {single['ranking'] == parallel['ranking']}")
+
+        print("sampled:")
+        for workers in sorted({1, args.workers}):
+            result = measure("sampled", encrypted_file, workers, args.sample_mb)
+            assert result["key"] == KEY, f"found key {result['key']} with {workers} workers"
+
+        print("confidence by text length:")
+        letters = re.sub(rb"[^a-zA-Z]", b"", text).translate(caesar_table(KEY))
+        for count in PREFIX_LETTERS:
+            scores = score_keys(letter_histogram(letters[:count]))
+            probabilities = confidence(scores)
+            best = int(probabilities.argmax())
+            print(f"  {count:6d} letters   key {best:2d}  confidence {probabilities[best]:.4f}")
+    finally:
+        os.remove(encrypted_file)
+
+
+if __name__ == "__main__":
+    main()
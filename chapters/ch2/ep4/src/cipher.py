@@ -0,0 +1,163 @@
+"""
+Streaming reverse and Caesar ciphers for files of any size.
+
+The exercises (`secret_cipher1.md` and `secret_cipher2.md`) read the whole file and transform it one character at a
+time. This script streams the file in fixed-size chunks instead, so memory doesn't grow with the file:
+
+    - caesar: every chunk is shifted with `bytes.translate()` and a translation table built once per key (a 256
+      byte lookup table: one C loop per chunk instead of one python step per character). Only the letters a-z and
+      A-Z are shifted; spaces, punctuation and non-ASCII characters (utf-8 bytes are all >= 128) are unchanged.
+    - reverse: the file is read in chunks from the end back to the start, and each chunk is written reversed.
+      Chunks are reversed by characters, not bytes, so utf-8 characters stay valid.
+
+usage: python cipher.py caesar secret_message.txt secret_message_caesar.txt --key 3 [--decrypt]
+       python cipher.py reverse secret_message.txt secret_message_reversed.txt
+"""
+
+# imports
+import os
+import sys
+import argparse
+
+
+ALPHABET_SIZE = 26
+CHUNK_SIZE = 1024 * 1024
+
+
+def caesar_table(key:int) -> bytes:
+    """
+    Builds the `bytes.translate()` table of a Caesar cipher key.
+
+    Args:
+        key (int): shift of each letter; a negative key (or a key > 25) wraps around the alphabet
+
+    Returns:
+        bytes: 256 byte translation table
+    """
+    shift = key % ALPHABET_SIZE
+    lower = bytes(range(ord("a"), ord("a") + ALPHABET_SIZE))
+    upper = lower.upper()
+    return bytes.maketrans(lower + upper, lower[shift:] + lower[:shift] + upper[shift:] + upper[:shift])
+
+
+def caesar_file(input_file:str, output_file:str, key:int, decrypt:bool=False, chunk_size:int=CHUNK_SIZE) -> int:
+    """
+    Encrypts (or decrypts) a file with the Caesar cipher, one chunk at a time.
+
+    Args:
+        input_file (str): input file path
+        output_file (str): output file path
+        key (int): secret key
+        decrypt (bool, optional): decrypt instead of encrypt. Defaults to False.
+        chunk_size (int, optional): bytes per chunk. Defaults to CHUNK_SIZE.
+
+    Returns:
+        int: number of bytes written
+    """
+    table = caesar_table(-key if decrypt else key)
+    written = 0
+    with open(input_file, "rb") as source, open(output_file, "wb") as output:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            written += output.write(chunk.translate(table))
+    return written
+
+
+def _is_continuation(byte:int) -> bool:
+    # utf-8 continuation bytes are 10xxxxxx
+    return byte & 0xC0 == 0x80
+
+
+def reverse_chunks(source, chunk_size:int=CHUNK_SIZE):
+    """
+    Yields the reversed contents of a binary file, reading chunks from the end of the file back to the start.
+
+    A chunk can start in the middle of a utf-8 character: its continuation bytes are carried over to the next
+    (earlier) chunk, and only whole characters are reversed.
+
+    Args:
+        source: binary file open for reading
+        chunk_size (int, optional): bytes per chunk. Defaults to CHUNK_SIZE.
+
+    Yields:
+        bytes: reversed chunks
+    """
+    position = source.seek(0, os.SEEK_END)
+    carry = b""
+    while position > 0:
+        start = max(position - chunk_size, 0)
+        source.seek(start)
+        chunk = source.read(position - start) + carry
+        position = start
+        carry = b""
+        if chunk.isascii():
+            yield chunk[::-1]
+            continue
+        if position > 0:
+            # leave the bytes of a character that started in the previous chunk for the next read
+            first = 0
+            while first < len(chunk) and first < 4 and _is_continuation(chunk[first]):
+                first += 1
+            carry, chunk = chunk[:first], chunk[first:]
+        yield chunk.decode("utf-8")[::-1].encode("utf-8")
+    if carry:
+        # invalid utf-8 at the start of the file
+        raise UnicodeDecodeError("utf-8", carry, 0, len(carry), "invalid start byte")
+
+
+def reverse_file(input_file:str, output_file:str, chunk_size:int=CHUNK_SIZE) -> int:
+    """
+    Writes the characters of a utf-8 file in reverse order (the reverse cipher), reading the file backwards in
+    chunks.
+
+    Args:
+        input_file (str): input file path
+        output_file (str): output file path
+        chunk_size (int, optional): bytes per chunk. Defaults to CHUNK_SIZE.
+
+    Returns:
+        int: number of bytes written
+    """
+    written = 0
+    with open(input_file, "rb") as source, open(output_file, "wb") as output:
+        for chunk in reverse_chunks(source, chunk_size):
+            written += output.write(chunk)
+    return written
+
+
+def main():
+    """
+    The main execution method. Get command line args and run the cipher.
+    """
+    parser = argparse.ArgumentParser(description="Streaming reverse and Caesar ciphers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    caesar = commands.add_parser("caesar", help="encrypt or decrypt with the Caesar cipher")
+    caesar.add_argument("input_file")
+    caesar.add_argument("output_file")
+    caesar.add_argument("-k", "--key", type=int, required=True, help="secret key (1-25)")
+    caesar.add_argument("-d", "--decrypt", action="store_true", help="decrypt instead of encrypt")
+    reverse = commands.add_parser("reverse", help="reverse the file (the reverse cipher)")
+    reverse.add_argument("input_file")
+    reverse.add_argument("output_file")
+    for command in (caesar, reverse):
+        command.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="bytes per chunk")
+    args = parser.parse_args()
+
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be positive")
+    try:
+        if args.command == "caesar":
+            written = caesar_file(args.input_file, args.output_file, args.key, args.decrypt, args.chunk_size)
+        else:
+            written = reverse_file(args.input_file, args.output_file, args.chunk_size)
+    except (FileNotFoundError, UnicodeDecodeError) as err:
+        print(f"Error: {err}")
+        sys.exit(1)
+    print(f"Wrote {written} bytes to {args.output_file}")
+
+
+# call our main function to parse command line args
+if __name__ == '__main__':
+    main()
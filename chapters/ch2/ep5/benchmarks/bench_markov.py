@@ -0,0 +1,141 @@
+"""
+Benchmark: the course's nested dict Markov generator vs the vectorized CSR model (src/markov.py).
+
+Builds both models from a corpus and times generating words with each. The dict version picks the next word by
+subtracting the follower counts one by one (weighted_prob_algorithm.md); the CSR model uses a binary search (cdf)
+or the alias method.
+
+The corpus is either sonnets.txt repeated up to --size-mb, or (the default) a synthetic text of --size-mb with
+Zipf distributed words. Repeating the sonnets keeps the sonnets' small vocabulary; the Zipf text has common words
+with thousands of followers, like real large corpora.
+
+usage: python bench_markov.py [--size-mb 100] [--corpus zipf|sonnets] [--words 100000] [--memory]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+# the benchmarks run from the source tree: make the ch2/ep5 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from markov import MarkovModel
+
+
+SONNETS = os.path.abspath(os.path.join(os.path.dirname(__file__), "../sonnets.txt"))
+
+
+# the course version --------------------------------------------------------------------------------------------
+
+def markov_dict(file_name:str) -> dict:
+    """builds the nested word_freqs dict (input_to_nested_dict.md)"""
+    word_freqs = {}
+    with open(file_name) as file_object:
+        past_word = ""
+        for line in file_object:
+            for word in line.split():
+                if past_word in word_freqs:
+                    frequency = word_freqs[past_word]
+                else:
+                    frequency = {}
+                    word_freqs[past_word] = frequency
+                frequency[word] = frequency.get(word, 0) + 1
+                past_word = word
+    return word_freqs
+
+
+def weighted_choice(frequency:dict, rnd:random.Random) -> str:
+    """picks a key by subtracting the values from a random number (weighted_prob_algorithm.md)"""
+    number = rnd.random() * sum(frequency.values())
+    for word, count in frequency.items():
+        if number - count < 0:
+            return word
+        number -= count
+    return word
+
+
+def generate_dict(word_freqs:dict, num_words:int, seed:int) -> list:
+    rnd = random.Random(seed)
+    keys = list(word_freqs)
+    word = rnd.choice(keys)
+    output = [word]
+    while len(output) < num_words:
+        frequency = word_freqs.get(word)
+        word = weighted_choice(frequency, rnd) if frequency else rnd.choice(keys)
+        output.append(word)
+    return output
+
+
+# corpus --------------------------------------------------------------------------------------------------------
+
+def write_corpus(kind:str, size_mb:float) -> str:
+    """writes a temp corpus file of about size_mb"""
+    size = int(size_mb * 1024 * 1024)
+    tmp = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+    with tmp:
+        if kind == "sonnets":
+            with open(SONNETS, encoding="utf-8") as sonnets:
+                text = sonnets.read()
+            for _ in range(max(size // len(text), 1)):
+                tmp.write(text)
+        else:
+            # zipf distributed words from a 200k words vocabulary, 12 words per line
+            rng = np.random.default_rng(42)
+            vocab = np.array([f"w{i}" for i in range(200_000)])
+            written = 0
+            while written < size:
+                ids = np.minimum(rng.zipf(1.2, 120_000), len(vocab)) - 1
+                lines = vocab[ids].reshape(-1, 12)
+                chunk = "\n".join(" ".join(line) for line in lines) + "\n"
+                tmp.write(chunk)
+                written += len(chunk)
+    return tmp.name
+
+
+def measure(label:str, func, memory:bool):
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    held = None
+    if memory:
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"  {label:<28s} {elapsed:8.2f} s" + (f"   memory held {held / 1024 / 1024:8.1f} MB" if memory else ""))
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markov generator benchmark")
+    parser.add_argument("--size-mb", type=float, default=100, help="corpus size in MB")
+    parser.add_argument("--corpus", choices=["zipf", "sonnets"], default="zipf", help="corpus text")
+    parser.add_argument("-w", "--words", type=int, default=100_000, help="number of words to generate")
+    parser.add_argument("-o", "--order", type=int, default=1, help="order of the CSR model (the dict model is order 1)")
+    parser.add_argument("--memory", action="store_true", help="measure the memory held by each model (slower)")
+    args = parser.parse_args()
+
+    corpus = write_corpus(args.corpus, args.size_mb)
+    try:
+        print(f"corpus: {args.corpus}, {os.path.getsize(corpus) / 1024 / 1024:.1f} MB")
+        print("build:")
+        word_freqs, _ = measure("dict (markov_dict)", lambda: markov_dict(corpus), args.memory)
+        model, _ = measure(f"csr (order {args.order})", lambda: MarkovModel.from_file(corpus, args.order), args.memory)
+        print(f"generate {args.words} words:")
+        _, dict_s = measure("dict (subtract counts)", lambda: generate_dict(word_freqs, args.words, 1), False)
+        _, cdf_s = measure("csr cdf (binary search)", lambda: model.generate(args.words, seed=1), False)
+        measure("csr alias tables", model.build_alias, False)
+        _, alias_s = measure("csr alias (O(1))", lambda: model.generate(args.words, seed=1, sampler="alias"), False)
+        for label, seconds in [("dict", dict_s), ("csr cdf", cdf_s), ("csr alias", alias_s)]:
+            print(f"  {label:<28s} {seconds / args.words * 1e6:8.2f} us/word")
+    finally:
+        os.remove(corpus)
+
+
+if __name__ == "__main__":
+    main()
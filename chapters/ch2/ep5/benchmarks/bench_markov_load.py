@@ -0,0 +1,107 @@
+"""
+Benchmark: cold start and memory sharing of the binary Markov model file (`MarkovModel.save()` / `load()`).
+
+Each measurement runs in a new process (like a new generation run). The time to the first generated words is
+measured when the model is rebuilt from the text, read from the model file, or memory-mapped from the model file.
+Then --processes generator processes hold the same model at the same time, and the memory of each process is
+reported: Rss counts the shared pages in every process, Pss divides them between the processes that share them
+(Linux only).
+
+usage: python bench_markov_load.py [--size-mb 100] [--corpus zipf|sonnets] [--order 1] [--processes 4]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+# the benchmarks run from the source tree: make the ch2/ep5 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from markov import MarkovModel
+from bench_markov import write_corpus
+
+
+MODES = ("text", "read", "mmap")
+
+
+def memory_mb() -> tuple:
+    """returns the (rss, pss) of this process in MB; (None, None) if /proc/self/smaps_rollup is missing"""
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            fields = dict(line.split(":", 1) for line in smaps if ":" in line)
+    except OSError:
+        return None, None
+    return tuple(int(fields[name].split()[0]) / 1024 for name in ("Rss", "Pss"))
+
+
+def generator(mode:str, file_name:str, order:int, num_words:int, barrier, results) -> None:
+    """loads the model, generates words, and reports its timing and memory while all the generators are running"""
+    start = time.perf_counter()
+    if mode == "text":
+        model = MarkovModel.from_file(file_name, order)
+    else:
+        model = MarkovModel.load(file_name, mmap_file=(mode == "mmap"))
+    model.generate(num_words, seed=os.getpid())
+    elapsed = time.perf_counter() - start
+    # touch every array, like a long running generator eventually does
+    for values in (model.state_words, model.indptr, model.next_words, model.next_state, model.cumulative):
+        int(values.sum())
+    barrier.wait()
+    results.put((elapsed, *memory_mb()))
+    # keep the model until every process has measured its memory
+    barrier.wait()
+
+
+def run_generators(mode:str, file_name:str, order:int, num_words:int, processes:int) -> list:
+    context = multiprocessing.get_context("spawn")
+    barrier, results = context.Barrier(processes), context.Queue()
+    workers = [context.Process(target=generator, args=(mode, file_name, order, num_words, barrier, results))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    measurements = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return measurements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markov model file load benchmark")
+    parser.add_argument("--size-mb", type=float, default=100, help="corpus size in MB")
+    parser.add_argument("--corpus", choices=["zipf", "sonnets"], default="zipf", help="corpus text")
+    parser.add_argument("-o", "--order", type=int, default=1, help="number of words in a state")
+    parser.add_argument("-w", "--words", type=int, default=100, help="number of words to generate")
+    parser.add_argument("-p", "--processes", type=int, default=4, help="number of generators sharing the model")
+    args = parser.parse_args()
+
+    corpus = write_corpus(args.corpus, args.size_mb)
+    model_file = tempfile.mktemp(suffix=".model")
+    try:
+        size = MarkovModel.from_file(corpus, args.order).save(model_file)
+        print(f"corpus: {args.corpus}, {os.path.getsize(corpus) / 1024 / 1024:.1f} MB; "
+              f"model file: {size / 1024 / 1024:.1f} MB")
+        print(f"time to the first {args.words} words (new process):")
+        for mode in MODES:
+            source = corpus if mode == "text" else model_file
+            (elapsed, _, _), = run_generators(mode, source, args.order, args.words, 1)
+            print(f"  {mode:<6s} {elapsed:10.3f} s")
+
+        print(f"memory per process, {args.processes} processes holding the model:")
+        for mode in ("read", "mmap"):
+            measurements = run_generators(mode, model_file, args.order, args.words, args.processes)
+            rss = [rss for _, rss, _ in measurements if rss is not None]
+            pss = [pss for _, _, pss in measurements if pss is not None]
+            if not rss:
+                print("  (memory is only reported on Linux)")
+                break
+            print(f"  {mode:<6s} rss {sum(rss) / len(rss):8.1f} MB   pss {sum(pss) / len(pss):8.1f} MB")
+    finally:
+        for file_name in (corpus, model_file):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: building the Markov model in parallel (src/markov_parallel.py) and loading the binary model file.
+
+Times building the model with the course's nested dict version, the single process CSR build, and the parallel
+map-reduce build with 1, 2, 4, ... workers (up to --max-workers; the number of CPUs by default). Checks that the
+parallel model is the same as the single process model. Then compares saving and loading the model file against
+pickling the `word_freqs` dict.
+
+usage: python bench_markov_parallel.py [--size-mb 200] [--corpus zipf|sonnets] [--order 1]
+                                      [--max-workers 8] [--shards-per-worker 2]
+"""
+
+import os
+import sys
+import time
+import pickle
+import argparse
+import tempfile
+
+import numpy as np
+
+# the benchmarks run from the source tree: make the ch2/ep5 src folder importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from markov import MarkovModel
+from markov_parallel import build_parallel
+from bench_markov import markov_dict, write_corpus
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def same_model(model:MarkovModel, other:MarkovModel) -> bool:
+    arrays = ["state_words", "indptr", "next_words", "counts", "next_state"]
+    return model.words == other.words and all(np.array_equal(getattr(model, name), getattr(other, name))
+                                              for name in arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel Markov build benchmark")
+    parser.add_argument("--size-mb", type=float, default=200, help="corpus size in MB")
+    parser.add_argument("--corpus", choices=["zipf", "sonnets"], default="zipf", help="corpus text")
+    parser.add_argument("-o", "--order", type=int, default=1, help="number of words in a state")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="largest number of workers")
+    parser.add_argument("--shards-per-worker", type=int, default=2, help="shards per worker process")
+    args = parser.parse_args()
+
+    corpus = write_corpus(args.corpus, args.size_mb)
+    model_file = tempfile.mktemp(suffix=".bin")
+    pickle_file = tempfile.mktemp(suffix=".pickle")
+    try:
+        size_mb = os.path.getsize(corpus) / 1024 / 1024
+        print(f"corpus: {args.corpus}, {size_mb:.1f} MB, {os.cpu_count()} CPUs")
+        print("build:")
+        word_freqs, seconds = timed(lambda: markov_dict(corpus))
+        print(f"  {'dict (markov_dict)':<24s} {seconds:8.2f} s  {size_mb / seconds:8.1f} MB/s")
+        model, seconds = timed(lambda: MarkovModel.from_file(corpus, args.order))
+        print(f"  {'csr (single process)':<24s} {seconds:8.2f} s  {size_mb / seconds:8.1f} MB/s")
+        workers = 1
+        while workers <= args.max_workers:
+            shards = workers * args.shards_per_worker
+            parallel, seconds = timed(lambda: build_parallel(corpus, args.order, workers, shards))
+            label = f"parallel ({workers} workers)"
+            print(f"  {label:<24s} {seconds:8.2f} s  {size_mb / seconds:8.1f} MB/s  "
+                  f"{shards} shards, same model: {same_model(model, parallel)}")
+            workers *= 2
+
+        print("save / load:")
+        size, seconds = timed(lambda: model.save(model_file))
+        print(f"  {'model file save':<24s} {seconds:8.2f} s  {size / 1024 / 1024:8.1f} MB")
+        _, seconds = timed(lambda: MarkovModel.load(model_file))
+        print(f"  {'model file load':<24s} {seconds:8.2f} s")
+        with open(pickle_file, "wb") as output:
+            _, seconds = timed(lambda: pickle.dump(word_freqs, output, protocol=pickle.HIGHEST_PROTOCOL))
+        print(f"  {'pickle word_freqs save':<24s} {seconds:8.2f} s  {os.path.getsize(pickle_file) / 1024 / 1024:8.1f} MB")
+        with open(pickle_file, "rb") as source:
+            _, seconds = timed(lambda: pickle.load(source))
+        print(f"  {'pickle word_freqs load':<24s} {seconds:8.2f} s")
+    finally:
+        for file_name in (corpus, model_file, pickle_file):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+
+if __name__ == "__main__":
+    main()
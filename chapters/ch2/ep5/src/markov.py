@@ -0,0 +1,542 @@
+"""
+Vectorized Markov chain text generator.
+
+The course version of the generator (see README.md) keeps the word frequencies in nested dicts
+(`{word: {next_word: count}}`) and picks the next word by subtracting the counts one by one: O(followers) python
+steps per generated word. This module builds the same model with numpy:
+
+    - every word is replaced by an integer id (`Vocabulary`)
+    - a state is the last `order` words (order 1 is the course version: the last word)
+    - the transition counts are stored as a sparse CSR (compressed sparse row) matrix: the followers of state `s`
+      are `next_words[indptr[s]:indptr[s + 1]]` with their `counts`
+    - `cumulative` holds the running sum of all the counts, so picking a follower is a binary search over the
+      state's slice of `cumulative`: O(log followers). The alias method (`sampler="alias"`) picks in O(1).
+    - `next_state` holds the state reached after each transition, so generating text never builds n-gram tuples
+
+A model can be saved into a binary model file (`MarkovModel.save()`): the vocabulary, the CSR arrays and the
+cumulative counts, each stored raw and aligned so they can be memory-mapped. `MarkovModel.load(mmap_file=True)` maps
+the file instead of reading it: generation starts right away, only the pages that are used are read from disk, and
+processes that map the same file share one read-only copy in the OS page cache.
+
+usage: python markov.py ../sonnets.txt [--order 2] [--words 100] [--seed 42] [--sampler cdf|alias] [--save model]
+       python markov.py sonnets.model [--words 100]       (a model file is memory-mapped)
+"""
+
+import json
+import mmap
+import random
+import struct
+import argparse
+from array import array
+from bisect import bisect_right
+
+import numpy as np
+
+
+SAMPLERS = ("cdf", "alias")
+
+# model file: magic, format version, header length, JSON header, then the raw arrays (aligned to ALIGNMENT bytes)
+MODEL_MAGIC = b"MRKV"
+MODEL_VERSION = 2
+MODEL_PREAMBLE = struct.Struct("<4sII")
+ALIGNMENT = 64
+
+
+def _aligned(offset:int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _row_keys(rows:np.ndarray, vocab_size:int) -> np.ndarray:
+    """
+    Returns one sortable key per row of word ids: the ids packed into an int64 when they fit (sorted like the rows),
+    otherwise the bytes of the row.
+    """
+    rows = np.ascontiguousarray(rows, dtype=np.int32)
+    width = rows.shape[1]
+    vocab_size = max(vocab_size, 1)
+    if vocab_size ** width < 2 ** 63:
+        keys = rows[:, 0].astype(np.int64)
+        for column in range(1, width):
+            keys *= vocab_size
+            keys += rows[:, column]
+        return keys
+    return rows.view(np.dtype((np.void, rows.dtype.itemsize * width))).ravel()
+
+
+def count_ngrams(word_ids:np.ndarray, order:int, vocab_size:int) -> tuple:
+    """
+    Counts the n-grams of `order + 1` words (a state and its next word) of a sequence of word ids.
+
+    Args:
+        word_ids (np.ndarray): word ids of the text, in order
+        order (int): number of words in a state
+        vocab_size (int): number of words in the vocabulary
+
+    Returns:
+        tuple: (grams, counts) the (num_grams, order + 1) unique n-grams and their int64 counts
+    """
+    if order < 1:
+        raise ValueError(f"Invalid order: {order}")
+    word_ids = np.asarray(word_ids, dtype=np.int32)
+    if len(word_ids) <= order:
+        return np.zeros((0, order + 1), dtype=np.int32), np.zeros(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(word_ids, order + 1)
+    _, first, counts = np.unique(_row_keys(windows, vocab_size), return_index=True, return_counts=True)
+    return windows[first], counts.astype(np.int64)
+
+
+def aggregate_ngrams(grams:np.ndarray, counts:np.ndarray, vocab_size:int) -> tuple:
+    """
+    Adds up the counts of repeated n-grams (for example after concatenating the counts of two shards).
+
+    Args:
+        grams (np.ndarray): (num_grams, order + 1) n-grams; may repeat
+        counts (np.ndarray): count of each n-gram
+        vocab_size (int): number of words in the vocabulary
+
+    Returns:
+        tuple: (grams, counts) the unique n-grams and their total counts
+    """
+    _, first, inverse = np.unique(_row_keys(grams, vocab_size), return_index=True, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=counts, minlength=len(first))
+    return grams[first], totals.astype(np.int64)
+
+
+class Vocabulary:
+    """
+    Maps words to integer ids (0, 1, 2, ...) and back.
+    """
+
+    def __init__(self, words:list=()):
+        self.words = []
+        self.ids = {}
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, word:str) -> int:
+        """returns the id of a word; adds the word if it's new"""
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return word_id
+
+    def encode_lines(self, lines) -> np.ndarray:
+        """
+        Splits lines into words (like the course version: `line.split()`) and encodes them into word ids.
+
+        Args:
+            lines (Iterable): lines of text (for example an open file)
+
+        Returns:
+            np.ndarray: int32 word ids of all the words in order
+        """
+        ids = array("i")
+        ids_get, add = self.ids.get, self.add
+        for line in lines:
+            for word in line.split():
+                word_id = ids_get(word)
+                ids.append(add(word) if word_id is None else word_id)
+        return np.frombuffer(ids, dtype=np.int32)
+
+
+class ModelWords:
+    """
+    Read-only vocabulary of a memory-mapped model file. Words are decoded when they are accessed, and looked up
+    with a binary search over the word ids sorted by word, so opening a model doesn't build a list or a dict of
+    all the words.
+    """
+
+    def __init__(self, data:np.ndarray, offsets:np.ndarray, sorted_ids:np.ndarray):
+        """
+        Args:
+            data (np.ndarray): utf-8 words, each followed by a newline
+            offsets (np.ndarray): byte offset of each word in `data` (and the end of data)
+            sorted_ids (np.ndarray): word ids sorted by their utf-8 bytes
+        """
+        self.data = data
+        self.offsets = offsets
+        self.sorted_ids = sorted_ids
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _bytes(self, word_id:int) -> bytes:
+        # skip the newline after the word
+        return self.data[self.offsets[word_id]:self.offsets[word_id + 1] - 1].tobytes()
+
+    def __getitem__(self, word_id:int) -> str:
+        if not -len(self) <= word_id < len(self):
+            raise IndexError(f"word id out of range: {word_id}")
+        return self._bytes(word_id % len(self)).decode("utf-8")
+
+    def __iter__(self):
+        return (self[word_id] for word_id in range(len(self)))
+
+    def id_of(self, word:str) -> int:
+        """returns the id of a word; or -1 if the word is unknown"""
+        key = word.encode("utf-8")
+        low, high = 0, len(self.sorted_ids)
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(self.sorted_ids[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.sorted_ids) and self._bytes(self.sorted_ids[low]) == key:
+            return int(self.sorted_ids[low])
+        return -1
+
+
+class MarkovModel:
+    """
+    Order-n Markov chain over word ids, stored as CSR transition arrays. See the module docs.
+    """
+
+    def __init__(self, words:list, order:int, state_words:np.ndarray, indptr:np.ndarray, next_words:np.ndarray,
+                 counts:np.ndarray, next_state:np.ndarray, cumulative:np.ndarray=None):
+        """
+        Use `MarkovModel.build()` or `MarkovModel.from_file()` to create a model.
+
+        Args:
+            words (list): vocabulary; word id >> word (a list, or the `ModelWords` of a mapped model file)
+            order (int): number of words in a state
+            state_words (np.ndarray): (num_states, order) word ids of each state, sorted
+            indptr (np.ndarray): CSR row offsets; the transitions of state s are indptr[s]:indptr[s + 1]
+            next_words (np.ndarray): next word id of each transition
+            counts (np.ndarray): number of times each transition was seen
+            next_state (np.ndarray): state reached after each transition
+            cumulative (np.ndarray, optional): running sum of the counts. Defaults to computing it.
+        """
+        self.words = words
+        self.order = order
+        self.state_words = state_words
+        self.indptr = indptr
+        self.next_words = next_words
+        self.counts = counts
+        self.next_state = next_state
+        self.cumulative = cumulative if cumulative is not None else np.cumsum(counts, dtype=np.int64)
+        self._word_ids = None
+        self._alias = None
+
+    @property
+    def num_states(self) -> int:
+        return len(self.indptr) - 1
+
+    @classmethod
+    def build(cls, word_ids:np.ndarray, words:list, order:int=1) -> "MarkovModel":
+        """
+        Counts the transitions of a sequence of word ids.
+
+        Args:
+            word_ids (np.ndarray): word ids of the text, in order
+            words (list): vocabulary; word id >> word
+            order (int, optional): number of words in a state. Defaults to 1.
+
+        Returns:
+            MarkovModel: new model
+        """
+        grams, counts = count_ngrams(word_ids, order, len(words))
+        return cls.from_counts(words, order, grams, counts)
+
+    @classmethod
+    def from_counts(cls, words:list, order:int, grams:np.ndarray, counts:np.ndarray) -> "MarkovModel":
+        """
+        Builds the CSR arrays from n-gram counts (see `count_ngrams()`).
+
+        Args:
+            words (list): vocabulary; word id >> word
+            order (int): number of words in a state
+            grams (np.ndarray): (num_grams, order + 1) unique n-grams: the state words and the next word
+            counts (np.ndarray): number of times each n-gram was seen
+
+        Returns:
+            MarkovModel: new model
+        """
+        if order < 1:
+            raise ValueError(f"Invalid order: {order}")
+        num_grams = len(grams)
+        if num_grams == 0:
+            # not enough words for a single transition
+            empty = np.zeros(0, dtype=np.int32)
+            return cls(words, order, np.zeros((0, order), dtype=np.int32), np.zeros(1, dtype=np.int64),
+                       empty, empty, empty)
+
+        # the states are the first and the last `order` words of every n-gram: a transition goes from the first
+        # state to the last one
+        states = np.concatenate([grams[:, :order], grams[:, 1:]])
+        state_keys = _row_keys(states, len(words))
+        _, first, state_ids = np.unique(state_keys, return_index=True, return_inverse=True)
+        state_ids = state_ids.ravel().astype(np.int32)
+        state_words = states[first]
+        if state_keys.dtype.kind == "V":
+            # byte keys don't sort like the word ids: sort the states so `state_of()` can binary search them
+            by_words = np.lexsort(state_words.T[::-1])
+            ranks = np.empty(len(by_words), dtype=np.int32)
+            ranks[by_words] = np.arange(len(by_words), dtype=np.int32)
+            state_words, state_ids = state_words[by_words], ranks[state_ids]
+        state_in, state_out = state_ids[:num_grams], state_ids[num_grams:]
+
+        # sort the transitions by (state, next word)
+        order_by = np.lexsort((grams[:, order], state_in))
+        indptr = np.zeros(len(state_words) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(state_in, minlength=len(state_words)), out=indptr[1:])
+        return cls(words, order, state_words, indptr,
+                   next_words=grams[order_by, order].astype(np.int32),
+                   counts=counts[order_by].astype(np.int32),
+                   next_state=state_out[order_by])
+
+    @classmethod
+    def from_file(cls, file_name:str, order:int=1) -> "MarkovModel":
+        """builds a model from a text file"""
+        vocab = Vocabulary()
+        with open(file_name, "r", encoding="utf-8") as text_file:
+            word_ids = vocab.encode_lines(text_file)
+        return cls.build(word_ids, vocab.words, order)
+
+    def save(self, file_name:str) -> int:
+        """
+        Writes the model into a compact binary file: a small JSON header followed by the raw arrays, each aligned
+        so it can be memory-mapped. The vocabulary is stored as one newline separated utf-8 block (words never
+        contain whitespace), the byte offset of every word, and the word ids sorted by word (for lookups).
+
+        Args:
+            file_name (str): model file path
+
+        Returns:
+            int: file size in bytes
+        """
+        encoded = [word.encode("utf-8") for word in self.words]
+        vocab_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        # +1 for the newline after every word
+        np.cumsum([len(word) + 1 for word in encoded], out=vocab_offsets[1:])
+        arrays = {
+            "vocab": np.frombuffer(b"\n".join(encoded) + b"\n" if encoded else b"", dtype=np.uint8),
+            "vocab_offsets": vocab_offsets,
+            "vocab_sorted": np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.int32),
+            "state_words": self.state_words,
+            "indptr": self.indptr,
+            "next_words": self.next_words,
+            "counts": self.counts,
+            "next_state": self.next_state,
+            "cumulative": self.cumulative,
+        }
+        header = {"order": self.order, "num_words": len(self.words), "arrays": {}}
+        offset = 0
+        for name, values in arrays.items():
+            header["arrays"][name] = {"dtype": values.dtype.str, "shape": list(values.shape), "offset": offset}
+            offset = _aligned(offset + values.nbytes)
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = _aligned(MODEL_PREAMBLE.size + len(header_bytes))
+
+        with open(file_name, "wb") as model_file:
+            model_file.write(MODEL_PREAMBLE.pack(MODEL_MAGIC, MODEL_VERSION, len(header_bytes)))
+            model_file.write(header_bytes)
+            for name, values in arrays.items():
+                model_file.seek(data_start + header["arrays"][name]["offset"])
+                model_file.write(np.ascontiguousarray(values).tobytes())
+            model_file.truncate(data_start + offset)
+        return data_start + offset
+
+    @classmethod
+    def load(cls, file_name:str, mmap_file:bool=False) -> "MarkovModel":
+        """
+        Reads a model file written by `save()`.
+
+        Args:
+            file_name (str): model file path
+            mmap_file (bool, optional): memory-map the file instead of reading it. The arrays are read-only and
+                                        are loaded from disk as they are used. Defaults to False.
+
+        Returns:
+            MarkovModel: the model
+
+        Raises:
+            ValueError: the file is not a model file (or was written by another format version)
+        """
+        with open(file_name, "rb") as model_file:
+            preamble = model_file.read(MODEL_PREAMBLE.size)
+            if len(preamble) < MODEL_PREAMBLE.size:
+                raise ValueError(f"Not a Markov model file: {file_name}")
+            magic, version, header_size = MODEL_PREAMBLE.unpack(preamble)
+            if magic != MODEL_MAGIC or version != MODEL_VERSION:
+                raise ValueError(f"Not a Markov model file (version {MODEL_VERSION}): {file_name}")
+            header = json.loads(model_file.read(header_size))
+            data_start = _aligned(MODEL_PREAMBLE.size + header_size)
+            # the arrays of a mapped file keep the map open; it's closed when they are garbage collected
+            mapped = mmap.mmap(model_file.fileno(), 0, access=mmap.ACCESS_READ) if mmap_file else None
+            arrays = {}
+            for name, spec in header["arrays"].items():
+                dtype, count = np.dtype(spec["dtype"]), int(np.prod(spec["shape"]))
+                if mapped is not None:
+                    values = np.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + spec["offset"])
+                else:
+                    model_file.seek(data_start + spec["offset"])
+                    values = np.fromfile(model_file, dtype=dtype, count=count)
+                arrays[name] = values.reshape(spec["shape"])
+
+        if mapped is not None:
+            words = ModelWords(arrays["vocab"], arrays["vocab_offsets"], arrays["vocab_sorted"])
+        else:
+            words = arrays["vocab"].tobytes().decode("utf-8").split("\n")[:-1]
+        return cls(words, header["order"], arrays["state_words"], arrays["indptr"], arrays["next_words"],
+                   arrays["counts"], arrays["next_state"], arrays["cumulative"])
+
+    @staticmethod
+    def is_model_file(file_name:str) -> bool:
+        """returns True if the file starts like a model file"""
+        with open(file_name, "rb") as model_file:
+            return model_file.read(len(MODEL_MAGIC)) == MODEL_MAGIC
+
+    def word_id(self, word:str) -> int:
+        """returns the id of a word; or -1 if the word is unknown"""
+        if isinstance(self.words, ModelWords):
+            return self.words.id_of(word)
+        if self._word_ids is None:
+            self._word_ids = {word: word_id for word_id, word in enumerate(self.words)}
+        return self._word_ids.get(word, -1)
+
+    def state_of(self, words:tuple) -> int:
+        """returns the state id of the last `order` words; or -1 if the words never appeared together"""
+        if len(words) < self.order:
+            return -1
+        word_ids = [self.word_id(word) for word in words[-self.order:]]
+        # binary search the sorted states
+        state_words = self.state_words
+        low, high = 0, self.num_states
+        while low < high:
+            middle = (low + high) // 2
+            if state_words[middle].tolist() < word_ids:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_states and state_words[low].tolist() == word_ids:
+            return low
+        return -1
+
+    def followers(self, words:tuple) -> dict:
+        """returns the {next word: count} dict of a state (same as the course's word_freqs[word])"""
+        state = self.state_of(words)
+        if state < 0:
+            return {}
+        start, end = self.indptr[state], self.indptr[state + 1]
+        return {self.words[word_id]: count
+                for word_id, count in zip(self.next_words[start:end].tolist(), self.counts[start:end].tolist())}
+
+    def build_alias(self) -> None:
+        """
+        Builds the alias tables (Vose's alias method) for O(1) sampling. Each transition gets a probability and an
+        alias transition: pick a random transition j of the state, keep it with probability prob[j], otherwise
+        take alias[j].
+        """
+        prob = np.ones(len(self.counts), dtype=np.float64)
+        alias = np.arange(len(self.counts), dtype=np.int64)
+        indptr, counts = self.indptr.tolist(), self.counts.tolist()
+        for state in range(self.num_states):
+            start, end = indptr[state], indptr[state + 1]
+            size = end - start
+            if size < 2:
+                continue
+            total = sum(counts[start:end])
+            scaled = [count * size / total for count in counts[start:end]]
+            small = [i for i, p in enumerate(scaled) if p < 1.0]
+            large = [i for i, p in enumerate(scaled) if p >= 1.0]
+            while small and large:
+                less, more = small.pop(), large[-1]
+                prob[start + less] = scaled[less]
+                alias[start + less] = start + more
+                scaled[more] -= 1.0 - scaled[less]
+                if scaled[more] < 1.0:
+                    small.append(large.pop())
+        self._alias = (prob, alias)
+
+    def random_state(self, rnd:random.Random) -> int:
+        """returns a random state that has followers"""
+        # only the last n-gram of the text can be a dead end, so this rarely tries twice
+        while True:
+            state = rnd.randrange(self.num_states)
+            if self.indptr[state] != self.indptr[state + 1]:
+                return state
+
+    def generate(self, num_words:int, seed:int=None, start:tuple=None, sampler:str="cdf") -> list:
+        """
+        Generates text by walking the chain.
+
+        Args:
+            num_words (int): number of words to generate
+            seed (int, optional): random seed. Defaults to None.
+            start (tuple, optional): starting words (the last `order` words are used). Defaults to a random state.
+            sampler (str, optional): "cdf" (binary search) or "alias" (O(1)). Defaults to "cdf".
+
+        Returns:
+            list: generated words
+        """
+        if sampler not in SAMPLERS:
+            raise ValueError(f"Unknown sampler: {sampler}. Use one of {SAMPLERS}")
+        if len(self.next_words) == 0:
+            return []
+        rnd = random.Random(seed)
+        indptr, next_words, next_state = self.indptr, self.next_words, self.next_state
+        cumulative, words = self.cumulative, self.words
+        if sampler == "alias":
+            if self._alias is None:
+                self.build_alias()
+            prob, alias = self._alias
+
+        state = self.state_of(start) if start else -1
+        if state < 0:
+            state = self.random_state(rnd)
+        output = self.state_words[state].tolist()[:num_words]
+        while len(output) < num_words:
+            first, last = int(indptr[state]), int(indptr[state + 1])
+            if first == last:
+                # dead end (the end of the text): restart from a random state
+                state = self.random_state(rnd)
+                continue
+            if sampler == "cdf":
+                # binary search a random point of this state's cumulative counts
+                base = int(cumulative[first - 1]) if first else 0
+                j = bisect_right(cumulative, base + rnd.randrange(int(cumulative[last - 1]) - base), first, last)
+            else:
+                j = first + int(rnd.random() * (last - first))
+                if rnd.random() >= prob[j]:
+                    j = int(alias[j])
+            output.append(int(next_words[j]))
+            state = int(next_state[j])
+        # decode the word ids at the end
+        return [words[word_id] for word_id in output]
+
+    def nbytes(self) -> int:
+        """returns the memory used by the numpy arrays"""
+        arrays = [self.state_words, self.indptr, self.next_words, self.counts, self.next_state, self.cumulative]
+        return sum(a.nbytes for a in arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markov chain text generator")
+    parser.add_argument("file_name", help="input text file (for example: sonnets.txt), or a model file")
+    parser.add_argument("-o", "--order", type=int, default=None,
+                        help="number of words in a state (default: 1; a model file keeps its own order)")
+    parser.add_argument("-w", "--words", type=int, default=100, help="number of words to generate")
+    parser.add_argument("-s", "--seed", type=int, default=None, help="random seed")
+    parser.add_argument("--sampler", choices=SAMPLERS, default="cdf")
+    parser.add_argument("--save", metavar="MODEL_FILE", default=None, help="save the model into a model file")
+    args = parser.parse_args()
+
+    if MarkovModel.is_model_file(args.file_name):
+        model = MarkovModel.load(args.file_name, mmap_file=True)
+        if args.order is not None and args.order != model.order:
+            parser.error(f"--order {args.order} doesn't match the order {model.order} of the model file: "
+                         "build a new model from the text file instead")
+    else:
+        model = MarkovModel.from_file(args.file_name, 1 if args.order is None else args.order)
+    if args.save:
+        model.save(args.save)
+    print(" ".join(model.generate(args.words, seed=args.seed, sampler=args.sampler)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Parallel map-reduce builder for the Markov model (src/markov.py).
+
+Building `word_freqs` from a corpus is a single pass on a single core. For large corpora this module:
+
+    - shards the file into byte ranges that start and end at line breaks (`shard_ranges()`)
+    - map: every worker process reads one shard in blocks and counts its n-grams (`count_shard()`) with a local
+      vocabulary. The counts are compact numpy arrays (unique n-grams and their counts), not nested dicts.
+    - reduce: adjacent shard counts are merged in pairs, in parallel, until one is left (a tree reduction,
+      `merge_counts()`). The vocabularies are merged by remapping the word ids of the right shard.
+
+The n-grams that cross a shard boundary (the last words of a shard followed by the first words of the next one)
+are not seen by either worker. Every shard keeps its first and last `order` words, and the merge of two adjacent
+shards counts the n-grams that cross the boundary between them. The result is the same model as
+`MarkovModel.from_file()`, with the same word ids.
+
+The model is saved into the binary model file of `MarkovModel.save()`.
+
+usage: python markov_parallel.py corpus.txt model.bin [--order 1] [--workers 4] [--shards 8]
+"""
+
+import os
+import time
+import argparse
+from itertools import starmap
+from multiprocessing import Pool
+
+import numpy as np
+
+from markov import Vocabulary, MarkovModel, count_ngrams, aggregate_ngrams
+
+
+# size of the blocks read by the workers
+READ_SIZE = 16 * 1024 * 1024
+
+
+class ShardCounts:
+    """
+    The n-gram counts of a shard, or of several adjacent shards after a merge.
+    """
+
+    def __init__(self, words:list, grams:np.ndarray, counts:np.ndarray, head:list, tail:list):
+        """
+        Args:
+            words (list): vocabulary of the shard; word id >> word
+            grams (np.ndarray): (num_grams, order + 1) unique n-grams (word ids)
+            counts (np.ndarray): count of each n-gram
+            head (list): first `order` words of the shard (fewer if the shard is shorter)
+            tail (list): last `order` words of the shard
+        """
+        self.words = words
+        self.grams = grams
+        self.counts = counts
+        self.head = head
+        self.tail = tail
+
+
+def shard_ranges(file_name:str, num_shards:int) -> list:
+    """
+    Splits a text file into about `num_shards` byte ranges of whole lines.
+
+    Args:
+        file_name (str): text file path
+        num_shards (int): number of shards
+
+    Returns:
+        list: (start, end) byte offsets of each non empty shard
+    """
+    size = os.path.getsize(file_name)
+    bounds = [0]
+    with open(file_name, "rb") as text_file:
+        for shard in range(1, num_shards):
+            text_file.seek(max(size * shard // num_shards, bounds[-1]))
+            # move the boundary to the start of the next line
+            text_file.readline()
+            bounds.append(min(text_file.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def read_blocks(file_name:str, start:int, end:int):
+    """
+    Yields the text of a byte range in blocks of about READ_SIZE bytes. Blocks end at a line break, so words and
+    utf-8 characters are never split between blocks.
+    """
+    with open(file_name, "rb") as text_file:
+        text_file.seek(start)
+        remaining = end - start
+        rest = b""
+        while remaining > 0:
+            data = text_file.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            data = rest + data
+            cut = data.rfind(b"\n") + 1 if remaining > 0 else len(data)
+            rest = data[cut:]
+            yield data[:cut].decode("utf-8")
+        if rest:
+            yield rest.decode("utf-8")
+
+
+def count_shard(file_name:str, start:int, end:int, order:int) -> ShardCounts:
+    """
+    Map step: counts the n-grams of a shard of the file.
+
+    Args:
+        file_name (str): text file path
+        start (int): first byte of the shard (the start of a line)
+        end (int): end of the shard (the start of a line, or the end of the file)
+        order (int): number of words in a state
+
+    Returns:
+        ShardCounts: counts of the shard
+    """
+    vocab = Vocabulary()
+    # a block of lines splits into words the same way as its lines
+    word_ids = vocab.encode_lines(read_blocks(file_name, start, end))
+    grams, counts = count_ngrams(word_ids, order, len(vocab))
+    words = vocab.words
+    return ShardCounts(words, grams, counts,
+                       head=[words[word_id] for word_id in word_ids[:order].tolist()],
+                       tail=[words[word_id] for word_id in word_ids[-order:].tolist()])
+
+
+def merge_counts(left:ShardCounts, right:ShardCounts, order:int) -> ShardCounts:
+    """
+    Reduce step: merges the counts of two adjacent shards (`left` comes right before `right` in the file).
+
+    Args:
+        left (ShardCounts): counts of the first shard
+        right (ShardCounts): counts of the next shard
+        order (int): number of words in a state
+
+    Returns:
+        ShardCounts: counts of both shards, including the n-grams that cross the boundary between them
+    """
+    # the right shard's words get the ids of the merged vocabulary (new words are added after the left words)
+    vocab = Vocabulary(left.words)
+    remap = np.array([vocab.add(word) for word in right.words], dtype=np.int32)
+    grams = [left.grams, remap[right.grams]]
+    counts = [left.counts, right.counts]
+
+    # n-grams that start in the left shard and end in the right shard. If a shard is shorter than `order` words,
+    # the n-grams that also cross the next boundary are counted by the next merge.
+    window = left.tail + right.head
+    crossing = [[vocab.add(word) for word in window[i:i + order + 1]]
+                for i in range(len(window) - order) if i < len(left.tail) <= i + order]
+    if crossing:
+        grams.append(np.array(crossing, dtype=np.int32))
+        counts.append(np.ones(len(crossing), dtype=np.int64))
+
+    merged_grams, merged_counts = aggregate_ngrams(np.concatenate(grams), np.concatenate(counts), len(vocab))
+    return ShardCounts(vocab.words, merged_grams, merged_counts,
+                       head=(left.head + right.head)[:order],
+                       tail=(left.tail + right.tail)[-order:])
+
+
+def build_parallel(file_name:str, order:int=1, workers:int=None, num_shards:int=None) -> MarkovModel:
+    """
+    Builds a Markov model from a text file with a pool of worker processes.
+
+    Args:
+        file_name (str): text file path
+        order (int, optional): number of words in a state. Defaults to 1.
+        workers (int, optional): number of worker processes. Defaults to the number of CPUs.
+        num_shards (int, optional): number of shards. Defaults to the number of workers.
+
+    Returns:
+        MarkovModel: new model (same as `MarkovModel.from_file()`)
+    """
+    if order < 1:
+        raise ValueError(f"Invalid order: {order}")
+    workers = workers or os.cpu_count() or 1
+    num_shards = num_shards or workers
+    tasks = [(file_name, start, end, order) for start, end in shard_ranges(file_name, num_shards)]
+    if not tasks:
+        # empty file
+        return MarkovModel.build(np.zeros(0, dtype=np.int32), [], order)
+
+    pool = Pool(min(workers, len(tasks))) if workers > 1 and len(tasks) > 1 else None
+    try:
+        map_tasks = pool.starmap if pool else lambda func, args: list(starmap(func, args))
+        partials = map_tasks(count_shard, tasks)
+        # tree reduction: merge adjacent pairs until a single result is left
+        while len(partials) > 1:
+            merged = map_tasks(merge_counts, [(partials[i], partials[i + 1], order)
+                                              for i in range(0, len(partials) - 1, 2)])
+            if len(partials) % 2:
+                merged.append(partials[-1])
+            partials = merged
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    total = partials[0]
+    return MarkovModel.from_counts(total.words, order, total.grams, total.counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Markov model file with parallel workers")
+    parser.add_argument("file_name", help="input text file (for example: sonnets.txt)")
+    parser.add_argument("model_file", help="output model file")
+    parser.add_argument("-o", "--order", type=int, default=1, help="number of words in a state")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--shards", type=int, default=None, help="number of shards (default: one per worker)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model = build_parallel(args.file_name, args.order, args.workers, args.shards)
+    elapsed = time.perf_counter() - start
+    size = model.save(args.model_file)
+    print(f"Built {len(model.words)} words, {model.num_states} states, {len(model.counts)} transitions "
+          f"in {elapsed:.2f}s; wrote {size / 1024 / 1024:.2f} MB to {args.model_file}")
+
+
+if __name__ == '__main__':
+    main()
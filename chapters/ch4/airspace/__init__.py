@@ -0,0 +1,8 @@
+"""
+Shared building blocks for the chapter 4 Airspace APIs (MySQL and BigQuery flask apps).
+
+Installed with `pip install -e chapters/ch4` (the apps' requirements.txt); the flask apps import these modules, for
+example:
+
+    from airspace.results import ResultMaterializer
+"""
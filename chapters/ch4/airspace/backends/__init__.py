@@ -0,0 +1,140 @@
+"""
+Airspace storage backends. Use `create_repository()` to create the backend configured in an app's config.yml:
+
+    backend: memory
+    airports_csv: ../../../../ch2/ep1/data/deb-airports.csv
+    routes_csv: ../../../../ch2/ep1/data/deb-routes.csv
+
+Each backend module is only imported when it's used; so an app using the memory backend does not need
+SQLAlchemy or google-cloud-bigquery installed. Use `LazyRepository` to also defer importing and creating the
+backend (db engine, bq client, loading csv files) until the first query, which keeps app startup fast. Its
+queries count as backend time in the request metrics (see `airspace.metrics`).
+"""
+
+import importlib
+import logging
+import threading
+
+from airspace.metrics import backend_time, timed_batches
+from airspace.repository import AirspaceRepository
+from airspace.suggest import DEFAULT_SUGGEST_LIMIT
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# backend name >> module.class
+BACKENDS = {
+    "mysql": "airspace.backends.mysql.MySqlRepository",
+    "bigquery": "airspace.backends.bigquery.BigQueryRepository",
+    "sqlite": "airspace.backends.sqlite.SqliteRepository",
+    "memory": "airspace.backends.memory.MemoryRepository",
+}
+
+
+def create_repository(conf:dict, backend:str=None) -> AirspaceRepository:
+    """
+    Creates an airspace repository from the app configuration.
+
+    Args:
+        conf (dict): app configuration (config.yml)
+        backend (str, optional): backend name. Defaults to the `backend` config value.
+
+    Returns:
+        AirspaceRepository: new repository
+
+    Raises:
+        ValueError: unknown backend
+    """
+    backend = backend or conf["backend"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown airspace backend: {backend}. Must be one of {sorted(BACKENDS)}")
+    module_name, _, class_name = BACKENDS[backend].rpartition(".")
+    repository_class = getattr(importlib.import_module(module_name), class_name)
+    return repository_class.from_config(conf)
+
+
+class LazyRepository(AirspaceRepository):
+    """
+    Creates the configured backend on first use. Safe to share between flask request threads: only the
+    first caller creates the backend while other threads wait for it.
+    """
+
+    def __init__(self, conf:dict, backend:str=None):
+        """
+        Args:
+            conf (dict): app configuration (config.yml)
+            backend (str, optional): backend name. Defaults to the `backend` config value.
+        """
+        self.conf = conf
+        self.name = backend or conf["backend"]
+        self._repo = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, conf:dict) -> "LazyRepository":
+        return cls(conf)
+
+    @property
+    def repo(self) -> AirspaceRepository:
+        """the backend; created on first access"""
+        if self._repo is None:
+            with self._lock:
+                # check again: another thread might have created the backend while we waited for the lock
+                if self._repo is None:
+                    logger.info("creating airspace backend: '%s'", self.name)
+                    self._repo = create_repository(self.conf, self.name)
+        return self._repo
+
+    @property
+    def initialized(self) -> bool:
+        """true if the backend has been created"""
+        return self._repo is not None
+
+    def airports(self, iata:str=None) -> list:
+        with backend_time():
+            return self.repo.airports(iata)
+
+    def routes(self, src:str=None, dest:str=None) -> list:
+        with backend_time():
+            return self.repo.routes(src, dest)
+
+    def iter_airports(self, iata:str=None):
+        with backend_time():
+            batches = self.repo.iter_airports(iata)
+        # streamed batches are downloaded while the response is sent
+        return timed_batches(batches)
+
+    def iter_routes(self, src:str=None, dest:str=None):
+        with backend_time():
+            batches = self.repo.iter_routes(src, dest)
+        return timed_batches(batches)
+
+    def routes_batch(self, pairs) -> dict:
+        with backend_time():
+            return self.repo.routes_batch(pairs)
+
+    def route_counts(self) -> dict:
+        with backend_time():
+            return self.repo.route_counts()
+
+    def suggest_airports(self, query:str, limit:int=DEFAULT_SUGGEST_LIMIT) -> list:
+        # the index is kept by the backend
+        with backend_time():
+            return self.repo.suggest_airports(query, limit)
+
+    def preload(self) -> None:
+        self.repo.preload()
+
+    def after_fork(self) -> None:
+        # the lock could have been held by a thread of the parent process
+        self._lock = threading.Lock()
+        if self._repo is not None:
+            self._repo.after_fork()
+
+    def stats(self) -> dict:
+        return self._repo.stats() if self._repo is not None else {}
+
+    def close(self) -> None:
+        if self._repo is not None:
+            self._repo.close()
@@ -0,0 +1,210 @@
+"""
+BigQuery airspace backend. Query results are converted by a `ResultMaterializer` and identical concurrent
+queries are coalesced into a single bq job by a `SingleFlight` group. With the 'arrow' result format, the streamed
+`iter_airports()` and `iter_routes()` results are downloaded one record batch at a time, while the response is sent.
+"""
+
+import logging
+from typing import Iterator
+
+from google.cloud import bigquery as bq
+
+from airspace.repository import AirspaceRepository, AIRPORT_FIELDS, ROUTE_FIELDS, normalize_code
+from airspace.results import ResultMaterializer
+from airspace.singleflight import SingleFlight, query_key
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class BigQueryRepository(AirspaceRepository):
+    """
+    Queries the airports and routes tables of a BigQuery dataset.
+    """
+
+    name = "bigquery"
+
+    def __init__(self, client, project:str, dataset:str, airports_table:str="airports", routes_table:str="routes",
+                 materializer:ResultMaterializer=None, coalesce_queries:bool=True):
+        """
+        Args:
+            client (bq.Client): BigQuery client
+            project (str): GCP project
+            dataset (str): BigQuery dataset
+            airports_table (str, optional): airports table name. Defaults to "airports".
+            routes_table (str, optional): routes table name. Defaults to "routes".
+            materializer (ResultMaterializer, optional): converts query results. Defaults to the 'rows' format.
+            coalesce_queries (bool, optional): share one bq job between identical concurrent queries. Defaults to True.
+        """
+        self.client = client
+        self.airports_table = f"{project}.{dataset}.{airports_table}"
+        self.routes_table = f"{project}.{dataset}.{routes_table}"
+        self.materializer = materializer or ResultMaterializer()
+        self.flights = SingleFlight() if coalesce_queries else None
+
+    @classmethod
+    def from_config(cls, conf:dict) -> "BigQueryRepository":
+        """
+        Creates the backend from the `project`, `dataset`, `airports_table`, `routes_table`, `result_format`,
+        `use_bqstorage`, and `coalesce_queries` config values.
+
+        Args:
+            conf (dict): app configuration
+
+        Returns:
+            BigQueryRepository: new backend
+        """
+        project = conf['project']
+        dataset = conf['dataset']
+        logger.info("bigquery Config: project='%s', dataset='%s'", project, dataset)
+        materializer = ResultMaterializer.from_config(conf)
+        logger.info("bigquery result format: '%s'", materializer.result_format)
+        return cls(bq.Client(project=project), project, dataset,
+                   airports_table=conf.get("airports_table", "airports"),
+                   routes_table=conf.get("routes_table", "routes"),
+                   materializer=materializer,
+                   coalesce_queries=conf.get("coalesce_queries", True))
+
+    def run_query(self, query:str, params:list=None) -> list:
+        """
+        Runs a bq query and returns its results as a list of dict rows. When query coalescing is enabled,
+        concurrent calls with the same query and params share one bq job and the same (read-only) results.
+
+        Args:
+            query (str): SQL query
+            params (list, optional): list of bq.ScalarQueryParameter or bq.ArrayQueryParameter. Defaults to None.
+
+        Returns:
+            list: list of dict rows
+        """
+        logger.debug("query:\n %s\n", query)
+
+        def execute():
+            # create a bq job config to provide the query params
+            job_config = bq.QueryJobConfig(query_parameters=params) if params else None
+            result = self.client.query(query, job_config)
+            # download all the results before sharing them with other waiting requests
+            return self.materializer.records(result)
+
+        if self.flights is None:
+            return execute()
+        # array params hold their values in `.values` instead of `.value`
+        key = query_key(query, {p.name: tuple(p.values) if isinstance(p, bq.ArrayQueryParameter) else p.value
+                                for p in (params or [])})
+        return self.flights.do(key, execute)
+
+    def stream_query(self, query:str, params:list=None) -> Iterator[list]:
+        """
+        Runs a bq query and returns its results as lists of dict rows. With the 'arrow' result format, there is one
+        list per arrow record batch, downloaded as the iterator is consumed; waits for the query job first, so query
+        errors are raised by this call rather than while a response is streamed. Streamed queries aren't coalesced
+        (their results are never held in memory as a whole); with the 'rows' format, returns the `run_query()`
+        results as a single list.
+
+        Args:
+            query (str): SQL query
+            params (list, optional): list of bq.ScalarQueryParameter or bq.ArrayQueryParameter. Defaults to None.
+
+        Returns:
+            Iterator[list]: lists of dict rows
+        """
+        if self.materializer.result_format == "rows":
+            return iter([self.run_query(query, params)])
+        logger.debug("streamed query:\n %s\n", query)
+        job_config = bq.QueryJobConfig(query_parameters=params) if params else None
+        rows = self.client.query(query, job_config).result()
+        return self.materializer.record_lists(rows)
+
+    def _airports_query(self, iata:str=None) -> tuple:
+        """the airports query and its params"""
+        if iata is not None:
+            # search for specific iata airport code using a parametrized query
+            query = f"""
+                SELECT {', '.join(AIRPORT_FIELDS)}
+                FROM `{self.airports_table}`
+                WHERE
+                    iata = @iata
+                """
+            return query, [bq.ScalarQueryParameter("iata", "STRING", normalize_code(iata))]
+        # no iata code provided, return all airports
+        query = f"""
+            SELECT {', '.join(AIRPORT_FIELDS)}
+            FROM `{self.airports_table}`
+            ORDER BY iata
+            """
+        return query, None
+
+    def _routes_query(self, src:str=None, dest:str=None) -> tuple:
+        """the routes query and its params"""
+        conditions, params = [], []
+        if src:
+            conditions.append("src = @src")
+            params.append(bq.ScalarQueryParameter("src", "STRING", normalize_code(src)))
+        if dest:
+            conditions.append("dest = @dest")
+            params.append(bq.ScalarQueryParameter("dest", "STRING", normalize_code(dest)))
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        query = f"""
+            SELECT {', '.join(ROUTE_FIELDS)}
+            FROM `{self.routes_table}`
+            {where}
+            ORDER BY airline, src, dest
+        """
+        return query, params
+
+    def airports(self, iata:str=None) -> list:
+        return self.run_query(*self._airports_query(iata))
+
+    def iter_airports(self, iata:str=None) -> Iterator[list]:
+        return self.stream_query(*self._airports_query(iata))
+
+    def routes(self, src:str=None, dest:str=None) -> list:
+        return self.run_query(*self._routes_query(src, dest))
+
+    def iter_routes(self, src:str=None, dest:str=None) -> Iterator[list]:
+        return self.stream_query(*self._routes_query(src, dest))
+
+    def routes_batch(self, pairs) -> dict:
+        pairs = list(pairs)
+        # join the routes table with the pairs; the pairs are passed as two array params and
+        # zipped back together by their array offset
+        query = f"""
+            WITH pairs AS (
+                SELECT src, @dests[OFFSET(i)] AS dest
+                FROM UNNEST(@srcs) AS src WITH OFFSET AS i
+            )
+            SELECT {', '.join('r.' + field for field in ROUTE_FIELDS)}
+            FROM `{self.routes_table}` AS r
+            JOIN pairs AS p
+                ON r.src = p.src AND r.dest = p.dest
+            ORDER BY r.src, r.dest, r.airline
+        """
+        rows = self.run_query(query, [
+            bq.ArrayQueryParameter("srcs", "STRING", [src for src, _ in pairs]),
+            bq.ArrayQueryParameter("dests", "STRING", [dest for _, dest in pairs]),
+        ])
+        # group the routes by pair
+        routes = {pair: [] for pair in pairs}
+        for row in rows:
+            routes[(row["src"], row["dest"])].append(row)
+        return routes
+
+    def route_counts(self) -> dict:
+        query = f"""
+            SELECT iata, COUNT(*) AS routes
+            FROM `{self.routes_table}`, UNNEST([src, dest]) AS iata
+            GROUP BY iata
+        """
+        return {row["iata"]: row["routes"] for row in self.run_query(query)}
+
+    def after_fork(self) -> None:
+        # the client's http sessions (and grpc channels) can't be shared with the parent process
+        self.client = bq.Client(project=self.client.project)
+        if self.flights is not None:
+            self.flights = SingleFlight()
+
+    def stats(self) -> dict:
+        return {
+            "coalesce_queries": self.flights is not None,
+            "queries": self.flights.stats() if self.flights is not None else {},
+        }
@@ -0,0 +1,124 @@
+"""
+In-memory airspace backend: a columnar store loaded from the deb-airports.csv and deb-routes.csv files.
+
+This is the low-latency tier of the Airspace API (no network round trips) and a stand-in for the database
+backends when developing and benchmarking locally. The routes are kept in a compact, dictionary encoded
+`RoutesTable` (see `airspace.routes_table`) that shares its airport codes with the airports table.
+"""
+
+import csv
+import logging
+
+import numpy as np
+
+from airspace.repository import AirspaceRepository, AIRPORT_FIELDS, airport_values, normalize_code
+from airspace.routes_table import RoutesTable, SymbolTable
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class ColumnTable:
+    """
+    A simple columnar table: one python list per column. Rows are addressed by their row number.
+    """
+
+    def __init__(self, fields:list):
+        self.fields = fields
+        self.columns = {field: [] for field in fields}
+        self.num_rows = 0
+
+    def append(self, values:tuple) -> None:
+        """append a row of column values"""
+        for field, value in zip(self.fields, values):
+            self.columns[field].append(value)
+        self.num_rows += 1
+
+    def rows(self, row_ids:list) -> list:
+        """
+        Converts row numbers into a list of dict rows.
+
+        Args:
+            row_ids (list): row numbers
+
+        Returns:
+            list: list of dict rows
+        """
+        columns = [self.columns[field] for field in self.fields]
+        fields = self.fields
+        return [dict(zip(fields, [column[i] for column in columns])) for i in row_ids]
+
+
+class MemoryRepository(AirspaceRepository):
+    """
+    Serves airports from an in-memory column table and routes from a dictionary encoded `RoutesTable`.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.airports_table = ColumnTable(AIRPORT_FIELDS)
+        # airport codes shared by the airports and routes tables: the id of an airport is its airports table row
+        self.airport_codes = SymbolTable()
+        self.routes_table = RoutesTable.from_rows([], self.airport_codes)
+
+    @classmethod
+    def from_config(cls, conf:dict) -> "MemoryRepository":
+        """
+        Creates the backend and loads the `airports_csv` and `routes_csv` files.
+
+        Args:
+            conf (dict): app configuration
+
+        Returns:
+            MemoryRepository: new backend
+        """
+        repo = cls()
+        repo.load_csv(conf["airports_csv"], conf["routes_csv"])
+        return repo
+
+    def load_csv(self, airports_csv:str, routes_csv:str) -> None:
+        """
+        Loads the deb-*.csv files into the airports and routes tables.
+
+        Args:
+            airports_csv (str): path to deb-airports.csv
+            routes_csv (str): path to deb-routes.csv
+        """
+        logger.info("loading in-memory tables from %s and %s", airports_csv, routes_csv)
+        with open(airports_csv, "r", encoding="utf-8") as csv_file:
+            airports = sorted((airport_values(row) for row in csv.DictReader(csv_file)), key=lambda values: values[0])
+        # airports are ordered by iata; the airport ids are their row numbers
+        self.airports_table = ColumnTable(AIRPORT_FIELDS)
+        self.airport_codes = SymbolTable()
+        for values in airports:
+            if self.airport_codes.id_of(values[0]) < 0:
+                self.airport_codes.add(values[0])
+                self.airports_table.append(values)
+        self.routes_table = RoutesTable.from_csv(routes_csv, self.airport_codes)
+        logger.info("loaded %d airports and %d routes (%.0f KB)", self.airports_table.num_rows, len(self.routes_table),
+                    self.routes_table.nbytes() / 1024)
+
+    def airports(self, iata:str=None) -> list:
+        if iata is not None:
+            row_id = self.airport_codes.id_of(normalize_code(iata))
+            # route only airports have ids but no airports table row
+            return self.airports_table.rows([row_id] if 0 <= row_id < self.airports_table.num_rows else [])
+        return self.airports_table.rows(range(self.airports_table.num_rows))
+
+    def routes(self, src:str=None, dest:str=None) -> list:
+        row_ids = self.routes_table.lookup(normalize_code(src), normalize_code(dest))
+        return self.routes_table.rows(row_ids)
+
+    def route_counts(self) -> dict:
+        table = self.routes_table
+        counts = np.bincount(table.src, minlength=len(self.airport_codes)) + \
+            np.bincount(table.dest, minlength=len(self.airport_codes))
+        return dict(zip(self.airport_codes.symbols, counts.tolist()))
+
+    def stats(self) -> dict:
+        return {
+            "airports": self.airports_table.num_rows,
+            "routes": len(self.routes_table),
+            "routes_bytes": self.routes_table.nbytes(),
+        }
@@ -0,0 +1,70 @@
+"""
+MySQL airspace backend using a SQLAlchemy connection pool.
+"""
+
+import logging
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from airspace.repository import SqlRepository
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class MySqlRepository(SqlRepository):
+    """
+    Queries the airports and routes tables of a MySQL database.
+    """
+
+    name = "mysql"
+    # lat/lon are DECIMAL columns; return them as strings
+    airport_columns = "iata, airport, city, state, country, CAST(lat AS CHAR) lat, CAST(lon AS CHAR) lon"
+
+    def __init__(self, engine):
+        """
+        Args:
+            engine (sqlalchemy.engine.Engine): db engine
+        """
+        self.engine = engine
+
+    @classmethod
+    def from_config(cls, conf:dict) -> "MySqlRepository":
+        """
+        Creates the backend from the `host`, `user`, `pswd`, and `database` config values.
+
+        Args:
+            conf (dict): app configuration
+
+        Returns:
+            MySqlRepository: new backend
+        """
+        db_host = conf['host']
+        db_user = conf['user']
+        db_pswd = conf['pswd']
+        db_name = conf['database']
+        # print db params (never print passwords!)
+        logger.info("mysql config: host=%s user=%s db=%s", db_host, db_user, db_name)
+        # create a db engine with a connection pool
+        #   a QueuePool creates a pool of database connections. Since routes could be called by multiple clients
+        #   simultaneously, having a pool of db connection that we could pull from is a good idea. Please refer
+        #   to the create_engine documentation.
+        engine = create_engine(f"mysql+pymysql://{db_user}:{db_pswd}@{db_host}/{db_name}?charset=utf8",
+                               poolclass=QueuePool, pool_size=int(conf.get("pool_size", 5)), max_overflow=0)
+        return cls(engine)
+
+    def execute(self, sql:str, params:dict=None) -> list:
+        # get a new connection from the pool
+        with self.engine.connect() as conn:
+            result = conn.execute(text(sql), params or {})
+            # get all the resulting db rows as dict (or mappings)
+            rows = result.mappings().all()
+            return [{k: v for k, v in row.items()} for row in rows]
+
+    def after_fork(self) -> None:
+        # drop the pooled connections inherited from the parent process (without closing them: the parent owns them)
+        self.engine.dispose(close=False)
+
+    def close(self) -> None:
+        self.engine.dispose()
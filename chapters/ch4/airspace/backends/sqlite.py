@@ -0,0 +1,102 @@
+"""
+SQLite airspace backend. The database can be created from the deb-airports.csv and deb-routes.csv files.
+"""
+
+import csv
+import logging
+import sqlite3
+import threading
+
+from airspace.repository import SqlRepository, AIRPORT_FIELDS, ROUTE_FIELDS, airport_values, route_values
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# table definitions used when loading the csv files
+CREATE_TABLES = """
+    create table if not exists airports (
+        iata text primary key, airport text, city text, state text, country text, lat real, lon real
+    );
+    create table if not exists routes (
+        airline text, src text, dest text, codeshare text, stops integer, equipment text
+    );
+    create index if not exists routes_src_dest on routes (src, dest);
+    create index if not exists routes_dest on routes (dest);
+"""
+
+
+class SqliteRepository(SqlRepository):
+    """
+    Queries the airports and routes tables of a SQLite database.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path:str=":memory:"):
+        """
+        Args:
+            path (str, optional): database file. Defaults to ":memory:".
+        """
+        self.path = path
+        # a single connection is shared by all flask threads; sqlite queries are serialized by a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, conf:dict) -> "SqliteRepository":
+        """
+        Creates the backend from the `sqlite_path` config value. If the database has no tables yet, they are
+        loaded from the `airports_csv` and `routes_csv` files.
+
+        Args:
+            conf (dict): app configuration
+
+        Returns:
+            SqliteRepository: new backend
+        """
+        repo = cls(conf.get("sqlite_path", ":memory:"))
+        logger.info("sqlite config: path=%s", repo.path)
+        if not repo.has_tables() and "airports_csv" in conf:
+            repo.load_csv(conf["airports_csv"], conf["routes_csv"])
+        return repo
+
+    def has_tables(self) -> bool:
+        """returns true if the airports and routes tables exist"""
+        rows = self.execute("select name from sqlite_master where type = 'table' and name in ('airports', 'routes')")
+        return len(rows) == 2
+
+    def load_csv(self, airports_csv:str, routes_csv:str) -> None:
+        """
+        Creates the airports and routes tables and loads them from the deb-*.csv files.
+
+        Args:
+            airports_csv (str): path to deb-airports.csv
+            routes_csv (str): path to deb-routes.csv
+        """
+        logger.info("loading sqlite tables from %s and %s", airports_csv, routes_csv)
+        with self._lock, self._conn:
+            self._conn.executescript(CREATE_TABLES)
+            with open(airports_csv, "r", encoding="utf-8") as csv_file:
+                self._conn.executemany(f"insert into airports values ({', '.join('?' * len(AIRPORT_FIELDS))})",
+                                       (airport_values(row) for row in csv.DictReader(csv_file)))
+            with open(routes_csv, "r", encoding="utf-8") as csv_file:
+                self._conn.executemany(f"insert into routes values ({', '.join('?' * len(ROUTE_FIELDS))})",
+                                       (route_values(row) for row in csv.DictReader(csv_file)))
+
+    def execute(self, sql:str, params:dict=None) -> list:
+        with self._lock:
+            rows = self._conn.execute(sql, params or {}).fetchall()
+        return [{k: row[k] for k in row.keys()} for row in rows]
+
+    def after_fork(self) -> None:
+        self._lock = threading.Lock()
+        # sqlite connections must not be used across a fork: reopen database files. An in-memory database
+        # only exists in its connection; each worker keeps using its copy-on-write copy.
+        if self.path != ":memory:":
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+
+    def close(self) -> None:
+        self._conn.close()
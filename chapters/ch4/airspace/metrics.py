@@ -0,0 +1,311 @@
+"""
+Prometheus style request metrics for the chapter 4 flask apps, without the prometheus_client dependency.
+
+`init_metrics(app)` wraps the app's wsgi callable and adds a `/metrics` route, in the prometheus text format:
+
+    http_requests_total{route="/routes",method="GET",status="200"} 1042
+    http_request_duration_seconds_bucket{route="/routes",method="GET",le="0.005"} 1003
+    ...
+
+Metrics per route (the url rule, like "/routes", not the requested path) and method:
+
+    http_requests_total                   counter of requests, also by response status
+    http_request_duration_seconds         histogram of the request time, until the last byte of the response body
+    http_request_backend_seconds          histogram of the time spent in the storage backend (db, bigquery, dataframe)
+    http_request_serialization_seconds    histogram of the rest: routing, json serialization and writing the response
+
+Backend time is the time spent in `with backend_time():` blocks during the request; `LazyRepository` times every
+backend call. Recording a request takes a few microseconds: two clock reads, a cached lookup of the route of the
+request path, three bucket lookups (binary search) and counter increments under a lock. The text is only built when
+`/metrics` is scraped.
+
+Each process keeps its own metrics: pre-forked workers (see `airspace.prefork`) each count the requests they serve.
+"""
+
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Iterable, Iterator
+
+from flask import Flask, Response
+from werkzeug.exceptions import HTTPException
+
+
+# histogram bucket upper bounds in seconds: from cached lookups (sub millisecond) to slow bq queries
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# route label of the requests that don't match any route (404s): the path would make one label per url
+UNMATCHED_ROUTE = "<unmatched>"
+# number of (method, path) >> route matches to cache; paths with url variables, or 404s, could fill any cache
+MAX_CACHED_PATHS = 10_000
+# prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HISTOGRAMS = [
+    ("http_request_duration_seconds", "Request time, until the last byte of the response body"),
+    ("http_request_backend_seconds", "Time spent in the storage backend during the request"),
+    ("http_request_serialization_seconds",
+     "Time spent outside the storage backend: routing, json serialization and writing the response"),
+]
+
+# timer of the request served by the current thread
+_current_request = ContextVar("airspace_metrics_request", default=None)
+# end of an iterator
+_END = object()
+
+
+class RequestTimer:
+    """start time, backend time, environ and status of a request"""
+
+    __slots__ = ("start", "backend", "environ", "status")
+
+    def __init__(self, environ:dict):
+        self.start = perf_counter()
+        self.backend = 0.0
+        self.environ = environ
+        self.status = "500"
+
+
+class backend_time:
+    """
+    Context manager adding the time of its block to the backend time of the current request. Does nothing
+    outside of a request of an app with metrics.
+
+        with backend_time():
+            data = repo.routes(src, dest)
+    """
+
+    __slots__ = ("timer", "start")
+
+    def __enter__(self):
+        self.timer = _current_request.get()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.timer is not None:
+            self.timer.backend += perf_counter() - self.start
+
+
+def timed_batches(batches:Iterable) -> Iterator:
+    """
+    Yields the items of `batches`, adding the time of each `next()` to the backend time of the request (for results
+    downloaded while the response body is sent).
+
+    Args:
+        batches (Iterable): for example, the lists of rows of a streamed query
+
+    Returns:
+        Iterator: the same items
+    """
+    iterator = iter(batches)
+    while True:
+        with backend_time():
+            batch = next(iterator, _END)
+        if batch is _END:
+            return
+        yield batch
+
+
+class TimedBody:
+    """
+    Response body of a timed request. Sets the request's timer while the server iterates the body, so the backend
+    time of a streamed response counts, and records the request after the last chunk, or when the server closes
+    the body: wsgi servers call `close()` even when they don't iterate the body to its end (a client that
+    disconnects, a HEAD request).
+    """
+
+    __slots__ = ("body", "chunks", "timer", "metrics", "closed")
+
+    def __init__(self, body, timer:RequestTimer, metrics:"RequestMetrics"):
+        self.body = body
+        self.chunks = None
+        self.timer = timer
+        self.metrics = metrics
+        self.closed = False
+
+    def __iter__(self):
+        self.chunks = self._chunks()
+        return self.chunks
+
+    def _chunks(self):
+        # set once for the whole body rather than around each chunk: the server's thread (or greenlet) serves
+        # this request until the body is done
+        token = _current_request.set(self.timer)
+        try:
+            yield from self.body
+        finally:
+            _current_request.reset(token)
+        # the last byte was sent: record the request now, since not every caller closes the body (flask test client)
+        self.chunks = None
+        self.close()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.chunks is not None:
+                # a body closed before its end: reset the timer
+                self.chunks.close()
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self.metrics.observe(self.timer, perf_counter() - self.timer.start)
+
+
+class RouteStats:
+    """request counts by status, and the bucket counters and sums of the histograms of a route"""
+
+    __slots__ = ("statuses", "counts", "sums")
+
+    def __init__(self, width:int):
+        self.statuses = {}      # status >> count
+        # the counters of each histogram (HISTOGRAMS order), one per bucket plus the +Inf bucket, in a single list
+        self.counts = [0] * (width * len(HISTOGRAMS))
+        self.sums = [0.0] * len(HISTOGRAMS)
+
+
+class RequestMetrics:
+    """
+    Wsgi middleware that times every request of a flask app, and the registry of the request metrics (see the
+    module docs). Created by `init_metrics()`.
+    """
+
+    def __init__(self, app:Flask, buckets:tuple=LATENCY_BUCKETS):
+        """
+        Args:
+            app (Flask): flask app
+            buckets (tuple, optional): histogram bucket upper bounds in seconds. Defaults to LATENCY_BUCKETS.
+        """
+        self.wsgi_app = app.wsgi_app
+        self.url_map = app.url_map
+        self.buckets = tuple(sorted(buckets))
+        # histogram counters per bucket, plus the +Inf bucket
+        self.width = len(self.buckets) + 1
+        self.routes = {}        # (route, method) >> RouteStats
+        self._paths = {}        # (method, path) >> route
+        self._lock = threading.Lock()
+
+    def __call__(self, environ:dict, start_response):
+        timer = RequestTimer(environ)
+        token = _current_request.set(timer)
+
+        def timed_start_response(status, headers, exc_info=None):
+            timer.status = status[:3]
+            return start_response(status, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, timed_start_response)
+        finally:
+            _current_request.reset(token)
+        # the body of a streamed response (ndjson, arrow json chunks) is serialized while the server iterates it
+        return TimedBody(body, timer, self)
+
+    def route(self, environ:dict) -> tuple:
+        """
+        Returns the url rule of a request, like "/routes", and its method. A flask before_request hook could read
+        `request.url_rule`, but flask hooks cost more than matching each path once and caching it.
+        """
+        key = (environ.get("REQUEST_METHOD", "GET"), environ.get("PATH_INFO", "/"))
+        route = self._paths.get(key)
+        if route is None:
+            try:
+                rule, _ = self.url_map.bind_to_environ(environ).match(return_rule=True)
+                route = rule.rule
+            except HTTPException:
+                # 404, 405 or a redirect to the path with a trailing slash
+                route = UNMATCHED_ROUTE
+            if len(self._paths) < MAX_CACHED_PATHS:
+                self._paths[key] = route
+        return route, key[0]
+
+    def observe(self, timer:RequestTimer, duration:float) -> None:
+        """
+        Records a request.
+
+        Args:
+            timer (RequestTimer): the request's environ, status and backend time
+            duration (float): request time in seconds
+        """
+        key = self.route(timer.environ)
+        buckets = self.buckets
+        backend = timer.backend if timer.backend < duration else duration
+        # a bucket counts the values lower than or equal to its bound
+        duration_bucket = bisect_left(buckets, duration)
+        backend_bucket = self.width + bisect_left(buckets, backend)
+        serialization_bucket = 2 * self.width + bisect_left(buckets, duration - backend)
+        with self._lock:
+            stats = self.routes.get(key)
+            if stats is None:
+                stats = self.routes[key] = RouteStats(self.width)
+            stats.statuses[timer.status] = stats.statuses.get(timer.status, 0) + 1
+            counts = stats.counts
+            counts[duration_bucket] += 1
+            counts[backend_bucket] += 1
+            counts[serialization_bucket] += 1
+            sums = stats.sums
+            sums[0] += duration
+            sums[1] += backend
+            sums[2] += duration - backend
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: all the metrics in the prometheus text exposition format
+        """
+        # copy the counters under the lock, then format them without blocking requests
+        with self._lock:
+            routes = [(key, dict(stats.statuses), list(stats.counts), list(stats.sums))
+                      for key, stats in sorted(self.routes.items())]
+
+        lines = ["# HELP http_requests_total Number of requests", "# TYPE http_requests_total counter"]
+        for (route, method), statuses, _, _ in routes:
+            labels = _labels(route, method)
+            for status, count in sorted(statuses.items()):
+                lines.append(f'http_requests_total{{{labels},status="{status}"}} {count}')
+        for i, (name, help_text) in enumerate(HISTOGRAMS):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (route, method), _, counts, sums in routes:
+                labels = _labels(route, method)
+                # prometheus buckets are cumulative
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts[i * self.width:]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                cumulative += counts[(i + 1) * self.width - 1]
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {sums[i]!r}")
+                lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """clears all the metrics"""
+        with self._lock:
+            self.routes.clear()
+            self._paths.clear()
+
+
+def _labels(route:str, method:str) -> str:
+    route = route.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'route="{route}",method="{method}"'
+
+
+def init_metrics(app:Flask, path:str="/metrics", buckets:tuple=LATENCY_BUCKETS) -> RequestMetrics:
+    """
+    Times every request of the app and serves the metrics on `path` (see the module docs).
+
+    Args:
+        app (Flask): flask app
+        path (str, optional): metrics route. Defaults to "/metrics".
+        buckets (tuple, optional): histogram bucket upper bounds in seconds. Defaults to LATENCY_BUCKETS.
+
+    Returns:
+        RequestMetrics: the app's metrics, also saved in `app.extensions["metrics"]`
+    """
+    metrics = RequestMetrics(app, buckets)
+    app.wsgi_app = metrics
+    app.add_url_rule(path, "metrics", lambda: Response(metrics.render(), 200, content_type=CONTENT_TYPE))
+    app.extensions["metrics"] = metrics
+    return metrics
@@ -0,0 +1,223 @@
+"""
+Pre-fork serving of the chapter 4 flask apps.
+
+`app.run()` is a single process dev server; running more copies of an app makes each one load its own datasets
+(csv files, airport index, dataframes). `serve()` loads the app once in a master process, then forks the workers;
+the workers share the loaded data pages with the master (copy-on-write) until they write to them:
+
+    python main.py --workers 4
+
+The cpython garbage collector writes to the header of every object it visits, which would copy every page of the
+shared data in each worker over time. As recommended by the `gc.freeze()` docs, the master disables the gc while
+loading the app, then moves every loaded object to the permanent generation (ignored by the gc) before forking;
+the workers re-enable the gc for the objects they create. Reference counts are still written to when objects
+are used, so data kept in numpy arrays (a single object per column) stays shared better than lists of dicts.
+
+Workers share one listening socket; the kernel hands each connection to an idle worker. The master restarts
+workers that die and stops them on SIGTERM or SIGINT.
+
+This file is also a gunicorn config file with the same preload and gc hooks:
+
+    gunicorn -c python:airspace.prefork -w 4 -b :8080 "main:create_app(preload=True)"
+
+Workers call `after_fork()` on the app's `repository` (if any) so backends recreate their db connections and clients.
+"""
+
+import gc
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+from typing import Callable
+
+from flask import Flask
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# restart a crashing worker at most once per second
+RESTART_DELAY = 1.0
+
+
+def load_app(app_factory:Callable[[], Flask], freeze:bool=True) -> Flask:
+    """
+    Creates the app with the gc disabled, then freezes all the loaded objects (see the module docs).
+
+    Args:
+        app_factory (Callable): creates the app and loads its data
+        freeze (bool, optional): freeze the loaded objects. Defaults to True.
+
+    Returns:
+        Flask: loaded app
+    """
+    if not freeze:
+        return app_factory()
+    gc.disable()
+    try:
+        app = app_factory()
+    except BaseException:
+        # no app to fork: turn the gc back on
+        gc.enable()
+        raise
+    gc.freeze()
+    logger.info("froze %d objects before forking", gc.get_freeze_count())
+    return app
+
+
+def listen(host:str, port:int, backlog:int=1024) -> socket.socket:
+    """
+    Returns a listening TCP socket (`socket.create_server()` needs python 3.8; app.yaml targets python37).
+
+    Args:
+        host (str): address to listen on (ipv4 or ipv6)
+        port (int): port to listen on
+        backlog (int, optional): pending connections queue size. Defaults to 1024.
+
+    Returns:
+        socket.socket: listening socket
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        # restart the server without waiting for the connections of the previous one to time out
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(backlog)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def exit_code(status:int) -> int:
+    """
+    Returns the exit code of an `os.wait()` status, or minus the signal number that killed the process
+    (`os.waitstatus_to_exitcode()` needs python 3.9).
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def after_fork(app:Flask) -> None:
+    """
+    Prepares a new worker: re-enables the gc and lets the app's storage backend recreate its connections.
+
+    Args:
+        app (Flask): app loaded by the master process
+    """
+    gc.enable()
+    repo = app.config.get("repository")
+    if repo is not None and hasattr(repo, "after_fork"):
+        repo.after_fork()
+
+
+def _run_worker(app:Flask, sock:socket.socket, threaded:bool) -> None:
+    """serves requests on the shared socket; never returns"""
+    from werkzeug.serving import make_server
+    from dsa_common.logs import stop_logging
+
+    status = 0
+    try:
+        # stop serving on SIGTERM; the master handles SIGINT (ctrl+c)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        after_fork(app)
+        host, port = sock.getsockname()[:2]
+        server = make_server(host, port, app, threaded=threaded, fd=sock.fileno())
+        server.serve_forever()
+    except SystemExit:
+        pass
+    except BaseException:
+        logger.exception("worker %d failed", os.getpid())
+        status = 1
+    finally:
+        # write the queued log records (see `dsa_common.logs`), then never return into the master's code
+        stop_logging()
+        os._exit(status)
+
+
+def serve(app_factory:Callable[[], Flask], host:str="0.0.0.0", port:int=8080, workers:int=None,
+          threaded:bool=True, freeze:bool=True, access_log:bool=False) -> None:
+    """
+    Loads the app once, then serves it with `workers` forked processes until SIGTERM or SIGINT.
+
+    Args:
+        app_factory (Callable): creates the app and loads its data (for example: `create_app(preload=True)`)
+        host (str, optional): address to listen on. Defaults to "0.0.0.0".
+        port (int, optional): port to listen on. Defaults to 8080.
+        workers (int, optional): number of worker processes. Defaults to the number of cpus.
+        threaded (bool, optional): handle each request in a new thread of the worker. Defaults to True.
+        freeze (bool, optional): freeze the loaded objects before forking (see `load_app()`). Defaults to True.
+        access_log (bool, optional): log every request. Defaults to False.
+
+    Raises:
+        RuntimeError: os.fork() is not available (windows)
+    """
+    if not hasattr(os, "fork"):
+        raise RuntimeError("pre-fork serving needs os.fork(): use app.run() on this platform")
+    workers = workers or os.cpu_count() or 1
+    if not access_log:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    app = load_app(app_factory, freeze)
+    sock = listen(host, port)
+    logger.info("serving on http://%s:%d with %d workers (master pid %d)", host, port, workers, os.getpid())
+
+    children = {}       # worker pid >> start time
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, sock, threaded)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except InterruptedError:
+                continue
+            started = children.pop(pid, None)
+            if started is None or stopping:
+                continue
+            logger.warning("worker %d exited with status %d: restarting it", pid, exit_code(status))
+            time.sleep(max(0.0, started + RESTART_DELAY - time.monotonic()))
+            spawn()
+    finally:
+        sock.close()
+    logger.info("stopped all workers")
+
+
+# gunicorn config file hooks (see the module docs)
+preload_app = True
+
+
+def on_starting(server):
+    # runs in the master before it loads the app
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    after_fork(worker.app.wsgi())
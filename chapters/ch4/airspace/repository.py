@@ -0,0 +1,258 @@
+"""
+Storage backend interface for the Airspace APIs.
+
+The MySQL and BigQuery flask apps used to put the same airports/routes queries inline in their route
+handlers. Both apps now talk to an `AirspaceRepository` and only deal with HTTP params and responses.
+The storage backend is picked by the `backend` key in the app's config.yml (see `airspace.backends`):
+
+    - mysql:    MySQL database via SQLAlchemy
+    - bigquery: Google BigQuery tables
+    - sqlite:   a local SQLite database file (optionally loaded from the deb-*.csv files)
+    - memory:   an in-memory columnar store loaded from the deb-*.csv files
+
+Airport typeahead suggestions (`suggest_airports()`) are served by an in-memory `AirportIndex` (see
+`airspace.suggest`), built from the backend's airports and route counts on first use.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator
+
+from airspace.suggest import DEFAULT_SUGGEST_LIMIT, AirportIndex
+
+
+# columns returned for each airport and route
+AIRPORT_FIELDS = ["iata", "airport", "city", "state", "country", "lat", "lon"]
+ROUTE_FIELDS = ["airline", "src", "dest", "codeshare", "stops", "equipment"]
+
+
+def route_values(row:dict) -> tuple:
+    """convert a deb-routes.csv row into typed route column values"""
+    return (row["airline"], row["src"], row["dest"], row["codeshare"] or None, int(row["stops"]), row["equipment"])
+
+
+def airport_values(row:dict) -> tuple:
+    """convert a deb-airports.csv row into typed airport column values"""
+    return (row["iata"], row["airport"], row["city"], row["state"], row["country"], float(row["lat"]), float(row["lon"]))
+
+
+def normalize_code(code) -> str:
+    """
+    Normalizes an iata airport code (or None) the same way for all backends.
+
+    Args:
+        code: iata code
+
+    Returns:
+        str: stripped, upper case code or None
+    """
+    return None if code is None else str(code).strip().upper()
+
+
+class AirspaceRepository(ABC):
+    """
+    Base class for all airspace storage backends. All methods return lists of dict rows.
+
+    Backends must implement `from_config()`, `airports()` and `routes()`; `routes_batch()` falls back to one
+    `routes()` call per pair and `route_counts()` to counting all the routes, unless a backend
+    provides a faster version.
+    """
+
+    # backend name used in config.yml
+    name = None
+    # airport suggestions index; built on first use
+    _airport_index = None
+    _airport_index_lock = threading.Lock()
+
+    @classmethod
+    @abstractmethod
+    def from_config(cls, conf:dict) -> "AirspaceRepository":
+        """
+        Creates the backend from the app configuration (config.yml).
+
+        Args:
+            conf (dict): app configuration
+
+        Returns:
+            AirspaceRepository: new backend
+        """
+
+    @abstractmethod
+    def airports(self, iata:str=None) -> list:
+        """
+        Returns an airport by iata code or all airports (ordered by iata) if no iata code is given.
+
+        Args:
+            iata (str, optional): iata airport code. Defaults to None.
+
+        Returns:
+            list: list of dict airport rows
+        """
+
+    @abstractmethod
+    def routes(self, src:str=None, dest:str=None) -> list:
+        """
+        Returns airline routes by source and/or destination airport (ordered by airline). Returns
+        all the routes if neither are given.
+
+        Args:
+            src (str, optional): source iata code. Defaults to None.
+            dest (str, optional): destination iata code. Defaults to None.
+
+        Returns:
+            list: list of dict route rows
+        """
+
+    def iter_airports(self, iata:str=None) -> Iterator[list]:
+        """
+        Streams the `airports()` rows as lists of dict rows, for responses that serialize one list at a time.
+        Backends that download their results in batches (bigquery arrow results) yield one list per batch; the
+        others yield all the rows in a single list.
+
+        Args:
+            iata (str, optional): iata airport code. Defaults to None.
+
+        Returns:
+            Iterator[list]: lists of dict airport rows
+        """
+        return iter([self.airports(iata)])
+
+    def iter_routes(self, src:str=None, dest:str=None) -> Iterator[list]:
+        """
+        Streams the `routes()` rows as lists of dict rows (see `iter_airports()`).
+
+        Args:
+            src (str, optional): source iata code. Defaults to None.
+            dest (str, optional): destination iata code. Defaults to None.
+
+        Returns:
+            Iterator[list]: lists of dict route rows
+        """
+        return iter([self.routes(src, dest)])
+
+    def routes_batch(self, pairs:Iterable[tuple]) -> dict:
+        """
+        Returns the airline routes for many (src, dest) pairs at once.
+
+        Args:
+            pairs (Iterable[tuple]): list of (src, dest) iata code tuples
+
+        Returns:
+            dict: list of dict route rows keyed by (src, dest)
+        """
+        return {(src, dest): self.routes(src, dest) for src, dest in pairs}
+
+    def route_counts(self) -> dict:
+        """
+        Returns the number of routes from or to each airport.
+
+        Returns:
+            dict: route count keyed by iata code
+        """
+        counts = {}
+        for row in self.routes():
+            counts[row["src"]] = counts.get(row["src"], 0) + 1
+            counts[row["dest"]] = counts.get(row["dest"], 0) + 1
+        return counts
+
+    def airport_index(self) -> AirportIndex:
+        """
+        Returns the airport suggestions index; the first call builds it from `airports()` and `route_counts()`.
+
+        Returns:
+            AirportIndex: prefix index
+        """
+        if self._airport_index is None:
+            with self._airport_index_lock:
+                # check again: another thread might have built the index while we waited for the lock
+                if self._airport_index is None:
+                    self._airport_index = AirportIndex(self.airports(), self.route_counts())
+        return self._airport_index
+
+    def suggest_airports(self, query:str, limit:int=DEFAULT_SUGGEST_LIMIT) -> list:
+        """
+        Returns the airports with an iata code, airport name or city word starting with `query` (case
+        insensitive), ranked by route count. Never queries the backend once the index is built.
+
+        Args:
+            query (str): prefix typed by the user
+            limit (int, optional): max number of airports. Defaults to DEFAULT_SUGGEST_LIMIT.
+
+        Returns:
+            list: list of dict airport rows, with their `routes` count
+        """
+        return self.airport_index().suggest(query, limit)
+
+    def preload(self) -> None:
+        """
+        Loads everything requests need up front, so a pre-fork server (see `airspace.prefork`) loads it once in its
+        master process and all the workers share it. Builds the airport suggestions index.
+        """
+        self.airport_index()
+
+    def after_fork(self) -> None:
+        """Called in each forked worker: recreates the connections that can't be shared between processes"""
+        pass
+
+    def stats(self) -> dict:
+        """
+        Returns backend specific counters (for example: query coalescing counters).
+
+        Returns:
+            dict: counters
+        """
+        return {}
+
+    def close(self) -> None:
+        """Releases any connections held by this backend"""
+        pass
+
+
+class SqlRepository(AirspaceRepository):
+    """
+    Base class for SQL database backends using `:name` style query parameters. Subclasses implement `execute()`
+    and can override the SELECT column lists for their SQL dialect.
+    """
+
+    # column lists (with any dialect specific casts)
+    airport_columns = ", ".join(AIRPORT_FIELDS)
+    route_columns = ", ".join(ROUTE_FIELDS)
+
+    @abstractmethod
+    def execute(self, sql:str, params:dict=None) -> list:
+        """
+        Executes a SQL query and returns all its rows.
+
+        Args:
+            sql (str): SQL query with `:name` style params
+            params (dict, optional): query params. Defaults to None.
+
+        Returns:
+            list: list of dict rows
+        """
+
+    def airports(self, iata:str=None) -> list:
+        if iata is not None:
+            # search for specific iata airport code
+            return self.execute(f"select {self.airport_columns} from airports where iata = :iata",
+                                {"iata": normalize_code(iata)})
+        # no iata code provided, return all airports
+        return self.execute(f"select {self.airport_columns} from airports order by iata")
+
+    def routes(self, src:str=None, dest:str=None) -> list:
+        params = {"src": normalize_code(src), "dest": normalize_code(dest)}
+        if src and not dest:
+            where = "where src = :src"
+        elif dest and not src:
+            where = "where dest = :dest"
+        elif src and dest:
+            where = "where src = :src and dest = :dest"
+        else:
+            where = ""
+        return self.execute(f"select {self.route_columns} from routes {where} order by airline", params)
+
+    def route_counts(self) -> dict:
+        rows = self.execute("select iata, count(*) as routes from "
+                            "(select src as iata from routes union all select dest as iata from routes) as codes "
+                            "group by iata")
+        return {row["iata"]: row["routes"] for row in rows}
@@ -0,0 +1,209 @@
+"""
+Result materialization for BigQuery query jobs.
+
+The airspace BigQuery app originally converted every result with a dict comprehension:
+
+    data = [{k: v for k, v in row.items()} for row in result]
+
+which walks every `Row` object in Python. This module keeps that behavior as the `rows` format and adds an
+`arrow` format which downloads the results as Arrow record batches (optionally via the BigQuery Storage API)
+and serializes each batch to JSON in bulk.
+
+Example:
+
+    materializer = ResultMaterializer(result_format="arrow")
+    rows = client.query(query, job_config).result()
+    data = materializer.records(rows)                               # list of dicts
+    # or, downloading and serializing one record batch at a time
+    body = json_chunks(materializer.record_lists(rows), envelope)   # streaming JSON chunks
+"""
+
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Iterable, Iterator
+
+
+# supported result formats
+#   - rows:  walk each bq Row object (the original list/dict comprehension)
+#   - arrow: fetch Arrow record batches and convert them in bulk
+RESULT_FORMATS = {"rows", "arrow"}
+
+
+def json_default(value):
+    """
+    JSON encoder fallback for types returned by BigQuery that the json module can't serialize.
+
+    Args:
+        value (object): value to encode
+
+    Returns:
+        object: a JSON serializable version of value
+    """
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def rows_to_records(rows:Iterable) -> list:
+    """
+    Converts BigQuery rows into a list of dicts one row at a time (the original approach).
+
+    Args:
+        rows (Iterable): a bq QueryJob, RowIterator or any iterable of bq Row objects
+
+    Returns:
+        list: list of dict rows
+    """
+    return [{k: v for k, v in row.items()} for row in rows]
+
+
+class ResultMaterializer:
+    """
+    Converts BigQuery query results into python records, JSON, or NDJSON using the configured result format.
+    """
+
+    def __init__(self, result_format:str="rows", use_bqstorage:bool=False, bqstorage_client=None):
+        """
+        Args:
+            result_format (str, optional): either 'rows' or 'arrow'. Defaults to 'rows'.
+            use_bqstorage (bool, optional): download arrow results via the BigQuery Storage read API. Defaults to False.
+            bqstorage_client (optional): an existing `bigquery_storage.BigQueryReadClient` to use. Created on first use
+                                         if `use_bqstorage` is set and no client is provided.
+
+        Raises:
+            ValueError: unknown result format
+        """
+        if result_format not in RESULT_FORMATS:
+            raise ValueError(f"Unknown result format: {result_format}. Must be one of {sorted(RESULT_FORMATS)}")
+        self.result_format = result_format
+        self.use_bqstorage = use_bqstorage
+        self._bqstorage_client = bqstorage_client
+
+    @classmethod
+    def from_config(cls, conf:dict) -> "ResultMaterializer":
+        """
+        Creates a materializer from the app config.yml values `result_format` and `use_bqstorage`.
+
+        Args:
+            conf (dict): app configuration
+
+        Returns:
+            ResultMaterializer: new materializer
+        """
+        return cls(result_format=conf.get("result_format", "rows"),
+                   use_bqstorage=bool(conf.get("use_bqstorage", False)))
+
+    @property
+    def bqstorage_client(self):
+        """the BigQuery Storage read client (or None if the storage API is not used)"""
+        if self.use_bqstorage and self._bqstorage_client is None:
+            # imported here since google-cloud-bigquery-storage is only required for this option
+            from google.cloud import bigquery_storage
+            self._bqstorage_client = bigquery_storage.BigQueryReadClient()
+        return self._bqstorage_client
+
+    def record_batches(self, result) -> Iterator:
+        """
+        Yields the query results as pyarrow RecordBatch objects.
+
+        Args:
+            result: a bq QueryJob or RowIterator
+
+        Returns:
+            Iterator: pyarrow.RecordBatch objects
+        """
+        # a QueryJob must be waited on to get its RowIterator
+        rows = result.result() if hasattr(result, "result") else result
+        return rows.to_arrow_iterable(bqstorage_client=self.bqstorage_client)
+
+    def record_lists(self, result, batch_size:int=10_000) -> Iterator[list]:
+        """
+        Yields the results as lists of dict rows; one list per arrow record batch (or per `batch_size`
+        rows for the 'rows' format).
+
+        Args:
+            result: a bq QueryJob or RowIterator
+            batch_size (int, optional): number of rows per list for the 'rows' format. Defaults to 10,000.
+
+        Returns:
+            Iterator[list]: lists of dict rows
+        """
+        if self.result_format == "rows":
+            records = []
+            for row in result:
+                records.append({k: v for k, v in row.items()})
+                if len(records) >= batch_size:
+                    yield records
+                    records = []
+            if records:
+                yield records
+        else:
+            for batch in self.record_batches(result):
+                # to_pylist() builds all the dicts for a batch in a single call
+                records = batch.to_pylist()
+                if records:
+                    yield records
+
+    def records(self, result) -> list:
+        """
+        Materializes all the results as a list of dicts.
+
+        Args:
+            result: a bq QueryJob or RowIterator
+
+        Returns:
+            list: list of dict rows
+        """
+        if self.result_format == "rows":
+            return rows_to_records(result)
+        data = []
+        for records in self.record_lists(result):
+            data.extend(records)
+        return data
+
+
+def ndjson_chunks(record_lists:Iterable[list]) -> Iterator[str]:
+    """
+    Encodes lists of dict rows as newline delimited JSON (NDJSON) text chunks; one chunk per list.
+
+    Args:
+        record_lists (Iterable[list]): lists of dict rows (see `ResultMaterializer.record_lists()`)
+
+    Returns:
+        Iterator[str]: NDJSON text chunks
+    """
+    dumps = json.dumps
+    for records in record_lists:
+        yield "\n".join([dumps(record, default=json_default) for record in records]) + "\n"
+
+
+def json_chunks(record_lists:Iterable[list], envelope:dict, result_key:str="result") -> Iterator[str]:
+    """
+    Encodes a JSON document in chunks: the envelope fields followed by a `result_key` list holding all the rows.
+    Each list of rows is encoded with a single `json.dumps()` call, and large responses can be streamed
+    without building the full response dict in memory.
+
+    Args:
+        record_lists (Iterable[list]): lists of dict rows (see `ResultMaterializer.record_lists()`)
+        envelope (dict): other response fields (for example: the GET params used for this query)
+        result_key (str, optional): name of the results list field. Defaults to "result".
+
+    Returns:
+        Iterator[str]: JSON text chunks
+    """
+    head = json.dumps(envelope, default=json_default)
+    # open the results list inside the envelope object: {"iata": "PDX", "result": [
+    yield head[:-1] + (", " if envelope else "") + json.dumps(result_key) + ": ["
+    separator = ""
+    for records in record_lists:
+        if not records:
+            continue
+        # encode the whole list as json and strip its enclosing brackets
+        yield separator + json.dumps(records, default=json_default)[1:-1]
+        separator = ", "
+    yield "]}"
@@ -0,0 +1,276 @@
+"""
+Compact, dictionary-encoded routes table.
+
+The airport, airline and equipment codes of deb-routes.csv repeat tens of thousands of times. Instead of one python
+string per row and column, the `RoutesTable` keeps every column as a numpy array of small integer ids. The ids point
+into a `SymbolTable` of unique codes. The airports `SymbolTable` is shared with the airports table: the id of an
+airport code is its row number in the airports table (airports are sorted by iata). Route airports that are missing
+from deb-airports.csv get the next ids.
+
+The routes are stored sorted by (src, dest), with CSR (compressed sparse row) style offsets:
+
+    edge_src      src id of each unique (src, dest) pair (an "edge" between two airports)
+    edge_dest     dest id of each edge; sorted by dest id per src
+    src_offsets   edges of src airport `s`: edge_dest[src_offsets[s]:src_offsets[s + 1]]
+    edge_offsets  routes (rows) of edge `e`: rows edge_offsets[e]:edge_offsets[e + 1]
+
+A route lookup is a binary search inside the small edge list of the src airport and returns a slice of rows.
+Rows are only decoded into dicts (with the shared code strings) when they are returned.
+"""
+
+import csv
+from array import array
+
+import numpy as np
+
+from airspace.repository import ROUTE_FIELDS
+
+
+def id_dtype(size:int) -> np.dtype:
+    """returns the smallest integer dtype for ids of a symbol table with `size` symbols"""
+    return np.dtype(np.int16) if size <= np.iinfo(np.int16).max else np.dtype(np.int32)
+
+
+class SymbolTable:
+    """
+    Maps string codes to integer ids (0, 1, 2, ...) and back.
+    """
+
+    def __init__(self, symbols:list=()):
+        """
+        Args:
+            symbols (list, optional): initial codes; they get ids in this order. Defaults to ().
+        """
+        self.symbols = []
+        self.ids = {}
+        for symbol in symbols:
+            self.add(symbol)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add(self, symbol:str) -> int:
+        """returns the id of a code; adds the code if it's new"""
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return symbol_id
+
+    def id_of(self, symbol:str) -> int:
+        """returns the id of a code; or -1 if the code is unknown"""
+        return self.ids.get(symbol, -1)
+
+    def decode(self, ids:np.ndarray) -> list:
+        """
+        Converts an array of ids back into their codes. The returned list shares the code strings of this
+        symbol table; no new strings are created.
+
+        Args:
+            ids (np.ndarray): array of ids
+
+        Returns:
+            list: list of codes
+        """
+        symbols = self.symbols
+        return [symbols[symbol_id] for symbol_id in ids.tolist()]
+
+    def ranks(self) -> np.ndarray:
+        """returns the alphabetical rank of each id (for sorting by code without decoding)"""
+        ranks = np.empty(len(self.symbols), dtype=np.int32)
+        ranks[np.argsort(np.array(self.symbols, dtype=object), kind="stable")] = np.arange(len(self.symbols))
+        return ranks
+
+
+class RoutesTable:
+    """
+    Dictionary encoded routes with CSR src >> dest adjacency. See the module docs.
+    """
+
+    # decoded codeshare values
+    CODESHARE = (None, "Y")
+
+    def __init__(self, airports:SymbolTable, airlines:SymbolTable, equipment:SymbolTable, columns:dict):
+        """
+        Use `RoutesTable.from_csv()` or `RoutesTable.from_rows()` to create a table.
+
+        Args:
+            airports (SymbolTable): airport codes (shared with the airports table)
+            airlines (SymbolTable): airline codes
+            equipment (SymbolTable): equipment codes
+            columns (dict): unsorted column id arrays: airline, src, dest, codeshare, stops, equipment
+        """
+        self.airports = airports
+        self.airlines = airlines
+        self.equipment_codes = equipment
+        num_rows = len(columns["src"])
+        num_airports = len(airports)
+
+        # rank of each row in the "ORDER BY airline, src, dest" order of the sql backends
+        airport_ranks = airports.ranks()
+        all_order = np.lexsort((airport_ranks[columns["dest"]], airport_ranks[columns["src"]],
+                                airlines.ranks()[columns["airline"]]))
+        rank = np.empty(num_rows, dtype=np.int32)
+        rank[all_order] = np.arange(num_rows)
+
+        # store the rows sorted by (src, dest, rank)
+        order = np.lexsort((rank, columns["dest"], columns["src"]))
+        self.airline = columns["airline"][order]
+        self.src = columns["src"][order]
+        self.dest = columns["dest"][order]
+        self.codeshare = columns["codeshare"][order]
+        self.stops = columns["stops"][order]
+        self.equipment = columns["equipment"][order]
+        self.rank = rank[order]
+        offset_type = np.int32
+
+        # CSR adjacency: unique (src, dest) edges and their row ranges
+        new_edge = np.ones(num_rows, dtype=bool)
+        new_edge[1:] = (self.src[1:] != self.src[:-1]) | (self.dest[1:] != self.dest[:-1])
+        edge_starts = np.flatnonzero(new_edge)
+        self.edge_src = self.src[edge_starts]
+        self.edge_dest = self.dest[edge_starts]
+        self.edge_offsets = np.append(edge_starts, num_rows).astype(offset_type)
+        self.src_offsets = np.zeros(num_airports + 1, dtype=offset_type)
+        np.cumsum(np.bincount(self.edge_src, minlength=num_airports), out=self.src_offsets[1:])
+
+        # rows ordered by (dest, rank) and all rows ordered by rank
+        self.dest_order = np.lexsort((self.rank, self.dest)).astype(offset_type)
+        self.dest_offsets = np.zeros(num_airports + 1, dtype=offset_type)
+        np.cumsum(np.bincount(self.dest, minlength=num_airports), out=self.dest_offsets[1:])
+        self.all_order = np.argsort(self.rank).astype(offset_type)
+
+    def __len__(self):
+        return len(self.src)
+
+    @classmethod
+    def from_rows(cls, rows, airports:SymbolTable=None) -> "RoutesTable":
+        """
+        Creates the table from route rows.
+
+        Args:
+            rows (Iterable): (airline, src, dest, codeshare, stops, equipment) tuples; codeshare is "Y" or empty
+            airports (SymbolTable, optional): shared airport codes; route only airports are added to it.
+                                              Defaults to a new SymbolTable.
+
+        Returns:
+            RoutesTable: new table
+        """
+        airports = airports if airports is not None else SymbolTable()
+        airlines, equipment = SymbolTable(), SymbolTable()
+        # encode the rows one at a time into compact python arrays (no per-row strings are kept)
+        airline_ids, src_ids, dest_ids = array("i"), array("i"), array("i")
+        codeshares, stops, equipment_ids = array("b"), array("b"), array("i")
+        for airline, src, dest, codeshare, num_stops, equipment_code in rows:
+            airline_ids.append(airlines.add(airline))
+            src_ids.append(airports.add(src))
+            dest_ids.append(airports.add(dest))
+            codeshares.append(1 if codeshare else 0)
+            stops.append(int(num_stops))
+            equipment_ids.append(equipment.add(equipment_code))
+
+        airport_type = id_dtype(len(airports))
+        airline_type, equipment_type = id_dtype(len(airlines)), id_dtype(len(equipment))
+        columns = {
+            "airline": np.frombuffer(airline_ids, dtype=np.int32).astype(airline_type),
+            "src": np.frombuffer(src_ids, dtype=np.int32).astype(airport_type),
+            "dest": np.frombuffer(dest_ids, dtype=np.int32).astype(airport_type),
+            "codeshare": np.frombuffer(codeshares, dtype=np.int8).astype(bool),
+            "stops": np.frombuffer(stops, dtype=np.int8).copy(),
+            "equipment": np.frombuffer(equipment_ids, dtype=np.int32).astype(equipment_type),
+        }
+        return cls(airports, airlines, equipment, columns)
+
+    @classmethod
+    def from_csv(cls, path:str, airports:SymbolTable=None) -> "RoutesTable":
+        """
+        Loads deb-routes.csv (airline,src,dest,codeshare,stops,equipment).
+
+        Args:
+            path (str): path to deb-routes.csv
+            airports (SymbolTable, optional): shared airport codes. Defaults to a new SymbolTable.
+
+        Returns:
+            RoutesTable: new table
+        """
+        with open(path, "r", encoding="utf-8", newline="") as csv_file:
+            reader = csv.reader(csv_file)
+            header = next(reader)
+            positions = [header.index(field) for field in ROUTE_FIELDS]
+            return cls.from_rows(([row[i] for i in positions] for row in reader), airports)
+
+    def nbytes(self) -> int:
+        """returns the memory used by the numpy arrays"""
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+
+    def src_rows(self, src_id:int) -> slice:
+        """returns the rows of a src airport id (sorted by dest id)"""
+        if not 0 <= src_id < len(self.src_offsets) - 1:
+            return slice(0, 0)
+        first, last = self.src_offsets[src_id:src_id + 2].tolist()
+        return slice(int(self.edge_offsets[first]), int(self.edge_offsets[last]))
+
+    def pair_rows(self, src_id:int, dest_id:int) -> slice:
+        """returns the rows of a (src, dest) airport id pair (ordered by airline)"""
+        if not 0 <= src_id < len(self.src_offsets) - 1:
+            return slice(0, 0)
+        first, last = self.src_offsets[src_id:src_id + 2].tolist()
+        edge = first + int(np.searchsorted(self.edge_dest[first:last], dest_id))
+        if edge == last or self.edge_dest[edge] != dest_id:
+            return slice(0, 0)
+        return slice(*self.edge_offsets[edge:edge + 2].tolist())
+
+    def dest_rows(self, dest_id:int) -> np.ndarray:
+        """returns the row numbers of a dest airport id (ordered by airline)"""
+        if not 0 <= dest_id < len(self.dest_offsets) - 1:
+            return self.dest_order[:0]
+        return self.dest_order[self.dest_offsets[dest_id]:self.dest_offsets[dest_id + 1]]
+
+    def destinations(self, src:str) -> list:
+        """returns the codes of all the airports with a route from `src`"""
+        src_id = self.airports.id_of(src)
+        if src_id < 0:
+            return []
+        return self.airports.decode(self.edge_dest[self.src_offsets[src_id]:self.src_offsets[src_id + 1]])
+
+    def lookup(self, src:str=None, dest:str=None) -> np.ndarray:
+        """
+        Finds routes by source and/or destination airport code.
+
+        Args:
+            src (str, optional): source iata code. Defaults to None.
+            dest (str, optional): destination iata code. Defaults to None.
+
+        Returns:
+            row numbers (ordered by airline, src, dest) as an array or slice; all the rows if neither are given
+        """
+        src_id = self.airports.id_of(src) if src else None
+        dest_id = self.airports.id_of(dest) if dest else None
+        if src_id is not None and dest_id is not None:
+            return self.pair_rows(src_id, dest_id)
+        if src_id is not None:
+            rows = self.src_rows(src_id)
+            # reorder the src rows (sorted by dest) by airline
+            return rows.start + np.argsort(self.rank[rows], kind="stable")
+        if dest_id is not None:
+            return self.dest_rows(dest_id)
+        return self.all_order
+
+    def rows(self, row_ids) -> list:
+        """
+        Decodes rows into a list of dict rows.
+
+        Args:
+            row_ids: array, list, or slice of row numbers
+
+        Returns:
+            list: list of dict route rows
+        """
+        airlines, airports, equipment = self.airlines.symbols, self.airports.symbols, self.equipment_codes.symbols
+        codeshare = self.CODESHARE
+        columns = zip(self.airline[row_ids].tolist(), self.src[row_ids].tolist(), self.dest[row_ids].tolist(),
+                      self.codeshare[row_ids].tolist(), self.stops[row_ids].tolist(), self.equipment[row_ids].tolist())
+        # the rows share the code strings of the symbol tables
+        return [dict(zip(ROUTE_FIELDS, (airlines[airline], airports[src], airports[dest], codeshare[shared], stops,
+                                        equipment[equipment_id])))
+                for airline, src, dest, shared, stops, equipment_id in columns]
@@ -0,0 +1,157 @@
+"""
+Request coalescing (single-flight) for identical concurrent queries.
+
+When many clients ask for the same popular route at the same time, each flask request thread would start its
+own identical BigQuery job. A `SingleFlight` group lets the first caller (the leader) run the query while every
+other caller with the same key waits for, and shares, the leader's result.
+
+Example:
+
+    flights = SingleFlight()
+    key = query_key(query, {"src": "PDX", "dest": "SEA"})
+    data = flights.do(key, lambda: run_query(query))
+"""
+
+import copy
+import threading
+from typing import Any, Callable, Hashable
+
+
+def query_key(query:str, params:dict=None) -> tuple:
+    """
+    Creates a hashable single-flight key from a SQL query and its parameters.
+
+    Args:
+        query (str): SQL query text
+        params (dict, optional): query parameters. Defaults to None.
+
+    Returns:
+        tuple: hashable key
+    """
+    # normalize whitespace so the same query written with different indentation shares a key
+    sql = " ".join(query.split())
+    items = tuple(sorted((params or {}).items(), key=lambda kv: kv[0]))
+    return (sql, items)
+
+
+class SingleFlightError(Exception):
+    """
+    Raised in the waiting callers when the leader's call was interrupted (KeyboardInterrupt, SystemExit...), or
+    raised an exception that can't be copied. The leader's exception is its `__cause__`.
+    """
+
+
+def _waiter_error(error:BaseException) -> Exception:
+    """
+    Returns a copy of the leader's exception for a waiting caller: raising the same exception object in several
+    threads would chain every waiter's traceback onto it.
+    """
+    if isinstance(error, Exception):
+        try:
+            return copy.copy(error)
+        except Exception:
+            pass
+    return SingleFlightError(f"the coalesced call failed: {error!r}")
+
+
+class _Call:
+    """an in-flight call: the leader's result (or error) and the event waiters block on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into a single execution. Results are NOT cached: once the
+    leader's call completes, the next call with the same key executes again.
+
+    Callers share the very same result object, so results should be treated as read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # counters
+        self._total_calls = 0           # number of calls to do()
+        self._executions = 0            # number of calls that actually executed (leaders)
+        self._deduplicated = 0          # number of calls that shared a leader's result
+        self._errors = 0                # number of executions that raised an exception
+        self._max_in_flight = 0         # maximum number of distinct keys executing at the same time
+        self._max_waiters = 0           # maximum number of callers sharing a single execution
+
+    def do(self, key:Hashable, fn:Callable[[], Any]) -> Any:
+        """
+        Executes `fn()` unless a call with the same key is already in flight; in which case waits for that call
+        and returns its result. When the leader's call raises, each waiting caller raises its own copy of the
+        exception (chained to the leader's), or a `SingleFlightError`.
+
+        Args:
+            key (Hashable): call key; see `query_key()`
+            fn (Callable): function to execute
+
+        Returns:
+            Any: the result of fn()
+
+        Raises:
+            SingleFlightError: the leader's call was interrupted (waiting callers only)
+        """
+        with self._lock:
+            self._total_calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                # another thread is already running this query: wait for it
+                call.waiters += 1
+                self._deduplicated += 1
+                self._max_waiters = max(self._max_waiters, call.waiters)
+                leader = False
+            else:
+                # this thread is the leader for this key
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+                self._max_in_flight = max(self._max_in_flight, len(self._calls))
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise _waiter_error(call.error) from call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as err:
+            # any exit without a result, including KeyboardInterrupt, must fail the waiters
+            call.error = err
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            # remove the call before waking up the waiters so new callers start a fresh execution
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        """
+        Returns the concurrency and dedupe counters.
+
+        Returns:
+            dict: counters
+        """
+        with self._lock:
+            return {
+                "calls": self._total_calls,
+                "executions": self._executions,
+                "deduplicated": self._deduplicated,
+                "errors": self._errors,
+                "in_flight": len(self._calls),
+                "waiting": sum(call.waiters for call in self._calls.values()),
+                "max_in_flight": self._max_in_flight,
+                "max_waiters": self._max_waiters,
+            }
@@ -0,0 +1,101 @@
+"""
+Typeahead search of airports by iata code, airport name, or city.
+
+`AirportIndex` is a sorted-array prefix index: every airport gets one key per word of its iata code, airport name and
+city, from that word to the end of the field (`"san francisco international"`, `"francisco international"`,
+`"international"`, ...). The keys are lower case and sorted, so the keys starting with a prefix are one contiguous
+range found by two binary searches:
+
+    keys        ["francisco international", "international", ..., "san francisco", "san francisco international"]
+    key_ranks   rank of the airport of each key
+
+Airports are ranked by their number of routes (from or to the airport). The suggestions for a prefix are the
+best ranked airports of its key range; an exact iata code match always comes first. Building the index only needs
+the airports and route counts once from the storage backend; lookups never query it.
+"""
+
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+
+DEFAULT_SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 100
+# longest key kept per word: longer queries are matched on their first KEY_LENGTH characters, then filtered
+KEY_LENGTH = 32
+# sorts after any character of a key
+LAST_CHAR = chr(0x10FFFF)
+
+WORD = re.compile(r"\w+")
+
+
+def normalize_text(text:str) -> str:
+    """lower case text with single spaces between words (punctuation is dropped)"""
+    return " ".join(WORD.findall(str(text).casefold()))
+
+
+class AirportIndex:
+    """
+    Prefix index of airports ranked by route count. See the module docs.
+    """
+
+    def __init__(self, airports:list, route_counts:dict):
+        """
+        Args:
+            airports (list): dict airport rows (with iata, airport and city fields)
+            route_counts (dict): number of routes by iata code
+        """
+        # airports in rank order: most routes first, then by iata code
+        ranked = sorted(airports, key=lambda row: (-route_counts.get(row["iata"], 0), row["iata"]))
+        # suggestions are returned as-is: build them once
+        self.suggestions = [{**row, "routes": route_counts.get(row["iata"], 0)} for row in ranked]
+        self.iata_ranks = {normalize_text(row["iata"]): rank for rank, row in enumerate(ranked)}
+        # full text of each airport (for queries longer than the keys)
+        self.texts = []
+
+        keys = []
+        for rank, row in enumerate(ranked):
+            fields = [normalize_text(row[field] or "") for field in ("iata", "airport", "city")]
+            self.texts.append(fields)
+            for text in set(fields):
+                # one key per word start
+                for word in WORD.finditer(text):
+                    keys.append((text[word.start():word.start() + KEY_LENGTH], rank))
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.key_ranks = np.array([rank for _, rank in keys], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def suggest(self, query:str, limit:int=DEFAULT_SUGGEST_LIMIT) -> list:
+        """
+        Finds the airports with an iata code, airport name or city word starting with `query` (ignoring case).
+
+        Args:
+            query (str): prefix typed by the user
+            limit (int, optional): max number of airports. Defaults to DEFAULT_SUGGEST_LIMIT.
+
+        Returns:
+            list: dict airport rows with their `routes` count, best ranked first
+        """
+        prefix = normalize_text(query)
+        if not prefix or limit <= 0:
+            return []
+        key_prefix = prefix[:KEY_LENGTH]
+        first = bisect_left(self.keys, key_prefix)
+        last = bisect_left(self.keys, key_prefix + LAST_CHAR, first)
+        # unique ranks, best first
+        ranks = np.unique(self.key_ranks[first:last]).tolist()
+        if len(prefix) > KEY_LENGTH:
+            # the keys only matched the start of the query
+            ranks = [rank for rank in ranks if any(self._has_word_prefix(text, prefix) for text in self.texts[rank])]
+        exact = self.iata_ranks.get(prefix)
+        if exact is not None:
+            ranks = [exact] + [rank for rank in ranks if rank != exact]
+        return [self.suggestions[rank] for rank in ranks[:limit]]
+
+    @staticmethod
+    def _has_word_prefix(text:str, prefix:str) -> bool:
+        return any(text.startswith(prefix, word.start()) for word in WORD.finditer(text))
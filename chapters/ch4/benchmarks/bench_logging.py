@@ -0,0 +1,152 @@
+"""
+Benchmark: per-request logging overhead of the flask apps (dsa_common.logs).
+
+Serves --requests GET requests with the flask test client, from a small app that logs one line per request (like
+the `/routes` handlers), in a new process for each logging setup:
+
+    - disabled:        no logging (baseline)
+    - basicConfig:     the previous setup: f-string message, formatted and written to the stream by the request thread
+    - queue json:      `setup_logging()`: the request thread only queues the record, a background thread formats it
+    - queue sampled:   `setup_logging()` and a `sampled()` logger keeping --sample-rate of the request logs
+
+The logs are written to a temporary file. --write-delay-us adds a delay to each write, like a slow stderr pipe (a
+busy container log driver or terminal). Prints the time of a log call in the calling thread, the mean and p99
+latency of the requests (best of --repeat runs), the overhead per request compared to the baseline, and the time to
+write the queued records after the last request. On a single cpu, the background thread formats and writes the
+queued records between requests: it takes the same cpu time, but no longer blocks the requests.
+
+usage: python bench_logging.py [--requests 20000] [--repeat 3] [--write-delay-us 0] [--sample-rate 0.01]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+SETUPS = ["disabled", "basicConfig", "queue json", "queue sampled"]
+TEXT_FORMAT = '[%(levelname)-5s][%(asctime)s][%(module)s:%(lineno)04d] : %(message)s'
+
+
+class SlowStream:
+    """file stream that waits `delay` seconds on every write"""
+
+    def __init__(self, stream, delay:float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text:str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def serve_requests(setup:str, log_path:str, requests:int, delay:float, rate:float, results) -> None:
+    """logs one line per request; puts (log call, mean, p99, drain time, log size) on the results queue"""
+    import logging
+    from flask import Flask, request
+    from dsa_common.logs import sampled, setup_logging, stop_logging
+
+    stream = SlowStream(open(log_path, "w"), delay)
+    listener = None
+    if setup == "disabled":
+        logging.disable(logging.CRITICAL)
+    elif setup == "basicConfig":
+        logging.basicConfig(format=TEXT_FORMAT, level=logging.INFO, stream=stream)
+    else:
+        listener = setup_logging("INFO", "json", stream)
+    logger = logging.getLogger("bench")
+    request_logger = sampled(logger, rate if setup == "queue sampled" else 1)
+    # the werkzeug request log is not written by the test client
+
+    app = Flask(__name__)
+
+    @app.route("/routes")
+    def routes():
+        src = request.args.get("src")
+        dest = request.args.get("dest")
+        if setup == "basicConfig":
+            logger.info(f"query routes for src: {src} and dest: {dest}")
+        else:
+            request_logger.info("query routes for src: %s and dest: %s", src, dest, extra={"src": src, "dest": dest})
+        return {"src": src, "dest": dest, "result": []}
+
+    # log calls only. The logging thread is stopped while timing them (on a single cpu, it would take turns with the
+    #   timed calls), then restarted to write the queued records
+    src, dest = "PDX", "SEA"
+    calls, elapsed = 0, 0.0
+    for _ in range(20):
+        if listener is not None:
+            listener.stop()
+        start = time.perf_counter()
+        for _ in range(500):
+            if setup == "basicConfig":
+                logger.info(f"query routes for src: {src} and dest: {dest}")
+            else:
+                request_logger.info("query routes for src: %s and dest: %s", src, dest,
+                                    extra={"src": src, "dest": dest})
+        elapsed += time.perf_counter() - start
+        calls += 500
+        if listener is not None:
+            listener.start()
+        time.sleep(0.05 + 500 * delay)
+    log_call = elapsed / calls
+
+    client = app.test_client()
+    for _ in range(200):
+        client.get("/routes?src=PDX&dest=SEA")
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        client.get(f"/routes?src=PDX&dest=S{i % 100:02d}")
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    stop_logging()
+    logging.shutdown()
+    drain = time.perf_counter() - start
+    stream.flush()
+    latencies.sort()
+    results.put((log_call, sum(latencies) / len(latencies), latencies[int(len(latencies) * 0.99)], drain,
+                 os.path.getsize(log_path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="logging overhead benchmark")
+    parser.add_argument("-n", "--requests", type=int, default=20_000, help="number of requests per setup")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per setup; the best one is reported")
+    parser.add_argument("--write-delay-us", type=float, default=0, help="delay of each log write (microseconds)")
+    parser.add_argument("--sample-rate", type=float, default=0.01, help="sample rate of the sampled setup")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    log_dir = tempfile.mkdtemp(prefix="logs_")
+    print(f"{args.requests} requests, {args.write_delay_us:.0f} us per log write:")
+    baseline = None
+    try:
+        for setup in SETUPS:
+            log_path = os.path.join(log_dir, f"{setup.replace(' ', '_')}.log")
+            runs = []
+            for _ in range(args.repeat):
+                results = context.Queue()
+                process = context.Process(target=serve_requests, args=(setup, log_path, args.requests,
+                                                                       args.write_delay_us / 1e6, args.sample_rate,
+                                                                       results))
+                process.start()
+                runs.append(results.get())
+                process.join()
+            log_call, mean, p99, drain, size = min(runs, key=lambda run: run[1])
+            baseline = mean if baseline is None else baseline
+            print(f"  {setup:<14s} log call {log_call * 1e6:6.1f} us  request mean {mean * 1e6:6.1f} us  "
+                  f"p99 {p99 * 1e6:7.1f} us  overhead {(mean - baseline) * 1e6:+6.1f} us/request  "
+                  f"drain {drain * 1000:6.1f} ms  log {size / 1024:7.1f} KB")
+    finally:
+        for name in os.listdir(log_dir):
+            os.remove(os.path.join(log_dir, name))
+        os.rmdir(log_dir)
+
+
+if __name__ == "__main__":
+    main()
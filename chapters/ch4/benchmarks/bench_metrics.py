@@ -0,0 +1,129 @@
+"""
+Benchmark: per-request overhead of the request metrics middleware (airspace.metrics).
+
+Calls the wsgi app of a small flask app (a `/routes` handler with a timed backend call, like the airspace apps)
+directly with a prebuilt environ, without a server or the flask test client whose own cost would hide a few
+microseconds. Each of --rounds rounds runs a batch of --requests requests with each setup:
+
+    - plain:    the app without metrics
+    - metrics:  the same app with `init_metrics(app)`
+
+Both setups use the same app object: the middleware is switched on and off between batches (two separate but
+identical flask apps differ by several microseconds per request on their own). The gc runs between rounds only.
+Reports the median request time of each setup, and the median of the differences of the rounds: the overhead per
+request. Also times the parts of the overhead (`observe()`, an empty `backend_time()` block) and the rendering of
+/metrics.
+
+usage: python bench_metrics.py [--requests 300] [--rounds 150] [--routes 20]
+"""
+
+import gc
+import time
+import logging
+import argparse
+import statistics
+
+from flask import Flask, request
+from werkzeug.test import EnvironBuilder
+
+# the installed chapter 4 `airspace` package (see airspace/README.md)
+from airspace.metrics import RequestTimer, backend_time, init_metrics
+
+
+ROUTES = {("PDX", "SEA"): [{"airline": "AS", "src": "PDX", "dest": "SEA", "stops": 0}]}
+
+
+def make_app(extra_routes:int) -> Flask:
+    """the `/routes` handler, and `extra_routes` empty routes"""
+    app = Flask(__name__)
+
+    @app.route("/routes")
+    def routes():
+        src = request.args.get("src")
+        dest = request.args.get("dest")
+        with backend_time():
+            data = ROUTES.get((src, dest), [])
+        return {"src": src, "dest": dest, "result": data}
+
+    for i in range(extra_routes):
+        app.add_url_rule(f"/route-{i}", f"route_{i}", lambda: "")
+    init_metrics(app)
+    return app
+
+
+def start_response(status, headers, exc_info=None):
+    return None
+
+
+def run_batch(wsgi_app, environ:dict, requests:int) -> float:
+    """mean time of a request, including iterating and closing the response body"""
+    start = time.perf_counter()
+    for _ in range(requests):
+        body = wsgi_app(dict(environ), start_response)
+        for _ in body:
+            pass
+        if hasattr(body, "close"):
+            body.close()
+    return (time.perf_counter() - start) / requests
+
+
+def time_calls(name:str, func, calls:int=100_000) -> None:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    print(f"  {name:<36s} {(time.perf_counter() - start) / calls * 1e6:7.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="request metrics overhead benchmark")
+    parser.add_argument("-n", "--requests", type=int, default=300, help="requests per batch")
+    parser.add_argument("-r", "--rounds", type=int, default=150, help="batches per setup")
+    parser.add_argument("--routes", type=int, default=20, help="routes x status codes to render on /metrics")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    app = make_app(args.routes // 2)
+    metrics = app.extensions["metrics"]
+    environ = EnvironBuilder(path="/routes", query_string="src=PDX&dest=SEA").get_environ()
+    setups = ["plain", "metrics"]
+    means = {name: [] for name in setups}
+    gc.disable()
+    for i in range(args.rounds + 1):
+        # alternate the setups, so that both see the same machine noise
+        for name in setups:
+            mean = run_batch(metrics.wsgi_app if name == "plain" else metrics, environ, args.requests)
+            # the first round warms up
+            if i > 0:
+                means[name].append(mean)
+        gc.collect()
+    gc.enable()
+
+    print(f"{args.rounds} rounds of {args.requests} requests per setup:")
+    for name in setups:
+        print(f"  {name:<8s} {statistics.median(means[name]) * 1e6:7.1f} us/request")
+    overhead = statistics.median(metrics_mean - plain_mean
+                                 for plain_mean, metrics_mean in zip(means["plain"], means["metrics"]))
+    print(f"  overhead {overhead * 1e6:+7.2f} us/request ({overhead / statistics.median(means['plain']) * 100:+.1f}%)")
+
+    metrics.reset()
+    print("parts:")
+    timer = RequestTimer(environ)
+    timer.status = "200"
+    time_calls("RequestTimer()", lambda: RequestTimer(environ))
+    time_calls("observe()", lambda: metrics.observe(timer, 0.0042))
+
+    def empty_block():
+        with backend_time():
+            pass
+    time_calls("backend_time() outside a request", empty_block)
+
+    for i in range(args.routes):
+        timer = RequestTimer({**environ, "PATH_INFO": f"/route-{i // 2}"})
+        timer.status = "200" if i % 2 == 0 else "404"
+        metrics.observe(timer, 0.001 * i)
+    text = metrics.render()
+    time_calls(f"render /metrics ({len(text) // 1024} KB)", metrics.render, 200)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Benchmark: pre-fork serving (airspace.prefork) of the airspace API (ep2/python/ex3, memory backend) or of the pandas
+/people API (ep3/python/ex2, loaded from a generated csv of --people rows).
+
+Serves the app with --workers processes in each mode:
+
+    - lazy:    each worker loads its own data on its first request (what separate app processes do)
+    - preload: the master loads the data once before forking the workers
+    - freeze:  preload, and the master freezes the loaded objects (gc.freeze) before forking
+
+then runs --clients keep-alive client threads for --seconds and reports the requests per second and the memory of
+each worker from /proc/<pid>/smaps_rollup: RSS, PSS (shared pages divided between the processes sharing them) and
+private (pages only this process uses). The sum of the PSS of the master and its workers is the real memory used.
+
+usage: python bench_prefork.py [--app airspace|people] [--workers 4] [--clients 8] [--seconds 10] [--people 500000]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import importlib.util
+
+import yaml
+
+# the apps of chapter 4 (they import the installed `airspace` package, see airspace/README.md)
+CH4_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+from bench_repository import DEFAULT_CONF
+
+
+MODES = ["lazy", "preload", "freeze"]
+JOBS = ["Translator", "Illustrator", "Pilot", "Data Engineer", "Community Education Officer", "Nurse"]
+
+
+def load_module(name:str, path:str):
+    """imports an app's main.py under a unique module name"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class LoadOnFirstRequest:
+    """wsgi app that creates the real app on its first request; so each worker loads its own copy of the data"""
+
+    def __init__(self, app_factory):
+        self.app_factory = app_factory
+        self.app = None
+        self.config = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if self.app is None:
+            with self._lock:
+                if self.app is None:
+                    self.app = self.app_factory()
+        return self.app(environ, start_response)
+
+
+def app_factory(app_name:str, work_dir:str):
+    """returns a function that creates the app and loads its data"""
+    if app_name == "people":
+        # the people app loads PEOPLE_CSV when its module is imported
+        os.environ["PEOPLE_CSV"] = os.path.join(work_dir, "people.csv")
+
+        def create_people_app():
+            main = load_module("people_app", os.path.join(CH4_DIR, "ep3/python/ex2/main.py"))
+            main.preload_index()
+            main.app.config["read_only"] = True
+            return main.app
+        return create_people_app
+
+    config_path = os.path.join(work_dir, "config.yml")
+    with open(config_path, "w") as open_yaml:
+        yaml.dump({**DEFAULT_CONF, "backend": "memory"}, open_yaml)
+    main = load_module("airspace_app", os.path.join(CH4_DIR, "ep2/python/ex3/main.py"))
+    return lambda: main.create_app(config_path, preload=True)
+
+
+def serve(args) -> None:
+    """server process of one mode"""
+    from airspace import prefork
+    factory = app_factory(args.app, args.work_dir)
+    if args.serve == "lazy":
+        lazy_app = LoadOnFirstRequest(factory)
+        factory = lambda: lazy_app
+    prefork.serve(factory, "127.0.0.1", args.port, args.workers, freeze=args.serve == "freeze")
+
+
+def request_paths(app_name:str, people:int, count:int=5000) -> list:
+    """random GET requests"""
+    rnd = random.Random(42)
+    if app_name == "people":
+        return [f"/people?name=person-{rnd.randrange(people)}" for _ in range(count)]
+    airports = ["ATL", "ORD", "DFW", "DEN", "LAX", "SFO", "SEA", "PDX", "JFK", "BOS", "MIA", "PHX"]
+    paths = []
+    for _ in range(count):
+        kind = rnd.random()
+        if kind < 0.4:
+            paths.append(f"/airports/suggest?q={rnd.choice(['s', 'sa', 'san', 'new', 'po', 'b', 'chi', 'la'])}")
+        elif kind < 0.8:
+            paths.append(f"/routes?src={rnd.choice(airports)}&dest={rnd.choice(airports)}")
+        else:
+            paths.append(f"/airports?iata={rnd.choice(airports)}")
+    return paths
+
+
+def run_clients(port:int, paths:list, clients:int, seconds:float) -> tuple:
+    """keep-alive GET requests from `clients` threads; returns the number of ok and failed requests"""
+    counts = [[0, 0] for _ in range(clients)]
+    stop_at = time.monotonic() + seconds
+
+    def client(counter:list, offset:int):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        i = offset
+        while time.monotonic() < stop_at:
+            try:
+                conn.request("GET", paths[i % len(paths)])
+                response = conn.getresponse()
+                response.read()
+                counter[0 if response.status == 200 else 1] += 1
+            except (OSError, http.client.HTTPException):
+                counter[1] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            i += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(counts[i], i * 997)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(ok for ok, _ in counts), sum(failed for _, failed in counts)
+
+
+def memory_mb(pid:int) -> dict:
+    """Rss, Pss and private memory of a process in MB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {"rss": values["Rss"], "pss": values["Pss"],
+            "private": values["Private_Clean"] + values["Private_Dirty"]}
+
+
+def worker_pids(pid:int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as children:
+        return [int(child) for child in children.read().split()]
+
+
+def wait_for_port(port:int, timeout:float=60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"server did not start on port {port}")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_people_csv(path:str, people:int) -> None:
+    rnd = random.Random(7)
+    with open(path, "w") as csv_file:
+        csv_file.write("name,job,age\n")
+        for i in range(people):
+            csv_file.write(f"person-{i},{rnd.choice(JOBS)},{rnd.randint(18, 90)}\n")
+
+
+def benchmark(args, mode:str, paths:list) -> None:
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), "--serve", mode, "--app", args.app, "--workers",
+               str(args.workers), "--port", str(port), "--work-dir", args.work_dir]
+    server = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        # warm up: lazy workers load their data on their first request
+        run_clients(port, paths, args.clients, 2)
+        ok, failed = run_clients(port, paths, args.clients, args.seconds)
+        master = memory_mb(server.pid)
+        workers = [memory_mb(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+    total_pss = master["pss"] + sum(worker["pss"] for worker in workers)
+    print(f"  {mode:<8s} {ok / args.seconds:8.0f} req/s  ({failed} failed)  total PSS {total_pss:7.1f} MB  "
+          f"master RSS {master['rss']:6.1f} MB")
+    for worker in workers:
+        print(f"           worker RSS {worker['rss']:7.1f} MB  PSS {worker['pss']:7.1f} MB  "
+              f"private {worker['private']:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pre-fork serving benchmark")
+    parser.add_argument("--app", choices=["airspace", "people"], default="airspace", help="app to serve")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="worker processes")
+    parser.add_argument("-c", "--clients", type=int, default=8, help="concurrent client threads")
+    parser.add_argument("-s", "--seconds", type=float, default=10, help="load test duration per mode")
+    parser.add_argument("--people", type=int, default=500_000, help="rows of the people csv")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="serving modes to compare")
+    # internal: server process of one mode
+    parser.add_argument("--serve", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args)
+
+    args.work_dir = tempfile.mkdtemp(prefix="prefork_")
+    try:
+        if args.app == "people":
+            write_people_csv(os.path.join(args.work_dir, "people.csv"), args.people)
+        paths = request_paths(args.app, args.people)
+        print(f"{args.app} app: {args.workers} workers, {args.clients} clients, {args.seconds:.0f} s per mode "
+              f"({os.cpu_count()} cpus)")
+        for mode in args.modes:
+            benchmark(args, mode, paths)
+    finally:
+        shutil.rmtree(args.work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: airspace storage backends.
+
+Times the same airport and route lookups against each backend. The memory and sqlite backends are loaded from
+the deb-*.csv files; the mysql and bigquery backends are benchmarked when an app config.yml is passed.
+
+usage: python bench_repository.py [--config path/to/config.yml] [--backends memory sqlite ...] [--lookups N]
+"""
+
+import os
+import time
+import random
+import logging
+import argparse
+
+import yaml
+
+# the installed chapter 4 `airspace` package (see airspace/README.md)
+from airspace.backends import create_repository
+
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../ch2/ep1/data"))
+DEFAULT_CONF = {
+    "airports_csv": os.path.join(DATA_DIR, "deb-airports.csv"),
+    "routes_csv": os.path.join(DATA_DIR, "deb-routes.csv"),
+}
+
+
+def timeit(label:str, func, args:list) -> None:
+    """time func(*arg) for each arg; print the mean and p99 latency"""
+    latencies = []
+    for arg in args:
+        start = time.perf_counter()
+        func(*arg)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"  {label:<24s} mean {mean * 1e6:10.1f} us   p99 {p99 * 1e6:10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Airspace backends benchmark")
+    parser.add_argument("-c", "--config", help="app config.yml (for the mysql and bigquery backends)", default=None)
+    parser.add_argument("-b", "--backends", nargs="+", default=None, help="backends to benchmark")
+    parser.add_argument("-n", "--lookups", type=int, default=1000, help="number of lookups per query type")
+    args = parser.parse_args()
+
+    conf = dict(DEFAULT_CONF)
+    backends = ["memory", "sqlite"]
+    if args.config:
+        with open(args.config) as open_yaml:
+            conf.update(yaml.full_load(open_yaml))
+        backends.append(conf["backend"])
+    backends = args.backends or backends
+
+    # pick random lookups from the routes file, so most of them have results
+    start = time.perf_counter()
+    reference = create_repository(conf, "memory")
+    reference_startup = time.perf_counter() - start
+    routes = reference.routes()
+    rnd = random.Random(42)
+    sample = [rnd.choice(routes) for _ in range(args.lookups)]
+    iatas = [(row["src"],) for row in sample]
+    pairs = [(row["src"], row["dest"]) for row in sample]
+
+    logging.disable(logging.INFO)
+    for backend in backends:
+        start = time.perf_counter()
+        repo = reference if backend == "memory" else create_repository(conf, backend)
+        startup = reference_startup if backend == "memory" else time.perf_counter() - start
+        print(f"{backend} (startup {startup:.2f}s)")
+        timeit("airports(iata)", repo.airports, iatas)
+        timeit("routes(src)", lambda src: repo.routes(src=src), iatas)
+        timeit("routes(src, dest)", repo.routes, pairs)
+        timeit("routes_batch(100 pairs)", repo.routes_batch,
+               [(pairs[i:i + 100],) for i in range(0, min(len(pairs), 2000), 100)])
+        timeit("routes() all", repo.routes, [()] * 5)
+        repo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark: BigQuery result materialization, dict comprehension (rows) vs Arrow record batches (arrow).
+
+Uses a stubbed bq client and RowIterator so no GCP project is required. All the paths serialize the same
+routes-like result set into a JSON response body; the `iter_routes` paths are the /routes response of the
+BigQuery app: `BigQueryRepository.iter_routes()` serialized by `json_chunks()` (streamed per arrow record batch)
+or collected into a single list ('rows' result format).
+
+usage: python bench_results.py [num_rows]
+"""
+
+import sys
+import json
+import time
+import random
+
+import pyarrow as pa
+from google.cloud.bigquery.table import Row
+
+# the installed chapter 4 `airspace` package (see airspace/README.md)
+from airspace.backends.bigquery import BigQueryRepository
+from airspace.results import ResultMaterializer, json_chunks, json_default
+
+
+FIELDS = ["airline", "src", "dest", "codeshare", "stops", "equipment"]
+
+
+class FakeRowIterator:
+    """
+    Stub of `google.cloud.bigquery.table.RowIterator` serving a fixed result set as bq Rows or Arrow batches.
+    """
+
+    def __init__(self, columns:dict, batch_size:int=10_000):
+        self.columns = columns
+        self.batch_size = batch_size
+        self.num_rows = len(next(iter(columns.values())))
+        self.field_index = {name: i for i, name in enumerate(columns)}
+
+    def __iter__(self):
+        values = list(zip(*self.columns.values()))
+        for row in values:
+            yield Row(row, self.field_index)
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        table = pa.table(self.columns)
+        return iter(table.to_batches(max_chunksize=self.batch_size))
+
+
+class FakeQueryJob:
+    """Stub of a bq QueryJob"""
+
+    def __init__(self, rows:FakeRowIterator):
+        self.rows = rows
+
+    def result(self):
+        return self.rows
+
+    def __iter__(self):
+        # like a QueryJob: iterating waits for the results
+        return iter(self.rows)
+
+
+class FakeClient:
+    """Stub of a `bq.Client` answering every query with the same result set"""
+
+    def __init__(self, rows:FakeRowIterator):
+        self.rows = rows
+
+    def query(self, query, job_config=None):
+        return FakeQueryJob(self.rows)
+
+
+def make_columns(num_rows:int) -> dict:
+    """generate a random routes result set as columns"""
+    rnd = random.Random(42)
+    codes = ["".join(rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(3)) for _ in range(3000)]
+    airlines = ["".join(rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789") for _ in range(2)) for _ in range(500)]
+    return {
+        "airline": [rnd.choice(airlines) for _ in range(num_rows)],
+        "src": [rnd.choice(codes) for _ in range(num_rows)],
+        "dest": [rnd.choice(codes) for _ in range(num_rows)],
+        "codeshare": [rnd.choice([None, "Y"]) for _ in range(num_rows)],
+        "stops": [rnd.choice([0, 0, 0, 1]) for _ in range(num_rows)],
+        "equipment": [rnd.choice(["CR2", "737", "320 319", "AT7"]) for _ in range(num_rows)],
+    }
+
+
+def dict_comprehension_body(result) -> str:
+    """the original app code path: convert each row to a dict, then json encode the full response"""
+    data = [{k: v for k, v in row.items()} for row in result]
+    return json.dumps({"src": None, "dest": None, "result": data}, default=json_default)
+
+
+def timeit(label:str, func, repeat:int=3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<36s} {best * 1000:10.1f} ms")
+    return best
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    print(f"materializing {num_rows:,} rows (best of 3)")
+    result = FakeRowIterator(make_columns(num_rows))
+    repos = {result_format: BigQueryRepository(FakeClient(result), "project", "dataset",
+                                               materializer=ResultMaterializer(result_format),
+                                               coalesce_queries=False)
+             for result_format in ["rows", "arrow"]}
+    envelope = {"src": None, "dest": None}
+
+    def streamed_body(repo:BigQueryRepository) -> str:
+        return "".join(json_chunks(repo.iter_routes(), envelope))
+
+    # sanity check: all the paths must produce the same json
+    expected = json.loads(dict_comprehension_body(result))
+    assert json.loads(streamed_body(repos["arrow"])) == expected
+    assert json.loads(streamed_body(repos["rows"])) == expected
+
+    base = timeit("rows: dict comprehension + dumps", lambda: dict_comprehension_body(result))
+    timeit("rows: iter_routes + json_chunks", lambda: streamed_body(repos["rows"]))
+    fast = timeit("arrow: iter_routes + json_chunks", lambda: streamed_body(repos["arrow"]))
+    timeit("arrow: records", lambda: repos["arrow"].materializer.records(result))
+    print(f"speedup (arrow streamed vs dict comprehension): {base / fast:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
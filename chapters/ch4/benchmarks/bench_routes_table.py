@@ -0,0 +1,96 @@
+"""
+Benchmark: memory and lookup speed of the dictionary encoded RoutesTable vs python lists.
+
+Loads deb-routes.csv three ways and measures the memory held by each (tracemalloc):
+
+    - dict rows:    a list of csv.DictReader dicts (the course reader)
+    - python lists: one python list per column plus src/dest/pair dict indexes (the previous memory backend)
+    - RoutesTable:  numpy id arrays, shared symbol tables, and CSR adjacency (airspace.routes_table)
+
+Then times src, pair and all-routes lookups including decoding the rows into dicts.
+
+usage: python bench_routes_table.py [--lookups 1000]
+"""
+
+import os
+import csv
+import time
+import random
+import argparse
+import tracemalloc
+from collections import defaultdict
+
+# the installed chapter 4 `airspace` package (see airspace/README.md)
+from airspace.backends.memory import ColumnTable
+from airspace.repository import ROUTE_FIELDS, route_values
+from airspace.routes_table import RoutesTable
+
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../ch2/ep1/data"))
+
+
+def load_dict_rows(path:str) -> list:
+    with open(path, "r", encoding="utf-8") as csv_file:
+        return list(csv.DictReader(csv_file))
+
+
+def load_python_lists(path:str) -> tuple:
+    table = ColumnTable(ROUTE_FIELDS)
+    with open(path, "r", encoding="utf-8") as csv_file:
+        for row in csv.DictReader(csv_file):
+            table.append(route_values(row))
+    src_index, pair_index = defaultdict(list), defaultdict(list)
+    for i, (src, dest) in enumerate(zip(table.columns["src"], table.columns["dest"])):
+        src_index[src].append(i)
+        pair_index[(src, dest)].append(i)
+    return table, dict(src_index), dict(pair_index)
+
+
+def held_memory(func, *args) -> tuple:
+    """returns func's result and the memory it holds"""
+    tracemalloc.start()
+    result = func(*args)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, held
+
+
+def timeit(label:str, func, args:list) -> None:
+    start = time.perf_counter()
+    for arg in args:
+        func(*arg)
+    mean = (time.perf_counter() - start) / len(args)
+    print(f"  {label:<22s} {mean * 1e6:10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RoutesTable benchmark")
+    parser.add_argument("-f", "--file", default=os.path.join(DATA_DIR, "deb-routes.csv"), help="routes csv file")
+    parser.add_argument("-n", "--lookups", type=int, default=1000, help="number of lookups per query type")
+    args = parser.parse_args()
+
+    print("memory held:")
+    dict_rows, dict_bytes = held_memory(load_dict_rows, args.file)
+    (lists, src_index, pair_index), lists_bytes = held_memory(load_python_lists, args.file)
+    routes, table_bytes = held_memory(RoutesTable.from_csv, args.file)
+    for name, held in [("dict rows", dict_bytes), ("python lists", lists_bytes), ("RoutesTable", table_bytes)]:
+        print(f"  {name:<22s} {held / 1024 / 1024:8.2f} MB  ({dict_bytes / held:5.1f}x less than dict rows)")
+
+    rnd = random.Random(42)
+    sample = [rnd.choice(dict_rows) for _ in range(args.lookups)]
+    srcs = [(row["src"],) for row in sample]
+    pairs = [(row["src"], row["dest"]) for row in sample]
+
+    print("python lists lookups (incl. decoding into dict rows):")
+    timeit("src", lambda src: lists.rows(src_index.get(src, [])), srcs)
+    timeit("src, dest", lambda src, dest: lists.rows(pair_index.get((src, dest), [])), pairs)
+    timeit("all routes", lambda: lists.rows(range(lists.num_rows)), [()] * 5)
+    print("RoutesTable lookups (incl. decoding into dict rows):")
+    timeit("src", lambda src: routes.rows(routes.lookup(src)), srcs)
+    timeit("src, dest", lambda src, dest: routes.rows(routes.lookup(src, dest)), pairs)
+    timeit("all routes", lambda: routes.rows(routes.lookup()), [()] * 5)
+    timeit("destinations(src)", routes.destinations, srcs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark: request coalescing (single-flight) of identical concurrent BigQuery queries.
+
+Runs many concurrent "requests" for the same popular route against an artificially slow fake bq client, with
+and without a `SingleFlight` group, and reports the number of bq jobs started and the dedupe counters.
+
+usage: python bench_singleflight.py [num_requests] [query_seconds]
+"""
+
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import bigquery as bq
+
+# the installed chapter 4 `airspace` package (see airspace/README.md)
+from airspace.results import ResultMaterializer
+from airspace.singleflight import SingleFlight, query_key
+from bench_results import FakeRowIterator, make_columns
+
+
+QUERY = """
+    SELECT airline, src, dest, codeshare, stops, equipment
+    FROM deb-01.sandbox.routes
+    WHERE src = @src AND dest = @dest
+    ORDER BY airline, src, dest
+"""
+
+
+class SlowFakeClient:
+    """
+    Stub of `bq.Client` where every query job takes `delay` seconds and returns the same rows.
+    """
+
+    def __init__(self, delay:float, columns:dict):
+        self.delay = delay
+        self.columns = columns
+        self.jobs = 0
+        self._lock = threading.Lock()
+
+    def query(self, query:str, job_config=None):
+        with self._lock:
+            self.jobs += 1
+        time.sleep(self.delay)
+        return FakeRowIterator(self.columns)
+
+
+def run(num_requests:int, delay:float, coalesce:bool) -> dict:
+    client = SlowFakeClient(delay, make_columns(100))
+    materializer = ResultMaterializer("rows")
+    flights = SingleFlight() if coalesce else None
+    # half the requests ask for a popular route; the rest are spread over 4 other routes
+    routes = [("PDX", "SEA") if i % 2 == 0 else ("PDX", f"X{i % 8}") for i in range(num_requests)]
+
+    def request(route):
+        params = [bq.ScalarQueryParameter("src", "STRING", route[0]),
+                  bq.ScalarQueryParameter("dest", "STRING", route[1])]
+
+        def execute():
+            result = client.query(QUERY, bq.QueryJobConfig(query_parameters=params))
+            return list(materializer.record_lists(result))
+
+        if flights is None:
+            return execute()
+        return flights.do(query_key(QUERY, {p.name: p.value for p in params}), execute)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_requests) as pool:
+        results = list(pool.map(request, routes))
+    elapsed = time.perf_counter() - start
+    # every request must get the full result
+    assert all(sum(len(records) for records in result) == 100 for result in results)
+    return {
+        "jobs": client.jobs,
+        "elapsed": elapsed,
+        "stats": flights.stats() if flights is not None else None,
+    }
+
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    print(f"{num_requests} concurrent requests, {delay}s per bq job")
+
+    plain = run(num_requests, delay, coalesce=False)
+    print(f"no coalescing: {plain['jobs']:5d} bq jobs in {plain['elapsed']:.2f}s")
+
+    coalesced = run(num_requests, delay, coalesce=True)
+    print(f"single-flight: {coalesced['jobs']:5d} bq jobs in {coalesced['elapsed']:.2f}s")
+    print(f"counters: {coalesced['stats']}")
+
+    # 5 distinct routes: each one should have started exactly one job
+    assert coalesced["jobs"] == 5, coalesced["jobs"]
+    assert coalesced["stats"]["deduplicated"] == num_requests - 5
+    assert coalesced["stats"]["in_flight"] == 0
+
+
+if __name__ == "__main__":
+    main()
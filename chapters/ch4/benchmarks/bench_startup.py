@@ -0,0 +1,126 @@
+"""
+Benchmark: cold start time of the Airspace flask apps.
+
+Starts a fresh python process per app with `python -X importtime`, imports the app's main.py and calls its
+`create_app()` factory. Reports the import time, the app factory time, the slowest imports, and whether any heavy
+packages (google-cloud, sqlalchemy, pandas) were imported at startup. Each run is appended to a history file,
+one json line per app, so startup time can be tracked over time.
+
+usage: python bench_startup.py [--backend memory] [--runs 5] [--history startup_history.jsonl]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+from datetime import datetime
+
+import yaml
+
+
+CH4_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+APPS = {
+    "mysql": os.path.join(CH4_DIR, "ep2/python/ex3"),
+    "bigquery": os.path.join(CH4_DIR, "ep4/python/ex2"),
+}
+# packages that should NOT be imported until the first request
+HEAVY_PACKAGES = ["google.cloud.bigquery", "sqlalchemy", "pandas", "pyarrow", "numpy"]
+
+# code executed in the child process
+CHILD_CODE = """
+import sys, time, json
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+app = main.create_app(sys.argv[1])
+t2 = time.perf_counter()
+first_request = None
+if sys.argv[2] == "yes":
+    client = app.test_client()
+    client.get("/airports?iata=PDX")
+    first_request = time.perf_counter() - t2
+print(json.dumps({"import_s": t1 - t0, "create_app_s": t2 - t1, "first_request_s": first_request,
+                  "heavy_imports": [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_PACKAGES,)
+
+
+def parse_importtime(stderr:str) -> list:
+    """
+    Parses `-X importtime` output lines: `import time: self [us] | cumulative | imported package`
+
+    Returns:
+        list: (module name, self us, cumulative us) tuples
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def run_app(app_name:str, config_path:str, first_request:bool) -> dict:
+    """start the app in a new python process and collect its startup timings"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD_CODE, config_path,
+                           "yes" if first_request else "no"],
+                          cwd=APPS[app_name], capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(proc.stderr)
+    result["importtime_total_s"] = sum(self_us for _, self_us, _ in modules) / 1e6
+    # slowest direct imports of main.py (importtime indents nested imports by 2 spaces per level)
+    depth = lambda name: (len(name) - len(name.lstrip())) // 2
+    direct = [m for m in modules if depth(m[0]) == 1]
+    result["slowest_imports"] = [(name.strip(), cumulative / 1e6)
+                                 for name, _, cumulative in sorted(direct, key=lambda m: -m[2])[:5]]
+    return result
+
+
+def app_config(app_name:str, backend:str) -> str:
+    """return the app's config.yml path; or a temp copy using a different backend"""
+    config_path = os.path.join(APPS[app_name], "config.yml")
+    if backend is None:
+        return config_path
+    with open(config_path) as open_yaml:
+        conf = yaml.full_load(open_yaml)
+    conf["backend"] = backend
+    with tempfile.NamedTemporaryFile("w", suffix=".yml", delete=False) as tmp:
+        yaml.dump(conf, tmp)
+    return tmp.name
+
+
+def git_commit() -> str:
+    proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=CH4_DIR, capture_output=True, text=True)
+    return proc.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Airspace apps startup benchmark")
+    parser.add_argument("-b", "--backend", default=None,
+                        help="override the config.yml backend (for example: memory) and time the first request")
+    parser.add_argument("-r", "--runs", type=int, default=5, help="runs per app (the best run is reported)")
+    parser.add_argument("--history", default=os.path.join(os.path.dirname(__file__), "startup_history.jsonl"),
+                        help="json lines file to append the results to")
+    args = parser.parse_args()
+
+    timestamp = datetime.utcnow().isoformat()
+    commit = git_commit()
+    with open(args.history, "a", encoding="utf-8") as history:
+        for app_name in APPS:
+            config_path = app_config(app_name, args.backend)
+            runs = [run_app(app_name, config_path, args.backend is not None) for _ in range(args.runs)]
+            best = min(runs, key=lambda r: r["import_s"] + r["create_app_s"])
+            print(f"{app_name}: import {best['import_s'] * 1000:.1f} ms, create_app {best['create_app_s'] * 1000:.1f} ms"
+                  + (f", first request {best['first_request_s'] * 1000:.1f} ms" if best["first_request_s"] else ""))
+            print(f"  heavy packages imported at startup: {best['heavy_imports'] or 'none'}")
+            for name, seconds in best["slowest_imports"]:
+                print(f"  {name:<32s} {seconds * 1000:8.1f} ms")
+            history.write(json.dumps({"timestamp": timestamp, "commit": commit, "app": app_name,
+                                      "backend": args.backend, **best}) + "\n")
+    print(f"results appended to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
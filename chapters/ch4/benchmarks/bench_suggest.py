@@ -0,0 +1,58 @@
+"""
+Benchmark: airport typeahead suggestions (airspace.suggest).
+
+Builds the `AirportIndex` of the memory backend (deb-airports.csv and deb-routes.csv), then times random prefixes of
+1 to 6 characters of airport codes, names and cities (the keystrokes of a typeahead box) against:
+
+    - client side filter: what clients do today, a scan of the whole airports list for a field containing the prefix
+    - prefix index: `suggest_airports()`
+
+usage: python bench_suggest.py [--lookups 2000] [--limit 10]
+"""
+
+import time
+import random
+import logging
+import argparse
+
+# the installed chapter 4 `airspace` package (see airspace/README.md)
+from airspace.backends import create_repository
+from bench_repository import DEFAULT_CONF, timeit
+
+
+def scan_airports(airports:list, route_counts:dict, query:str, limit:int) -> list:
+    """filters and sorts the whole airports list"""
+    query = query.lower()
+    matches = [row for row in airports
+               if any(query in str(row[field]).lower() for field in ("iata", "airport", "city"))]
+    matches.sort(key=lambda row: -route_counts.get(row["iata"], 0))
+    return matches[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Airport suggestions benchmark")
+    parser.add_argument("-n", "--lookups", type=int, default=2000, help="number of prefixes")
+    parser.add_argument("--limit", type=int, default=10, help="suggestions per prefix")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    repo = create_repository(DEFAULT_CONF, "memory")
+    airports = repo.airports()
+    start = time.perf_counter()
+    index = repo.airport_index()
+    print(f"built the index of {len(index)} airports ({len(index.keys)} keys) in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    rnd = random.Random(42)
+    prefixes = []
+    for _ in range(args.lookups):
+        text = str(rnd.choice(airports)[rnd.choice(("iata", "airport", "city"))])
+        prefixes.append((text[:rnd.randint(1, 6)],))
+    route_counts = repo.route_counts()
+    print(f"{args.lookups} prefixes, {args.limit} suggestions each:")
+    timeit("client side filter", lambda query: scan_airports(airports, route_counts, query, args.limit), prefixes)
+    timeit("prefix index", lambda query: repo.suggest_airports(query, args.limit), prefixes)
+
+
+if __name__ == "__main__":
+    main()
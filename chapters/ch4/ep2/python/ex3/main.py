@@ -1,17 +1,22 @@
+import os
 import logging
 import argparse
 import yaml
-import sys
-from sqlalchemy import create_engine, text
-from sqlalchemy.pool import QueuePool
-from flask import Flask, current_app, request
+from flask import Blueprint, Flask, current_app, request
 
-# setup logging and logger
-logging.basicConfig(format='[%(levelname)-5s][%(asctime)s][%(module)s:%(lineno)04d] : %(message)s',
-                    level=logging.INFO,
-                    stream=sys.stderr)
-# alias logging as logger
-logger: logging.Logger = logging
+# the shared `dsa_common` and chapter 4 `airspace` packages: `pip install -r requirements.txt` from chapters/ch4/ep2
+#   installs them (see airspace/README.md)
+from dsa_common.logs import sampled, setup_logging
+from airspace import prefork
+from airspace.backends import LazyRepository
+from airspace.metrics import init_metrics
+from airspace.suggest import DEFAULT_SUGGEST_LIMIT, MAX_SUGGEST_LIMIT
+
+# setup logging and logger: json log lines written by a background thread (see dsa_common/logs.py)
+setup_logging()
+logger: logging.Logger = logging.getLogger(__name__)
+# per-request logs are sampled (LOG_SAMPLE_RATE environment variable)
+request_logger = sampled(logger)
 
 
 def set_args():
@@ -20,6 +25,8 @@ def set_args():
     """
     parser = argparse.ArgumentParser(description="Airspace API Parser")
     parser.add_argument("-c", "--config", help="Path to config yaml file", default="config.yml", required=False)
+    parser.add_argument("-w", "--workers", help="Number of pre-forked worker processes", type=int, default=1,
+                        required=False)
     args,_ = parser.parse_known_args()
     return args
 
@@ -32,152 +39,127 @@ def load_config(path_to_yaml):
         return yaml.full_load(open_yaml)
 
 
-# set cmd line args & load configuration
-args = set_args()
-conf = load_config(args.config)
-
-# get db config params
-db_host = conf['host']
-db_user = conf['user']
-db_pswd = conf['pswd']
-db_name = conf['database']
-# print db params (never print passwords!)
-logger.info(f"flask mysql config: host={db_host} user={db_user} db={db_name}")
-logger.info(f"starting flask app")
-
+# the api routes are registered on a blueprint; `create_app()` adds them to a new flask app
+api = Blueprint("airspace", __name__)
 
-# create flask app and sqlalchemy engine
-app = Flask(__name__)
-# create a db engine with a connection pool
-#   a QueuePool creates a pool of database connections. Since routes could be called by multiple clients
-#   simultaneously, having a pool of db connection that we could pull from is a good idea. Please refer
-#   to the create_engine documentation.
-engine = create_engine(f"mysql+pymysql://{db_user}:{db_pswd}@{db_host}/{db_name}?charset=utf8", 
-                       poolclass=QueuePool, pool_size=5, max_overflow=0)
 
-# save the engine into the flask app cache to be accessed later
-app.config['engine'] = engine
+def create_app(config_path:str="config.yml", preload:bool=False) -> Flask:
+    """
+    Flask app factory: loads the configuration and creates the flask app. The storage backend
+    (and its sqlalchemy db engine) is only created when the first request needs it; which keeps
+    startup fast. Run it with: `FLASK_APP="main:create_app()" flask run`
 
+    Args:
+        config_path (str, optional): path to config yaml file. Defaults to "config.yml".
+        preload (bool, optional): create the backend and its airport index now (before forking
+                                  workers, see `airspace.prefork`). Defaults to False.
 
-@app.route('/')
+    Returns:
+        Flask: flask app
+    """
+    conf = load_config(config_path)
+    logger.info("starting flask app")
+
+    # create flask app
+    app = Flask(__name__)
+    # the airspace storage backend (see `backend` in config.yml)
+    #   the mysql backend creates a sqlalchemy db engine with a connection pool on first use
+    # save the storage backend into the flask app cache to be accessed later
+    app.config['repository'] = LazyRepository(conf, conf.get("backend", "mysql"))
+    if preload:
+        app.config['repository'].preload()
+    app.register_blueprint(api)
+    # request counts and latency histograms on /metrics (see airspace/metrics.py)
+    init_metrics(app)
+    return app
+
+
+@api.route('/')
 def all_routes():
     """main GET route to return all routes"""
     # it's NOT good practice to access the global flask `app` variable
     #  -- instead use the imported `current_app` flask class
-    engine = current_app.config['engine']
-    logger.info(f"query db for all routes")
-    # get a new connection
-    with engine.connect() as conn:
-        # Return all routes from our database
-        logger.info(f"returning all routes")
-        result = conn.execute(
-            text("select airline, src, dest, codeshare, stops, equipment from routes order by airline")
-        )
-        # get all the resulting db rows as dict (or mappings)
-        rows = result.mappings().all()
-        # use a list and dict comprehenssion to return all the rows
-        return {
-            'results': [{k: v for k, v in row.items()} for row in rows]
-        }
-
-
-@app.route('/airports')
+    repo = current_app.config['repository']
+    request_logger.info("returning all routes")
+    return {
+        'results': repo.routes()
+    }
+
+
+@api.route('/airports')
 def airport():
     """ GET route to search and return a airport by iata code"""
     # get the GET arg called iata
     iata = request.args.get('iata', default=None)
-    logger.info(f"query db for iata: {str(iata)}")
-    # get the db engine form config
-    engine = current_app.config['engine']
-    # create a new connection
-    with engine.connect() as conn:
-        # if the user has specified an iata GET arg
-        if iata is not None:
-            # search for specific iata airport code
-            result = conn.execute(
-                text("select iata, airport, city, state, country, CAST(lat AS CHAR) lat, CAST(lon AS CHAR) lon from airports where iata = :iata"),
-                {'iata': str(iata).strip().upper()}
-            )
-            result = result.mappings()
-            # inspect the first row. Do we have any rows matching the iata code provided?
-            row = result.first()
-            if row is not None:
-                # return a single airport result
-                return {
-                    'iata' : iata,
-                    'results': [{k: v for k, v in row.items()}]
-                } 
-            else:
-                # airport code not found, return empty list
-                return {
-                    'iata' : iata,
-                    'results': []
-                }
-        # if the user has NOT specified an iata GET arg
-        else:
-            # no iata code provided, return all airports
-            logger.info(f"returning all airports")
-            result = conn.execute(
-                text("select iata, airport, city, state, country, CAST(lat AS CHAR) lat, CAST(lon AS CHAR) lon from airports order by iata")
-            )
-            rows = result.mappings().all()
-            return {
-                'iata' : iata,
-                'results': [{k: v for k, v in row.items()} for row in rows]
-            }
-
-
-@app.route(('/routes'))
+    request_logger.info("query db for iata: %s", iata, extra={"iata": iata})
+    # get the storage backend form config
+    repo = current_app.config['repository']
+    # if the user has NOT specified an iata GET arg, all airports are returned
+    if iata is None:
+        request_logger.info("returning all airports")
+    # an empty list is returned if the airport code is not found
+    return {
+        'iata' : iata,
+        'results': repo.airports(iata)
+    }
+
+
+@api.route('/airports/suggest')
+def suggest_airports():
+    """ GET route to suggest airports as the user types: iata code, airport name or city prefix"""
+    # get the GET args q (the typed prefix) and limit
+    q = request.args.get('q', default='')
+    limit = request.args.get('limit', default=DEFAULT_SUGGEST_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_SUGGEST_LIMIT))
+    # get the storage backend form config
+    repo = current_app.config['repository']
+    # typeahead requests are frequent: log them at debug level only
+    request_logger.debug("suggest airports for: %s", q)
+    # the airports are ranked by route count; an in-memory index is used (no db query)
+    return {
+        'q': q,
+        'results': repo.suggest_airports(q, limit)
+    }
+
+
+@api.route(('/routes'))
 def get_route():
     """
     GET route that returns airline routes based on source and destination
     """
     # get src and dest GET args
-    #   -- if provided, create a dict that we will use as parameters to our 
-    #      sql statement
     src = request.args.get("src", default=None)
     dest = request.args.get("dest", default=None)
-    sql_query_params = {
-        "src": str(src).strip().upper(),
-        "dest": str(dest).strip().upper(),
-        }
-    engine = current_app.config['engine']
-    with engine.connect() as conn:
-        if src and not dest:
-            # just src provided, returning all routes for that source
-            logger.info(f"Returning all routes from {src}")
-            result = conn.execute(
-                        text("select airline, src, dest, codeshare, stops, equipment from routes where src = :src order by airline"),
-                        sql_query_params
-                    )
-        elif dest and not src:
-            # just dest provided, return all routes with that destination
-            logger.info(f"Returning all routes to {dest}")
-            result = conn.execute(
-                        text("select airline, src, dest, codeshare, stops, equipment from routes where dest = :dest order by airline"),
-                        sql_query_params
-                    )
-        elif src and dest:
-            # both provided, return flights from src to dest
-            logger.info(f"Returning all routes from {src} to {dest}")
-            result = conn.execute(
-                        text("select airline, src, dest, codeshare, stops, equipment from routes where src = :src and dest = :dest order by airline"),
-                        sql_query_params
-                    )
-        else:
-            # no source/dest provided, return all
-            logger.info(f"No src or dest provided")
-            return all_routes()    
-    
-    rows = result.mappings().all()
+    repo = current_app.config['repository']
+    if src and not dest:
+        # just src provided, returning all routes for that source
+        request_logger.info("Returning all routes from %s", src, extra={"src": src})
+    elif dest and not src:
+        # just dest provided, return all routes with that destination
+        request_logger.info("Returning all routes to %s", dest, extra={"dest": dest})
+    elif src and dest:
+        # both provided, return flights from src to dest
+        request_logger.info("Returning all routes from %s to %s", src, dest, extra={"src": src, "dest": dest})
+    else:
+        # no source/dest provided, return all
+        request_logger.info("No src or dest provided")
+        return all_routes()
+
     return {
         'src': src,
         'dest': dest,
-        'results': [{k: v for k, v in row.items()} for row in rows]
+        'results': repo.routes(src, dest)
     }
 
 
 # start our flask app
 if __name__ == "__main__":
-    # run flask app on port 5050
-    app.run('0.0.0.0', 5050)
+    # set cmd line args
+    args = set_args()
+    if args.workers > 1:
+        # load the data once, then fork the workers on port 5050
+        prefork.serve(lambda: create_app(args.config, preload=True), port=5050, workers=args.workers)
+    else:
+        # create the app & run flask app on port 5050
+        app = create_app(args.config)
+        app.run('0.0.0.0', 5050)
@@ -1,8 +1,16 @@
+import os
 import json
 import sys
 import logging
+from datetime import datetime
 from flask import Flask, request
 
+import shortuuid
+# the chapter 2 profiles ETL (chapters/ch2/ep2/src): `pip install -r requirements.txt` from chapters/ch4/ep3
+#   installs it
+from card_tokens import DEFAULT_BATCH_SIZE, CardTokenizer, token_key
+from process_profiles import process_line, write_batch
+
 
 # setup logging and logger
 logging.basicConfig(format='[%(levelname)-5s][%(asctime)s][%(module)s:%(lineno)04d] : %(message)s',
@@ -50,6 +58,139 @@ def print_data():
         return result, 200, {"Content-Type": "application/json"}
 
 
+# NDJSON uploads are read from the request stream this many bytes at a time
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# longer lines are rejected without parsing them; which keeps memory use constant
+MAX_LINE_BYTES = 1024 * 1024
+# number of reject error messages returned to the client
+MAX_REJECT_DETAILS = 100
+# optional directory for the OK and reject files of each upload; uploads are only validated when it's not set
+PROFILES_OUTPUT_DIR = os.environ.get("PROFILES_OUTPUT_DIR")
+# card numbers are tokenized with the same key for every upload (see card_tokens.py); read by the first upload
+_token_key = None
+
+
+def upload_token_key() -> bytes:
+    """
+    Returns the card token key of the uploads, from the CARD_TOKEN_KEY environment variable.
+
+    Raises:
+        ValueError: CARD_TOKEN_KEY is not set
+    """
+    global _token_key
+    if _token_key is None:
+        _token_key = token_key()
+    return _token_key
+
+
+def iter_lines(stream, chunk_size:int=UPLOAD_CHUNK_SIZE, max_line_bytes:int=MAX_LINE_BYTES):
+    """
+    Yields the lines of a binary stream, reading `chunk_size` bytes at a time. Lines longer than `max_line_bytes`
+    are skipped and yielded as None.
+
+    Args:
+        stream (file): binary stream, for example `request.stream`
+        chunk_size (int, optional): bytes per read. Defaults to UPLOAD_CHUNK_SIZE.
+        max_line_bytes (int, optional): longest line kept in memory. Defaults to MAX_LINE_BYTES.
+    """
+    pending = b""           # start of the current line
+    too_long = False        # the current line is being skipped
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        start = 0
+        end = chunk.find(b"\n")
+        while end >= 0:
+            if too_long or len(pending) + end - start > max_line_bytes:
+                yield None
+            else:
+                yield pending + chunk[start:end]
+            pending = b""
+            too_long = False
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        if not too_long:
+            pending += chunk[start:]
+            if len(pending) > max_line_bytes:
+                pending = b""
+                too_long = True
+    if too_long:
+        yield None
+    elif pending:
+        # last line without a newline
+        yield pending
+
+
+# NDJSON route to load user profiles
+@app.route("/profiles", methods=["POST"])
+def upload_profiles():
+    """
+    Pushes a newline delimited json (NDJSON) upload of user profiles through the checks & transformations of the
+    profiles ETL (chapters/ch2/ep2/src/process_profiles.py) one line at a time, as it arrives. The request body is
+    never read into memory, nor logged. When PROFILES_OUTPUT_DIR is set, the OK and rejected rows are written to an
+    OK and a reject file, with tokenized card numbers.
+
+        curl -X POST -H "Content-Type: application/x-ndjson" --data-binary @profiles.json localhost:5050/profiles
+    """
+    line_num = 0            # total number of lines
+    ok_count = 0            # number of rows without errors
+    reject_count = 0        # number of rows with errors
+    rejects = []            # first error messages
+    result = {"status": "success"}
+
+    if PROFILES_OUTPUT_DIR:
+        try:
+            tokenizer = CardTokenizer(upload_token_key())
+        except ValueError:
+            logger.error("PROFILES_OUTPUT_DIR is set without CARD_TOKEN_KEY: can't tokenize the uploaded card numbers")
+            return {"status": "error",
+                    "error_msg": "Server misconfigured: set CARD_TOKEN_KEY to write the uploaded profiles"
+                    }, 500, {"content-type": "application/json"}
+        # one OK and one reject file per upload
+        file_timestamp = datetime.utcnow().strftime("%Y%m%d")
+        file_name = os.path.join(PROFILES_OUTPUT_DIR, f"upload_{file_timestamp}_{shortuuid.uuid()}")
+        ok_file = open(f"{file_name}_ok.json", "w", encoding="utf-8")
+        reject_file = open(f"{file_name}_reject.json", "w", encoding="utf-8")
+        result["ok_file"] = os.path.basename(ok_file.name)
+        result["reject_file"] = os.path.basename(reject_file.name)
+    # rows waiting to be tokenized and written
+    batch = []
+    try:
+        for line in iter_lines(request.stream):
+            if line is None:
+                err_msg = f"[{line_num:02d}][ERR]: Line longer than {MAX_LINE_BYTES} bytes"
+                row = {"error": err_msg}
+            elif not line.strip():
+                # skip blank lines
+                line_num += 1
+                continue
+            else:
+                row, err_msg = process_line(line, line_num)
+            if err_msg is None:
+                ok_count += 1
+            else:
+                reject_count += 1
+                if len(rejects) < MAX_REJECT_DETAILS:
+                    rejects.append(err_msg)
+            if PROFILES_OUTPUT_DIR:
+                batch.append((line_num, row, err_msg))
+                if len(batch) >= DEFAULT_BATCH_SIZE:
+                    write_batch(batch, tokenizer, ok_file, reject_file, log_rejects=False)
+            line_num += 1
+        if PROFILES_OUTPUT_DIR:
+            write_batch(batch, tokenizer, ok_file, reject_file, log_rejects=False)
+    finally:
+        if PROFILES_OUTPUT_DIR:
+            ok_file.close()
+            reject_file.close()
+
+    # log the counts only: never the uploaded rows
+    logger.info(f"profiles upload: {line_num} lines, {ok_count} OK, {reject_count} rejected")
+    result.update({"lines": line_num, "ok": ok_count, "rejected": reject_count, "rejects": rejects})
+    return result, 200, {"Content-Type": "application/json"}
+
+
 if __name__ == "__main__":
     # run flask app on port 5050
     app.run('0.0.0.0', 5050)
\ No newline at end of file
@@ -1,15 +1,21 @@
 
-import sys
+import os
 import logging
 import pandas as pd
 from flask import Flask, request
 
+# the shared `dsa_common` and chapter 4 `airspace` packages: `pip install -r requirements.txt` from chapters/ch4/ep3
+#   installs them (see airspace/README.md)
+from dsa_common.logs import sampled, setup_logging
+from airspace import prefork
+from airspace.metrics import backend_time, init_metrics
 
-# setup python logger: log into console at INFO level
-logging.basicConfig(format='[%(levelname)-5s][%(asctime)s][%(module)s:%(lineno)04d] : %(message)s',
-                    level=logging.INFO,
-                    stream=sys.stderr)
-logger: logging.Logger = logging
+
+# setup python logger: json log lines written by a background thread (see dsa_common/logs.py)
+setup_logging()
+logger: logging.Logger = logging.getLogger(__name__)
+# per-request and per-person logs are sampled (LOG_SAMPLE_RATE environment variable)
+request_logger = sampled(logger)
 
 
 # our mock dataframe database
@@ -18,16 +24,41 @@ INITIAL_DATA = [
     {"name": "Christopher", "job": "Translator", "age": 37},
     {"name": "Linda", "job": "Illustrator", "age": 69},
 ]
+# optional csv file with name, job and age columns to load instead of the mock data
+PEOPLE_CSV = os.environ.get("PEOPLE_CSV")
 # dataframe database
-people_df = pd.DataFrame(INITIAL_DATA)
+people_df = pd.read_csv(PEOPLE_CSV) if PEOPLE_CSV else pd.DataFrame(INITIAL_DATA)
 # set the name as index but keep the column
 people_df.set_index(keys="name", drop=False, inplace=True)
 
 # create the app and set the database
 app = Flask(__name__)
 app.config["db"] = people_df
+# pre-forked workers each have their own copy of the dataframe: writes would only change one of them
+app.config["read_only"] = False
+# request counts and latency histograms on /metrics (see airspace/metrics.py); dataframe operations are timed as
+#   the backend time
+init_metrics(app)
 
 
+def preload_index():
+    """
+    Builds the hash table of the name index now (before forking workers, so that they all share it)
+    """
+    people_df.index.get_indexer_for([""])
+
+
+@app.before_request
+def check_read_only():
+    """
+    Rejects POST, PATCH and DELETE requests when the app is read only
+    """
+    if app.config["read_only"] and request.method != "GET":
+        return {
+            "status": "error",
+            "error_msg": "the people database is read only when served by multiple workers",
+        }, 405, {"content-type": "application/json"}
+
 
 # CRUD READ METHOD ---
 @app.route("/people", methods=["GET"])
@@ -39,11 +70,15 @@ def read():
     global people_df
     # get the URL params
     name = request.args.get("name", default=None)
-    logger.info(f"query for {name}")
+    request_logger.info("query for %s", name, extra={"query_name": name})
     # narrow down results by the name provided; otherwise return the entire dataframe
     # result_df = df[df["name"] == name] if (name is not None) else df
     if name is not None:
-        result_df = people_df.loc[people_df["name"] == name]
+        # look up the name index (a hash table) instead of comparing every name: a scan touches the reference count
+        # of every name, which copies all the pages that pre-forked workers share
+        with backend_time():
+            positions = people_df.index.get_indexer_for([name])
+            result_df = people_df.iloc[positions[positions >= 0]]
     else:
         result_df = people_df
     # create the response json
@@ -83,16 +118,17 @@ def create():
         for person in data:
             # check to see if this person has the required columns
             if ("name" in person) and ("job" in person) and ("age" in person):
-                logger.info(f"adding new person: {person}")
+                request_logger.info("adding new person: %s", person)
                 # create a new index for this person and use .loc[] to append a new row
                 index = person["name"]
-                people_df.loc[person["name"]] = person
+                with backend_time():
+                    people_df.loc[person["name"]] = person
                 # add the person to our return list
                 inserted_people.append(person)
             else:
                 # add the person to our rejected list
                 rejected_people.append(person)
-        logger.info(f"inserted {len(inserted_people)} and rejected {len(rejected_people)}")
+        logger.info("inserted %d and rejected %d", len(inserted_people), len(rejected_people))
         # generate the response
         resp_json = {
             "records_inserted" : len(inserted_people),
@@ -128,15 +164,16 @@ def update():
         for person in data:
             # check to see if this person has the name column
             if "name" in person:
-                logger.info(f"updating person: {person}")
+                request_logger.info("updating person: %s", person)
                 # update our df using the index and .loc[]
                 index = person["name"]
-                people_df.loc[index] = person
+                with backend_time():
+                    people_df.loc[index] = person
                 # add to our list of updated people
                 updated_people.append(person)
             else:
                 rejected_people.append(person)
-        logger.info(f"updated {len(updated_people)} and rejected {len(updated_people)}")
+        logger.info("updated %d and rejected %d", len(updated_people), len(rejected_people))
         # generate the response
         resp_json = {
             "records_updated" : len(updated_people),
@@ -171,14 +208,15 @@ def delete():
         for person in data:
             # check to see if this person has the name column
             if "name" in person:
-                logger.info(f"deleting person: {person['name']}")
+                request_logger.info("deleting person: %s", person["name"])
                 # delete using the index
                 index = person["name"]
-                people_df.drop(index=index, inplace=True, errors="ignore")
+                with backend_time():
+                    people_df.drop(index=index, inplace=True, errors="ignore")
                 # add to our delete list
                 deleted_indexes.append(index)
         # people_df = people_df.drop(index=del_indexes, errors="ignore")
-        logger.info(f"deleted {len(deleted_indexes)}")
+        logger.info("deleted %d", len(deleted_indexes))
         # generate the response
         resp_json = {
             "records_deleted" : len(deleted_indexes),
@@ -198,4 +236,12 @@ def delete():
 
 # run the app
 if __name__ == '__main__':
-    app.run('0.0.0.0', 5050)
+    # number of pre-forked worker processes (the env variable gunicorn uses too)
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        # the dataframe is already loaded: fork the workers on port 5050
+        app.config["read_only"] = True
+        preload_index()
+        prefork.serve(lambda: app, port=5050, workers=workers)
+    else:
+        app.run('0.0.0.0', 5050)
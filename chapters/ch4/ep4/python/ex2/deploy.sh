@@ -0,0 +1,23 @@
+#!/usr/bin/env bash
+# Deploys the BigQuery app to AppEngine.
+#
+# AppEngine only uploads this directory, and main.py imports the shared `airspace` (chapters/ch4/airspace) and
+# `dsa_common` (chapters/common/dsa_common) packages. This script copies the app and the packages into a temporary
+# build directory, deploys it, then removes it.
+# Extra arguments are passed to `gcloud app deploy`, for example: ./deploy.sh --project deb-01
+set -euo pipefail
+
+app_dir="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+package_dir="$(cd "${app_dir}/../../../airspace" && pwd)"
+common_dir="$(cd "${app_dir}/../../../../common/dsa_common" && pwd)"
+build_dir="$(mktemp -d)"
+trap 'rm -rf "${build_dir}"' EXIT
+
+cp -R "${app_dir}/." "${build_dir}/"
+rm -f "${build_dir}/deploy.sh"
+cp -R "${package_dir}" "${build_dir}/airspace"
+cp -R "${common_dir}" "${build_dir}/dsa_common"
+find "${build_dir}" -name __pycache__ -prune -exec rm -rf {} +
+
+cd "${build_dir}"
+gcloud app deploy app.yaml "$@"
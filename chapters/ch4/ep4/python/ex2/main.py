@@ -1,15 +1,27 @@
-import sys
+import os
+import json
 import yaml
 import logging
-from google.cloud import bigquery as bq
-from flask import Flask, request
+from typing import Iterable
 
+from flask import Blueprint, Flask, Response, current_app, request
 
-# setup logging and logger
-logging.basicConfig(format='[%(levelname)-5s][%(asctime)s][%(module)s:%(lineno)04d] : %(message)s',
-                    level=logging.INFO,
-                    stream=sys.stderr)
-logger: logging.Logger = logging
+# the shared `dsa_common` and chapter 4 `airspace` packages: `pip install -r requirements.txt` from chapters/ch4/ep4
+#   installs them, and deploy.sh copies them next to the app for AppEngine (see airspace/README.md)
+from dsa_common.logs import sampled, setup_logging
+from airspace import prefork
+from airspace.backends import LazyRepository
+from airspace.metrics import init_metrics
+from airspace.repository import normalize_code
+from airspace.results import json_chunks, ndjson_chunks
+from airspace.suggest import DEFAULT_SUGGEST_LIMIT, MAX_SUGGEST_LIMIT
+
+
+# setup logging and logger: json log lines written by a background thread (see dsa_common/logs.py)
+setup_logging()
+logger: logging.Logger = logging.getLogger(__name__)
+# per-request logs are sampled (LOG_SAMPLE_RATE environment variable)
+request_logger = sampled(logger)
 
 
 
@@ -21,148 +33,146 @@ def load_config(path_to_yaml):
         return yaml.full_load(open_yaml)
 
 
-# load configuration
-conf = load_config("config.yml")
-logger.info(f"starting flask app")
+# the api routes are registered on a blueprint; `create_app()` adds them to a new flask app
+api = Blueprint("airspace", __name__)
+
+
+def create_app(config_path:str=None, preload:bool=False) -> Flask:
+    """
+    Flask app factory: loads the configuration and creates the flask app. The storage backend (and
+    its BigQuery client) is only created when the first request needs it; which keeps cold starts fast.
+    AppEngine runs the app with: `gunicorn -b :$PORT "main:create_app()"` (see app.yaml)
+
+    Args:
+        config_path (str, optional): path to config yaml file. Defaults to the AIRSPACE_CONFIG
+                                     environment variable or "config.yml".
+        preload (bool, optional): create the backend and its airport index now (before forking
+                                  workers, see `airspace.prefork`). Defaults to False.
+
+    Returns:
+        Flask: flask app
+    """
+    # load configuration
+    conf = load_config(config_path or os.environ.get("AIRSPACE_CONFIG", "config.yml"))
+    logger.info("starting flask app")
+
+    # create flask app
+    app = Flask(__name__)
+    # save the configuration and airspace storage backend (see `backend` in config.yml) into the flask app cache
+    #   the bigquery backend creates a bq client using the project and dataset from config.yml on first use
+    app.config['airspace'] = conf
+    app.config['repository'] = LazyRepository(conf, conf.get("backend", "bigquery"))
+    if preload:
+        app.config['repository'].preload()
+    app.register_blueprint(api)
+    # request counts and latency histograms on /metrics (see airspace/metrics.py)
+    init_metrics(app)
+    return app
+
+
+def query_response(batches:Iterable[list], envelope:dict):
+    """
+    Creates the flask response for lists of result rows. The rows are added to the `envelope` dict
+    under the "result" key. Clients can pass a `format=ndjson` GET param to receive newline delimited
+    json rows instead. With the 'arrow' result format, and for ndjson, the response is streamed: each list
+    of rows (one per arrow record batch for bigquery) is serialized while the next one is downloaded.
 
-# create flask app and BigQuery client
-app = Flask(__name__)
+    Args:
+        batches (Iterable[list]): lists of dict rows (see `AirspaceRepository.iter_routes()`)
+        envelope (dict): other response fields (for example: the GET params)
 
-# get bigquery configuration and create a bq client
-project = conf['project']
-dataset = conf['dataset']
-logger.info(f"bigquery Config: project='{project}', dataset='{dataset}'")
-client = bq.Client(project=project)
+    Returns:
+        flask response
+    """
+    if request.args.get("format", default=None) == "ndjson":
+        # stream one json row per line
+        return Response(ndjson_chunks(batches), 200, mimetype="application/x-ndjson")
+    elif current_app.config['airspace'].get("result_format", "rows") == "arrow":
+        # serialize the json response in bulk, one batch at a time
+        return Response(json_chunks(batches, envelope), 200, mimetype="application/json")
+    else:
+        data = [row for batch in batches for row in batch]
+        return {**envelope, "result": data}, 200, {"content-type": "application/json"}
 
 
 
 # index route
-@app.route("/")
+@api.route("/")
 def hello():
     return "DSA Airspace BigQuery API", 200
 
 
 
+# backend counters (for example: query coalescing)
+@api.route("/stats", methods=["GET"])
+def stats():
+    """Returns the storage backend counters"""
+    repo = current_app.config['repository']
+    return {"backend": repo.name, **repo.stats()}, 200, {"content-type": "application/json"}
+
+
+
 # getting airports by iata code route
-@app.route('/airports', methods=["GET"])
+@api.route('/airports', methods=["GET"])
 def airport():
     """Query airports by iata code"""
-    # variables from the global scope including the bq client
-    global client, conf, dataset, project
-    # get airports table name
-    table_name = conf["airports_table"]
-    full_table_name = f"{project}.{dataset}.{table_name}"
+    # get the storage backend from the flask app cache
+    repo = current_app.config['repository']
 
     # get the iata GET param
     iata = request.args.get('iata', default=None)
 
     if iata is not None:
         # search for specific iata airport code
-        # create a parametrized query
-        logger.info(f"query {table_name} for iata: {iata}")
-
-        query = f"""
-            SELECT iata, airport, city, state, country, lat, lon 
-            FROM `{full_table_name}` 
-            WHERE 
-                iata = @iata
-            """
-        logger.debug(f"query:\n {query}\n")
-
-        # create a bq job config to provide the iata param
-        job_config = bq.QueryJobConfig(
-            query_parameters=[
-                bq.ScalarQueryParameter("iata", "STRING", iata),
-            ]
-        )
-        # run the query
-        result = client.query(query, job_config)
-
-        # bq returns a list of dict rows as the result >> each row is a list item and each dict row contains column key/value pairs
-        #   convert this using list/dict comprehensions
-        #   data will again be a list of dicts
-        data = [{k: v for k, v in row.items()} for row in result]
-
-        # alternatively: we could also get the results by using the .to_dataframe()
-        # df = result.to_dataframe()
-        # data = df.to_dict(orient="records")
-
-        return {
-            "iata": iata,
-            "result": data,
-        }, 200, {"content-type": "application/json"}
+        request_logger.info("query airports for iata: %s", iata, extra={"iata": iata})
     else:
         # no iata code provided, return all airports
-        logger.info(f"query all {table_name}")
-        query = f"""
-            SELECT iata, airport, city, state, country, lat, lon 
-            FROM `{full_table_name}` 
-            WHERE 
-                iata = @iata
-            ORDER BY iata
-            """
-        logger.debug(f"query:\n {query}\n")
-        
-        result = client.query(query)
-        data = [{k: v for k, v in row.items()} for row in result]
-        return {
-            "iata": iata,
-            "result": data,
-        }, 200, {"content-type": "application/json"}
+        request_logger.info("query all airports")
+    return query_response(repo.iter_airports(iata), {"iata": iata})
+
+
+# airport typeahead suggestions
+@api.route('/airports/suggest', methods=["GET"])
+def suggest_airports():
+    """Suggest airports by iata code, airport name or city prefix, ranked by route count"""
+    # get the storage backend from the flask app cache
+    repo = current_app.config['repository']
+
+    # get the q (typed prefix) and limit GET params
+    q = request.args.get('q', default='')
+    limit = request.args.get('limit', default=DEFAULT_SUGGEST_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_SUGGEST_LIMIT))
+
+    # typeahead requests are frequent: log them at debug level only
+    request_logger.debug("suggest airports for: %s", q)
+    # served from an in-memory index built on first use: no bq query per request
+    data = repo.suggest_airports(q, limit)
+    return query_response([data], {"q": q})
 
 
 # query airline routes between two airports
-@app.route(('/routes'))
+@api.route(('/routes'))
 def get_route():
     """
     GET route that returns airline routes based on source and destination
     """
-    # variables from the global scope including the bq client
-    global client, conf, dataset, project
-    # get airports table name
-    table_name = conf["routes_table"]
-    full_table_name = f"{project}.{dataset}.{table_name}"
+    # get the storage backend from the flask app cache
+    repo = current_app.config['repository']
 
     # get src and dest from the GET params
     src = request.args.get("src", default=None)
     dest = request.args.get("dest", default=None)
-    
+
     # check to see if we got both src and dest
     if (src is not None) and (dest is not None):
-        logger.info(f"query {table_name} for src: {src} and dest: {dest}")
-
-        query = f"""
-            SELECT airline, src, dest, codeshare, stops, equipment
-            FROM {full_table_name}
-            WHERE
-                src = @src
-                AND
-                dest = @dest
-            ORDER BY airline, src, dest
-        """
-        logger.debug(f"query:\n {query}\n")
-
-        # pass the SQL query params
-        jc = bq.QueryJobConfig(
-            query_parameters=[
-                bq.ScalarQueryParameter("src", "STRING", src),
-                bq.ScalarQueryParameter("dest", "STRING", dest),
-            ]
-        )
-        # run the query
-        result = client.query(query, jc)
-        # convert the result into a list of dict rows
-        data = [{k: v for k, v in row.items()} for row in result]
+        request_logger.info("query routes for src: %s and dest: %s", src, dest, extra={"src": src, "dest": dest})
+        batches = repo.iter_routes(src, dest)
         # create the json response
-        return {
-            "src": src,
-            "dest": dest,
-            "result": data,
-        }, 200, {"content-type": "application/json"}
+        return query_response(batches, {"src": src, "dest": dest})
     else:
         # not both src and dest are provided.
         # respond back with an error msg
-        logger.debug("invalid ")
+        request_logger.debug("invalid routes request: src=%s dest=%s", src, dest)
         return {
             "status": "error",
             "msg": "Please provide both a src and dest GET param to the routes to search!"
@@ -170,6 +180,88 @@ def get_route():
 
 
 
+def parse_pair(pair) -> tuple:
+    """
+    Parses a requested src/dest pair: a {"src": ..., "dest": ...} object or a two item list of iata codes.
+
+    Args:
+        pair: json pair
+
+    Returns:
+        tuple: normalized (src, dest) codes
+
+    Raises:
+        ValueError: not a pair of iata code strings
+    """
+    if isinstance(pair, dict):
+        src, dest = pair.get("src"), pair.get("dest")
+    elif isinstance(pair, (list, tuple)) and len(pair) == 2:
+        src, dest = pair
+    else:
+        raise ValueError("Each pair must be a {\"src\": ..., \"dest\": ...} object or a [src, dest] list.")
+    if not isinstance(src, str) or not isinstance(dest, str) or not src.strip() or not dest.strip():
+        raise ValueError("The src and dest must be iata code strings.")
+    return normalize_code(src), normalize_code(dest)
+
+
+# query airline routes for many src/dest pairs at once
+@api.route('/routes/batch', methods=["POST"])
+def get_routes_batch():
+    """
+    POST route that returns airline routes for a list of src/dest pairs using a single bq query. The request
+    json is a list of pairs, for example:
+
+        {"pairs": [{"src": "PDX", "dest": "SEA"}, {"src": "JFK", "dest": "LAX"}]}
+
+    Pairs can also be sent as two item lists: {"pairs": [["PDX", "SEA"], ["JFK", "LAX"]]}.
+    The response holds one item per unique pair, in the requested order, with its list of routes.
+    """
+    # get the storage backend from the flask app cache
+    repo = current_app.config['repository']
+    max_pairs = int(current_app.config['airspace'].get("max_batch_pairs", 1000))
+
+    # parse and validate the requested pairs
+    data = request.get_json(silent=True)
+    pairs_in = data.get("pairs") if isinstance(data, dict) else data
+    if not isinstance(pairs_in, list) or len(pairs_in) == 0:
+        return {
+            "status": "error",
+            "msg": "Please POST a json body with a list of src/dest pairs: {\"pairs\": [{\"src\": \"PDX\", \"dest\": \"SEA\"}]}"
+        }, 400, {"content-type": "application/json"}
+    pairs = []
+    for pair in pairs_in:
+        try:
+            pairs.append(parse_pair(pair))
+        except ValueError as err:
+            return {
+                "status": "error",
+                "msg": f"Invalid pair: {json.dumps(pair)}. {err}"
+            }, 400, {"content-type": "application/json"}
+    # remove duplicate pairs but keep the requested order
+    pairs = list(dict.fromkeys(pairs))
+    if len(pairs) > max_pairs:
+        return {
+            "status": "error",
+            "msg": f"Too many pairs: {len(pairs)}. Please request at most {max_pairs} pairs at a time."
+        }, 400, {"content-type": "application/json"}
+    request_logger.info("query routes for %d src/dest pairs", len(pairs), extra={"pairs": len(pairs)})
+
+    # the bigquery backend looks up all the pairs in a single query
+    routes = repo.routes_batch(pairs)
+    return {
+        "pairs": len(pairs),
+        "result": [{"src": src, "dest": dest, "routes": routes[(src, dest)]} for src, dest in pairs],
+    }, 200, {"content-type": "application/json"}
+
+
+
 if __name__ == "__main__":
-    # run flask app on port 8080
-    app.run('0.0.0.0', 8080)
+    # number of pre-forked worker processes (the env variable gunicorn uses too)
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        # load the data once, then fork the workers on port 8080
+        prefork.serve(lambda: create_app(preload=True), port=8080, workers=workers)
+    else:
+        app = create_app()
+        # run flask app on port 8080
+        app.run('0.0.0.0', 8080)
@@ -0,0 +1,63 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+import yaml
+
+
+CH4_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# a few deb-airports.csv and deb-routes.csv rows. Routes from or to: SEA 7, PDX 5, SFO 5, SAN 2, SMF and PSC 0.
+# ZZZ is a route only airport (missing from the airports file)
+AIRPORTS_CSV = """\
+"iata","airport","city","state","country","lat","lon"
+"PDX","Portland Intl","Portland","OR","USA",45.58872222,-122.5975
+"PSC","Tri-Cities","Pasco","WA","USA",46.26468028,-119.1190292
+"SAN","San Diego International-Lindbergh","San Diego","CA","USA",32.73355611,-117.1896567
+"SEA","Seattle-Tacoma Intl","Seattle","WA","USA",47.44898194,-122.3093131
+"SFO","San Francisco International","San Francisco","CA","USA",37.61900194,-122.3748433
+"SMF","Sacramento International","Sacramento","CA","USA",38.69542167,-121.5907669
+"""
+ROUTES_CSV = """\
+airline,src,dest,codeshare,stops,equipment
+DL,PDX,SEA,Y,0,CR9
+AS,PDX,SEA,,0,Q40
+AS,SEA,PDX,,0,Q40
+UA,SFO,PDX,,0,319
+AS,SFO,SEA,,0,737
+AS,SEA,SFO,,0,737
+DL,SEA,SAN,,0,738
+AS,PDX,SFO,,0,738
+UA,SFO,SAN,,0,320
+XX,SEA,ZZZ,,1,737
+"""
+
+
+@pytest.fixture
+def airspace_conf(tmp_path) -> dict:
+    """app configuration of the memory backend, loading the small airports and routes files"""
+    airports_csv = tmp_path / "deb-airports.csv"
+    routes_csv = tmp_path / "deb-routes.csv"
+    airports_csv.write_text(AIRPORTS_CSV, encoding="utf-8")
+    routes_csv.write_text(ROUTES_CSV, encoding="utf-8")
+    return {"backend": "memory", "airports_csv": str(airports_csv), "routes_csv": str(routes_csv),
+            "result_format": "rows", "max_batch_pairs": 3}
+
+
+@pytest.fixture
+def config_file(tmp_path, airspace_conf) -> str:
+    """config.yml of the apps, with `airspace_conf`"""
+    path = tmp_path / "config.yml"
+    path.write_text(yaml.safe_dump(airspace_conf), encoding="utf-8")
+    return str(path)
+
+
+def load_app_module(app_dir:str):
+    """imports the main.py of an app directory of chapter 4 (for example "ep4/python/ex2") as a new module"""
+    name = "main_" + app_dir.replace("/", "_")
+    spec = importlib.util.spec_from_file_location(name, os.path.join(CH4_DIR, app_dir, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,103 @@
+import csv
+import io
+
+import pytest
+
+from airspace.backends import LazyRepository, create_repository
+from airspace.repository import ROUTE_FIELDS, route_values
+
+from conftest import ROUTES_CSV
+
+
+ROUTES = [dict(zip(ROUTE_FIELDS, route_values(row))) for row in csv.DictReader(io.StringIO(ROUTES_CSV))]
+
+
+def expected_routes(src:str=None, dest:str=None) -> list:
+    return [route for route in ROUTES if (src is None or route["src"] == src) and (dest is None or route["dest"] == dest)]
+
+
+def sort_key(route:dict) -> tuple:
+    return tuple("" if value is None else str(value) for value in route.values())
+
+
+def assert_same_routes(routes:list, expected:list) -> None:
+    """same rows, ordered by airline (the order of routes with the same airline is not defined)"""
+    airlines = [route["airline"] for route in routes]
+    assert airlines == sorted(airlines)
+    assert sorted(routes, key=sort_key) == sorted(expected, key=sort_key)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def repo(request, airspace_conf):
+    repo = create_repository(airspace_conf, request.param)
+    yield repo
+    repo.close()
+
+
+def test_airports(repo):
+    airports = repo.airports()
+
+    assert [airport["iata"] for airport in airports] == ["PDX", "PSC", "SAN", "SEA", "SFO", "SMF"]
+    assert airports[0] == {"iata": "PDX", "airport": "Portland Intl", "city": "Portland", "state": "OR",
+                           "country": "USA", "lat": 45.58872222, "lon": -122.5975}
+
+
+def test_airport_by_iata(repo):
+    assert repo.airports(" sea")[0]["city"] == "Seattle"
+    assert repo.airports("XXX") == []
+    # route only airports have no airport row
+    assert repo.airports("ZZZ") == []
+
+
+@pytest.mark.parametrize("src,dest", [
+    ("PDX", "SEA"), ("SEA", None), (None, "SEA"), ("SFO", None), (None, "ZZZ"), ("SMF", None), ("PDX", "PSC"),
+    ("XXX", None), (None, None),
+])
+def test_routes(repo, src, dest):
+    assert_same_routes(repo.routes(src, dest), expected_routes(src, dest))
+
+
+def test_route_codes_are_normalized(repo):
+    assert_same_routes(repo.routes("pdx ", "sea"), expected_routes("PDX", "SEA"))
+
+
+def test_route_values(repo):
+    codeshare, direct = sorted(repo.routes("PDX", "SEA"), key=lambda route: route["airline"], reverse=True)
+
+    assert codeshare == {"airline": "DL", "src": "PDX", "dest": "SEA", "codeshare": "Y", "stops": 0,
+                         "equipment": "CR9"}
+    assert direct["codeshare"] is None
+
+
+def test_iter_routes_yields_the_routes(repo):
+    batches = list(repo.iter_routes("SEA"))
+
+    assert_same_routes([route for batch in batches for route in batch], expected_routes("SEA"))
+
+
+def test_routes_batch(repo):
+    routes = repo.routes_batch([("PDX", "SEA"), ("SFO", "SAN"), ("SMF", "SEA")])
+
+    assert_same_routes(routes[("PDX", "SEA")], expected_routes("PDX", "SEA"))
+    assert_same_routes(routes[("SFO", "SAN")], expected_routes("SFO", "SAN"))
+    assert routes[("SMF", "SEA")] == []
+
+
+def test_route_counts(repo):
+    counts = {iata: count for iata, count in repo.route_counts().items() if count}
+
+    assert counts == {"SEA": 7, "PDX": 5, "SFO": 5, "SAN": 2, "ZZZ": 1}
+
+
+def test_lazy_repository_creates_the_backend_on_first_use(airspace_conf):
+    repo = LazyRepository(airspace_conf)
+
+    assert not repo.initialized
+    assert_same_routes(repo.routes("SFO"), expected_routes("SFO"))
+    assert repo.initialized
+    assert repo.repo.name == "memory"
+
+
+def test_unknown_backend(airspace_conf):
+    with pytest.raises(ValueError):
+        create_repository(airspace_conf, "postgres")
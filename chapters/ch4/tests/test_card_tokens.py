@@ -0,0 +1,84 @@
+import re
+
+import pytest
+
+from card_tokens import CHUNK_SIZE, TOKEN_KEY_ENV, CardTokenizer, token_key
+
+
+CARDS = ["6503072302017585", "4111111111111111", "5500005555555559"]
+
+
+def test_same_key_same_tokens():
+    first = CardTokenizer(b"key").tokens(CARDS)
+    # a new tokenizer, so the tokens aren't cached
+    second = CardTokenizer(b"key").tokens(reversed(CARDS))
+
+    assert first == second
+    assert len(set(first.values())) == len(CARDS)
+
+
+def test_different_keys_different_tokens():
+    first = CardTokenizer(b"key").tokens(CARDS)
+    second = CardTokenizer(b"other key").tokens(CARDS)
+
+    assert not set(first.values()) & set(second.values())
+
+
+def test_token_format():
+    token = CardTokenizer(b"key").tokens(CARDS[:1])[CARDS[0]]
+
+    assert re.fullmatch("tok_[0-9a-f]{64}", token)
+    assert CARDS[0] not in token
+
+
+def test_repeated_numbers_hit_the_cache():
+    tokenizer = CardTokenizer(b"key", cache_size=2)
+    tokenizer.tokens(CARDS[:2] + CARDS[:1])
+    tokenizer.tokens(CARDS)
+
+    # CARDS[0] and CARDS[1] are cached; CARDS[0] is the least recently used when CARDS[2] is added
+    assert (tokenizer.hits, tokenizer.misses) == (3, 3)
+    assert list(tokenizer.cache) == CARDS[1:]
+
+
+def test_token_key_from_the_environment(monkeypatch):
+    monkeypatch.setenv(TOKEN_KEY_ENV, "secret")
+
+    assert token_key() == b"secret"
+    assert token_key(random_key=True) == b"secret"
+
+
+def test_token_key_without_the_environment(monkeypatch):
+    monkeypatch.delenv(TOKEN_KEY_ENV, raising=False)
+
+    with pytest.raises(ValueError):
+        token_key()
+    assert len(token_key(random_key=True)) == 32
+    assert token_key(random_key=True) != token_key(random_key=True)
+
+
+def test_tokenize_rows_drops_the_cvc():
+    rows = [
+        {"uid": "1", "credit_cards": [{"card_number": CARDS[0], "cvc": "123"}, {"card_number": CARDS[1], "cvc": "9"}]},
+        {"uid": "2", "credit_cards": [{"card_number": int(CARDS[0]), "cvc": 123}]},
+        # rejected rows: no cards, malformed cards, not a dict
+        {"uid": "3"},
+        {"uid": "4", "credit_cards": ["4111", {"cvc": "1"}, {"card_number": None}]},
+        ["not", "a", "dict"],
+    ]
+    CardTokenizer(b"key").tokenize_rows(rows)
+
+    first, second = rows[0]["credit_cards"]
+    assert first == {"card_number": CardTokenizer(b"key").tokens(CARDS[:1])[CARDS[0]]}
+    assert second["card_number"].startswith("tok_")
+    # numeric card numbers get the token of their text
+    assert rows[1]["credit_cards"] == [first]
+    assert rows[3]["credit_cards"] == ["4111", {}, {"card_number": None}]
+
+
+def test_thread_pool_matches_the_calling_thread():
+    numbers = [f"{number:016d}" for number in range(3 * CHUNK_SIZE + 17)]
+
+    with CardTokenizer(b"key", workers=3) as pooled:
+        assert pooled.pool is not None
+        assert pooled.tokens(numbers) == CardTokenizer(b"key").tokens(numbers)
@@ -0,0 +1,105 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+from columnar_csv import AIRPORTS_SCHEMA, ROUTES_SCHEMA, ColumnarCSV, DictColumn, read_airports, read_routes
+
+from conftest import CH4_DIR
+
+
+DATA_DIR = os.path.join(CH4_DIR, "../ch2/ep1/data")
+PYTHON_TYPES = {"category": str, "bytes": str, "int8": int, "int16": int, "int32": int, "int64": int,
+                "float32": float, "float64": float}
+
+
+def dict_reader_rows(path:str, schema:dict) -> list:
+    """the rows of csv.DictReader (reading backslash escaped quotes), converted to the schema types"""
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        return [{field: PYTHON_TYPES[schema.get(field, "category")](value) for field, value in row.items()}
+                for row in csv.DictReader(csv_file, escapechar="\\", doublequote=False)]
+
+
+def write_csv(tmp_path, text:str) -> str:
+    path = tmp_path / "test.csv"
+    path.write_bytes(text.encode("utf-8"))
+    return str(path)
+
+
+@pytest.mark.parametrize("file_name,read", [("deb-routes.csv", read_routes), ("deb-airports.csv", read_airports)])
+def test_course_files_match_dict_reader(file_name, read):
+    path = os.path.join(DATA_DIR, file_name)
+    schema = ROUTES_SCHEMA if read is read_routes else AIRPORTS_SCHEMA
+
+    table = read(path)
+
+    expected = dict_reader_rows(path, schema)
+    assert len(table) == len(expected)
+    assert table.rows() == expected
+
+
+def test_quoted_fields(tmp_path):
+    text = ('"iata","airport","city","lat"\n'
+            '"AAA","Quoted, with a comma","A \\"city\\"",1.5\n'
+            '"BBB","","Plain",-2.25\n'
+            'CCC,Unquoted,"Comma, City",0\n')
+    schema = {"airport": "bytes", "lat": "float64"}
+    path = write_csv(tmp_path, text)
+
+    rows = ColumnarCSV.read(path, schema).rows()
+
+    assert rows == dict_reader_rows(path, schema)
+    assert rows[0] == {"iata": "AAA", "airport": "Quoted, with a comma", "city": 'A "city"', "lat": 1.5}
+
+
+def test_crlf_empty_lines_and_no_final_newline(tmp_path):
+    path = write_csv(tmp_path, "airline,src,stops\r\nAS,SEA,0\r\n\r\n\nDL,PDX,-1\r\nUA,,12")
+
+    table = ColumnarCSV.read(path, {"stops": "int8"})
+
+    assert table.rows() == dict_reader_rows(path, {"stops": "int8"})
+    assert table.rows() == [{"airline": "AS", "src": "SEA", "stops": 0}, {"airline": "DL", "src": "PDX", "stops": -1},
+                            {"airline": "UA", "src": "", "stops": 12}]
+
+
+def test_chunks_share_one_dictionary(tmp_path):
+    lines = [f"{'ABCDE'[i % 5]}{i % 3},{i}" for i in range(500)]
+    path = write_csv(tmp_path, "code,number\n" + "\n".join(lines) + "\n")
+
+    # chunks of a few lines
+    table = ColumnarCSV.read(path, {"number": "int32"}, chunk_bytes=64)
+
+    code = table["code"]
+    assert isinstance(code, DictColumn)
+    assert len(code.dictionary) == 15
+    assert code.decode().tolist() == [line.split(",")[0] for line in lines]
+    assert code[code.codes == code.code_of("A0")].tolist() == ["A0"] * 34
+    assert code.code_of("XX") == -1
+    assert np.array_equal(table["number"], np.arange(500))
+
+
+def test_columns_are_read_only():
+    routes = read_routes(os.path.join(DATA_DIR, "deb-routes.csv"))
+
+    assert routes["stops"].dtype == np.int8
+    assert not routes["stops"].flags.writeable
+    assert not routes["src"].codes.flags.writeable
+
+
+@pytest.mark.parametrize("text,schema", [
+    ("a,b\n1,2\n3\n", {}),
+    ("a,b\n1,2,3\n", {}),
+    ("a,b\n1,x\n", {"b": "int8"}),
+    ("a,b\n1,300\n", {"b": "int8"}),
+    ("a,b\n1,\n", {"b": "int16"}),
+    ("a,b\n1,2\n", {"b": "decimal"}),
+])
+def test_invalid_rows(tmp_path, text, schema):
+    with pytest.raises(ValueError):
+        ColumnarCSV.read(write_csv(tmp_path, text), schema)
+
+
+def test_wrong_field_count_reports_the_line(tmp_path):
+    with pytest.raises(ValueError, match="Line 3"):
+        ColumnarCSV.read(write_csv(tmp_path, "a,b\n1,2\n3\n4,5\n"))
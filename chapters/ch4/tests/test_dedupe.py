@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+from dedupe import BLOOM_FILE, STATE_FILE, BloomFilter, UidDeduper, uid_digest
+from process_profiles import process_line
+
+from conftest import CH4_DIR
+
+
+PROFILES_FILE = os.path.join(CH4_DIR, "../ch2/ep2/data/profiles_complex.json")
+
+
+def test_duplicates_within_a_run(tmp_path):
+    deduper = UidDeduper(str(tmp_path), capacity=1000)
+
+    assert [deduper.check_and_add(uid) for uid in ["a", "b", "a", "c", "b"]] == [False, False, True, False, True]
+    assert (deduper.count, deduper.duplicates) == (3, 2)
+
+
+def test_uids_persist_across_runs(tmp_path):
+    with UidDeduper(str(tmp_path), capacity=1000) as first_run:
+        for i in range(100):
+            first_run.check_and_add(f"uid-{i}")
+
+    assert {STATE_FILE, BLOOM_FILE} <= set(os.listdir(tmp_path))
+    second_run = UidDeduper(str(tmp_path))
+    assert second_run.count == 100
+    assert second_run.check_and_add("uid-42")
+    assert not second_run.check_and_add("uid-100")
+    assert second_run.count == 101
+
+
+def test_the_bloom_filter_size_is_kept_by_the_state_dir(tmp_path):
+    UidDeduper(str(tmp_path), capacity=1000, fpr=0.01).flush()
+
+    # the size arguments only apply to a new state dir
+    reopened = UidDeduper(str(tmp_path), capacity=10_000_000)
+    assert reopened.bloom.num_bits == BloomFilter.for_capacity(1000, 0.01).num_bits
+    assert os.path.getsize(tmp_path / BLOOM_FILE) == len(reopened.bloom.bits)
+    with open(tmp_path / STATE_FILE, encoding="utf-8") as state_file:
+        assert json.load(state_file)["capacity"] == 1000
+
+
+def test_false_positives_are_not_duplicates(tmp_path):
+    # a tiny filter: most new uids hit bits that are already set
+    deduper = UidDeduper(str(tmp_path), capacity=1000, max_memory_mb=16 / 1024 / 1024, flush_size=50)
+    uids = [f"uid-{i}" for i in range(500)]
+
+    assert not any(deduper.check_and_add(uid) for uid in uids)
+    assert all(deduper.check_and_add(uid) for uid in uids)
+    assert deduper.false_positives > 0
+    assert (deduper.count, deduper.duplicates) == (500, 500)
+
+
+def test_bloom_filter_memory_budget():
+    bloom = BloomFilter.for_capacity(1_000_000, 0.001, max_bytes=1024)
+
+    assert len(bloom.bits) == 1024
+    with pytest.raises(ValueError):
+        BloomFilter.for_capacity(1000, 1.5)
+
+
+def test_uids_must_be_strings(tmp_path):
+    deduper = UidDeduper(str(tmp_path))
+
+    with pytest.raises(TypeError):
+        deduper.check_and_add(42)
+    assert uid_digest("42") != uid_digest("042")
+
+
+def test_profiles_rerun_rejects_every_ok_row(tmp_path):
+    with open(PROFILES_FILE, "rb") as profiles_file:
+        lines = profiles_file.readlines()
+
+    def errors(deduper:UidDeduper) -> list:
+        with deduper:
+            return [process_line(line, line_num, deduper)[1] for line_num, line in enumerate(lines, 1)]
+
+    first_errors = errors(UidDeduper(str(tmp_path), capacity=1000))
+    second_errors = errors(UidDeduper(str(tmp_path)))
+
+    assert first_errors.count(None) == 23
+    assert second_errors.count(None) == 0
+    assert sum("Duplicate uid" in err for err in second_errors) == 23
@@ -0,0 +1,55 @@
+import time
+
+from flask import Flask, Response
+from werkzeug.test import EnvironBuilder
+
+from airspace.metrics import init_metrics, timed_batches
+
+
+def make_app() -> Flask:
+    app = Flask(__name__)
+
+    @app.route("/routes")
+    def routes():
+        return {"result": []}
+
+    @app.route("/stream")
+    def stream():
+        def slow_batches():
+            time.sleep(0.01)
+            yield ["PDX\n"]
+        # the backend time of a streamed response is spent while the server iterates the body
+        return Response((line for batch in timed_batches(slow_batches()) for line in batch))
+
+    init_metrics(app)
+    return app
+
+
+def call(app:Flask, path:str, iterate:bool=True) -> None:
+    """calls the app like a wsgi server: iterates the body (or not), then always closes it"""
+    body = app.wsgi_app(EnvironBuilder(path=path).get_environ(), lambda status, headers, exc_info=None: None)
+    if iterate:
+        for _ in body:
+            pass
+    body.close()
+
+
+def test_request_is_recorded_when_the_body_is_closed_without_iterating():
+    app = make_app()
+    metrics = app.extensions["metrics"]
+
+    call(app, "/routes", iterate=False)
+
+    assert metrics.routes[("/routes", "GET")].statuses == {"200": 1}
+
+
+def test_streamed_backend_time_is_counted():
+    app = make_app()
+    metrics = app.extensions["metrics"]
+
+    call(app, "/stream")
+
+    stats = metrics.routes[("/stream", "GET")]
+    # sums: duration, backend, serialization
+    assert stats.sums[1] >= 0.01
+    assert stats.sums[1] <= stats.sums[0]
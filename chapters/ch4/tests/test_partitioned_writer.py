@@ -0,0 +1,123 @@
+import json
+import os
+
+import pytest
+
+from partitioned_writer import (MANIFEST_FILE, NULL_PARTITION, PartitionedWriter, load_manifest, matching_partitions,
+                                parse_partition_by, read_partitions)
+
+
+ROWS = [
+    {"uid": "1", "state": "CA", "zip": "94501"},
+    {"uid": "2", "state": "NY", "zip": "10001"},
+    {"uid": "3", "state": "CA", "zip": "94502"},
+    {"uid": "4", "state": "CA", "zip": "90210"},
+    {"uid": "5", "state": None, "zip": "00000"},
+    {"uid": "6", "state": "", "zip": None},
+]
+
+
+def write_rows(directory:str, rows:list, partition_by="state,zip:3", **kwargs) -> dict:
+    with PartitionedWriter(directory, partition_by, **kwargs) as writer:
+        for row in rows:
+            writer.write(row)
+    return load_manifest(directory)
+
+
+def test_manifest_lists_the_partitions(tmp_path):
+    manifest = write_rows(str(tmp_path), ROWS)
+
+    assert manifest["partition_by"] == ["state", "zip3"]
+    assert manifest["rows"] == 6
+    summary = {partition["path"]: (partition["values"], partition["rows"], len(partition["files"]))
+               for partition in manifest["partitions"]}
+    assert summary == {
+        os.path.join("state=CA", "zip3=945"): ({"state": "CA", "zip3": "945"}, 2, 1),
+        os.path.join("state=CA", "zip3=902"): ({"state": "CA", "zip3": "902"}, 1, 1),
+        os.path.join("state=NY", "zip3=100"): ({"state": "NY", "zip3": "100"}, 1, 1),
+        os.path.join(f"state={NULL_PARTITION}", "zip3=000"): ({"state": NULL_PARTITION, "zip3": "000"}, 1, 1),
+        os.path.join(f"state={NULL_PARTITION}", f"zip3={NULL_PARTITION}"):
+            ({"state": NULL_PARTITION, "zip3": NULL_PARTITION}, 1, 1),
+    }
+    for partition in manifest["partitions"]:
+        part = partition["files"][0]
+        assert part["path"] == os.path.join(partition["path"], "part-00000.json")
+        assert os.path.getsize(tmp_path / part["path"]) == part["bytes"]
+
+
+def test_read_partitions(tmp_path):
+    write_rows(str(tmp_path), ROWS)
+
+    assert [row["uid"] for row in read_partitions(str(tmp_path), state="CA", zip3="945")] == ["1", "3"]
+    assert sorted(row["uid"] for row in read_partitions(str(tmp_path), state="CA")) == ["1", "3", "4"]
+    assert sorted(row["uid"] for row in read_partitions(str(tmp_path))) == ["1", "2", "3", "4", "5", "6"]
+    assert [p["rows"] for p in matching_partitions(str(tmp_path), state=NULL_PARTITION, zip3="000")] == [1]
+    assert matching_partitions(str(tmp_path), state="TX") == []
+
+
+def test_part_files_roll_at_the_target_size(tmp_path):
+    rows = [{"uid": str(i), "state": "CA" if i % 3 else "NY", "padding": "x" * 40} for i in range(100)]
+
+    manifest = write_rows(str(tmp_path), rows, "state", target_file_mb=500 / 1024 / 1024, buffer_rows=7)
+
+    for partition in manifest["partitions"]:
+        files = partition["files"]
+        assert len(files) > 1
+        assert [part["path"] for part in files] == [os.path.join(partition["path"], f"part-{i:05d}.json")
+                                                     for i in range(len(files))]
+        # every part file but the last one is full
+        assert all(part["bytes"] >= 500 for part in files[:-1])
+        assert sum(part["rows"] for part in files) == partition["rows"]
+    assert [row["uid"] for row in read_partitions(str(tmp_path), state="NY")] == [str(i) for i in range(0, 100, 3)]
+
+
+def test_least_recently_written_files_are_closed(tmp_path):
+    rows = [{"uid": str(i), "state": ["CA", "NY", "WA"][i % 3]} for i in range(30)]
+
+    with PartitionedWriter(str(tmp_path), "state", max_open_files=2, buffer_rows=1) as writer:
+        for row in rows:
+            writer.write(row)
+            assert len(writer.open_files) <= 2
+    # every row reopens a closed file, in append mode
+    assert writer.files_opened == 30
+    assert [row["uid"] for row in read_partitions(str(tmp_path), state="WA")] == [str(i) for i in range(2, 30, 3)]
+    assert all(len(partition["files"]) == 1 for partition in load_manifest(str(tmp_path))["partitions"])
+
+
+def test_existing_partitions_need_overwrite(tmp_path):
+    write_rows(str(tmp_path), ROWS)
+
+    with pytest.raises(FileExistsError):
+        PartitionedWriter(str(tmp_path), "state")
+
+    manifest = write_rows(str(tmp_path), ROWS[:2], "state", overwrite=True)
+    assert manifest["rows"] == 2
+    assert sorted(os.listdir(tmp_path)) == [MANIFEST_FILE, "state=CA", "state=NY"]
+
+
+def test_custom_encoder(tmp_path):
+    write_rows(str(tmp_path), ROWS[:1], "state", encode=lambda row: json.dumps(row, sort_keys=True, indent=None))
+
+    with open(tmp_path / "state=CA" / "part-00000.json", encoding="utf-8") as part_file:
+        assert part_file.read() == '{"state": "CA", "uid": "1", "zip": "94501"}\n'
+
+
+def test_partition_values_are_valid_directory_names(tmp_path):
+    manifest = write_rows(str(tmp_path), [{"uid": "1", "city": "a/b=c"}], "city")
+
+    assert manifest["partitions"][0]["path"] == "city=a_b_c"
+
+
+@pytest.mark.parametrize("spec,expected", [
+    ("state", [("state", "state", None)]),
+    ("state, zip:3", [("state", "state", None), ("zip3", "zip", 3)]),
+    (["zip:5"], [("zip5", "zip", 5)]),
+])
+def test_parse_partition_by(spec, expected):
+    assert parse_partition_by(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["", "zip:x", ":3", "state,,zip"])
+def test_invalid_partition_by(spec):
+    with pytest.raises(ValueError):
+        parse_partition_by(spec)
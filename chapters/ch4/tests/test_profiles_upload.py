@@ -0,0 +1,84 @@
+import io
+import os
+import json
+
+import pytest
+
+from conftest import CH4_DIR, load_app_module
+
+
+# 30 profiles: 23 OK and 7 rejected by the profiles ETL checks
+PROFILES_FILE = os.path.join(CH4_DIR, "../ch2/ep2/data/profiles_complex.json")
+
+
+@pytest.fixture
+def profiles() -> bytes:
+    with open(PROFILES_FILE, "rb") as profiles_file:
+        return profiles_file.read()
+
+
+def load_app(monkeypatch, output_dir:str=None, token_key:str=None):
+    """imports the upload app with the environment variables it reads"""
+    for name, value in (("PROFILES_OUTPUT_DIR", output_dir), ("CARD_TOKEN_KEY", token_key)):
+        if value is None:
+            monkeypatch.delenv(name, raising=False)
+        else:
+            monkeypatch.setenv(name, value)
+    return load_app_module("ep3/python/ex1")
+
+
+def upload(app_module, data:bytes):
+    return app_module.app.test_client().post("/profiles", data=data, content_type="application/x-ndjson")
+
+
+def test_upload_counts_ok_and_rejected_rows(monkeypatch, profiles):
+    # a blank line is skipped, an invalid json line is rejected
+    data = profiles + b"\n" + b"{not json\n"
+    response = upload(load_app(monkeypatch), data)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body["lines"], body["ok"], body["rejected"]) == (32, 23, 8)
+    assert len(body["rejects"]) == 8
+    assert body["rejects"][-1].startswith("[31][ERR]")
+    assert "ok_file" not in body
+
+
+def test_upload_writes_the_ok_and_reject_files(monkeypatch, tmp_path, profiles):
+    response = upload(load_app(monkeypatch, str(tmp_path), "test key"), profiles)
+
+    body = response.get_json()
+    with open(tmp_path / body["ok_file"], encoding="utf-8") as ok_file:
+        ok_rows = [json.loads(line) for line in ok_file]
+    with open(tmp_path / body["reject_file"], encoding="utf-8") as reject_file:
+        reject_lines = reject_file.readlines()
+    assert (len(ok_rows), len(reject_lines)) == (body["ok"], body["rejected"]) == (23, 7)
+    # card numbers are tokenized and the cvc is dropped
+    cards = [card for row in ok_rows for card in row["credit_cards"]]
+    assert cards and all(card["card_number"].startswith("tok_") and "cvc" not in card for card in cards)
+    assert b"6503072302017585" in profiles
+    assert "6503072302017585" not in (tmp_path / body["ok_file"]).read_text(encoding="utf-8")
+
+
+def test_upload_without_a_token_key_fails(monkeypatch, tmp_path, profiles):
+    response = upload(load_app(monkeypatch, str(tmp_path)), profiles)
+
+    assert response.status_code == 500
+    assert "CARD_TOKEN_KEY" in response.get_json()["error_msg"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_iter_lines_splits_chunks_into_lines(monkeypatch):
+    app_module = load_app(monkeypatch)
+    stream = io.BytesIO(b'{"a": 1}\n\n{"b": 22}\n' + b"x" * 25 + b'\n{"c": 3}')
+
+    lines = list(app_module.iter_lines(stream, chunk_size=4, max_line_bytes=20))
+
+    # the too long line is yielded as None; the last line has no newline
+    assert lines == [b'{"a": 1}', b"", b'{"b": 22}', None, b'{"c": 3}']
+
+
+def test_iter_lines_skips_a_too_long_last_line(monkeypatch):
+    app_module = load_app(monkeypatch)
+
+    assert list(app_module.iter_lines(io.BytesIO(b"ok\n" + b"x" * 50), chunk_size=8, max_line_bytes=10)) == [b"ok", None]
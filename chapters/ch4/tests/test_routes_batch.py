@@ -0,0 +1,84 @@
+import pytest
+
+from conftest import load_app_module
+
+
+@pytest.fixture
+def client(config_file):
+    # the conftest config allows 3 pairs per request
+    return load_app_module("ep4/python/ex2").create_app(config_file).test_client()
+
+
+def test_pairs_are_normalized_deduplicated_and_ordered(client):
+    response = client.post("/routes/batch", json={"pairs": [
+        {"src": "pdx", "dest": " sea "}, ["SFO", "SAN"], {"src": "PDX", "dest": "SEA"}, ["SEA", "PSC"],
+    ]})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["pairs"] == 3
+    assert [(item["src"], item["dest"]) for item in body["result"]] == [("PDX", "SEA"), ("SFO", "SAN"), ("SEA", "PSC")]
+    assert sorted(route["airline"] for route in body["result"][0]["routes"]) == ["AS", "DL"]
+    assert [route["equipment"] for route in body["result"][1]["routes"]] == ["320"]
+    assert body["result"][2]["routes"] == []
+
+
+def test_a_list_body_is_a_list_of_pairs(client):
+    response = client.post("/routes/batch", json=[["PDX", "SFO"]])
+
+    assert response.status_code == 200
+    assert response.get_json()["result"][0]["routes"][0]["airline"] == "AS"
+
+
+def test_duplicate_pairs_count_once_against_the_limit(client):
+    response = client.post("/routes/batch", json={"pairs": [["PDX", "SEA"]] * 10})
+
+    assert response.status_code == 200
+    assert response.get_json()["pairs"] == 1
+
+
+def test_too_many_pairs(client):
+    response = client.post("/routes/batch", json={"pairs": [["PDX", "SEA"], ["SEA", "PDX"], ["SFO", "SAN"],
+                                                            ["SEA", "SFO"]]})
+
+    assert response.status_code == 400
+    assert "at most 3 pairs" in response.get_json()["msg"]
+
+
+@pytest.mark.parametrize("body", [
+    {"pairs": []},
+    {"pairs": "PDX,SEA"},
+    {"pairs": {"src": "PDX", "dest": "SEA"}},
+    {"src": "PDX", "dest": "SEA"},
+    [],
+    "PDX",
+])
+def test_body_without_a_list_of_pairs(client, body):
+    response = client.post("/routes/batch", json=body)
+
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "error"
+
+
+def test_body_that_is_not_json(client):
+    response = client.post("/routes/batch", data="PDX,SEA", content_type="text/plain")
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("pair", [
+    ["PDX"],
+    ["PDX", "SEA", "SFO"],
+    "PDXSEA",
+    {"src": "PDX"},
+    {"dest": "SEA"},
+    ["PDX", 5],
+    ["PDX", None],
+    ["PDX", " "],
+    {"src": ["PDX"], "dest": "SEA"},
+])
+def test_invalid_pair(client, pair):
+    response = client.post("/routes/batch", json={"pairs": [["PDX", "SEA"], pair]})
+
+    assert response.status_code == 400
+    assert response.get_json()["msg"].startswith("Invalid pair")
@@ -0,0 +1,114 @@
+import random
+
+import numpy as np
+import pytest
+
+from airspace.repository import ROUTE_FIELDS
+from airspace.routes_table import RoutesTable, SymbolTable
+
+
+def random_routes(num_rows:int, seed:int=7) -> list:
+    """(airline, src, dest, codeshare, stops, equipment) rows, with repeated (src, dest) pairs"""
+    rnd = random.Random(seed)
+    airports = [f"A{i:02d}" for i in range(40)]
+    airlines = ["AS", "DL", "UA", "WN", "B6", "2B"]
+    return [(rnd.choice(airlines), rnd.choice(airports), rnd.choice(airports), rnd.choice(["", "Y"]),
+             rnd.choice([0, 0, 1]), rnd.choice(["737", "CR9", "320"])) for _ in range(num_rows)]
+
+
+def as_dicts(rows:list) -> list:
+    return [dict(zip(ROUTE_FIELDS, (airline, src, dest, codeshare or None, stops, equipment)))
+            for airline, src, dest, codeshare, stops, equipment in rows]
+
+
+def expected(rows:list, src:str=None, dest:str=None) -> list:
+    """the matching rows in the "ORDER BY airline, src, dest" order of the sql backends (stable for ties)"""
+    matching = [row for row in as_dicts(rows) if (src is None or row["src"] == src) and
+                (dest is None or row["dest"] == dest)]
+    return sorted(matching, key=lambda row: (row["airline"], row["src"], row["dest"]))
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return random_routes(2000)
+
+
+@pytest.fixture(scope="module")
+def table(rows):
+    return RoutesTable.from_rows(rows)
+
+
+def test_pair_lookups(table, rows):
+    for src in ["A00", "A07", "A39"]:
+        for dest in ["A00", "A13", "A21"]:
+            assert table.rows(table.lookup(src, dest)) == expected(rows, src, dest)
+
+
+def test_src_and_dest_lookups(table, rows):
+    for code in ["A00", "A05", "A38"]:
+        assert table.rows(table.lookup(src=code)) == expected(rows, src=code)
+        assert table.rows(table.lookup(dest=code)) == expected(rows, dest=code)
+
+
+def test_all_rows(table, rows):
+    assert len(table) == len(rows)
+    assert table.rows(table.lookup()) == expected(rows)
+
+
+def test_unknown_airports(table):
+    assert table.rows(table.lookup("XXX", "A00")) == []
+    assert table.rows(table.lookup("A00", "XXX")) == []
+    assert table.rows(table.lookup(src="XXX")) == []
+    assert table.rows(table.lookup(dest="XXX")) == []
+    assert table.destinations("XXX") == []
+
+
+def test_csr_offsets(table, rows):
+    airports = table.airports
+    for src in ["A01", "A02"]:
+        src_id = airports.id_of(src)
+        edges = table.edge_dest[table.src_offsets[src_id]:table.src_offsets[src_id + 1]]
+        # one edge per destination, sorted by dest id
+        assert edges.tolist() == sorted({airports.id_of(row[2]) for row in rows if row[1] == src})
+        assert sorted(table.destinations(src)) == sorted({row[2] for row in rows if row[1] == src})
+        # the rows of the src airport are one contiguous slice, sorted by dest id
+        src_rows = table.src_rows(src_id)
+        assert sorted(table.rows(src_rows), key=str) == sorted(expected(rows, src=src), key=str)
+        assert np.all(np.diff(table.dest[src_rows]) >= 0)
+
+
+def test_airport_ids_are_shared():
+    # the airport ids of the memory backend are the row numbers of its airports table
+    airports = SymbolTable(["PDX", "SEA", "SFO"])
+    table = RoutesTable.from_rows([("AS", "SEA", "PDX", "", 0, "Q40"), ("AS", "SEA", "ZZZ", "Y", 1, "737")], airports)
+
+    assert airports.symbols == ["PDX", "SEA", "SFO", "ZZZ"]
+    assert table.src.dtype == np.int16
+    assert table.rows(table.lookup("SEA")) == [
+        {"airline": "AS", "src": "SEA", "dest": "PDX", "codeshare": None, "stops": 0, "equipment": "Q40"},
+        {"airline": "AS", "src": "SEA", "dest": "ZZZ", "codeshare": "Y", "stops": 1, "equipment": "737"},
+    ]
+
+
+def test_decoded_rows_share_the_code_strings(table):
+    first, second = table.rows(table.lookup(src="A03"))[:2]
+
+    assert first["src"] is second["src"]
+
+
+def test_from_csv(tmp_path):
+    path = tmp_path / "deb-routes.csv"
+    path.write_text("airline,src,dest,codeshare,stops,equipment\n2B,ASF,KZN,,0,CR2\n2B,ASF,MRV,Y,0,CR2\n",
+                    encoding="utf-8")
+    table = RoutesTable.from_csv(str(path))
+
+    assert table.rows(table.lookup("ASF", "MRV")) == [
+        {"airline": "2B", "src": "ASF", "dest": "MRV", "codeshare": "Y", "stops": 0, "equipment": "CR2"}]
+
+
+def test_empty_table():
+    table = RoutesTable.from_rows([])
+
+    assert len(table) == 0
+    assert table.rows(table.lookup()) == []
+    assert table.rows(table.lookup("PDX")) == []
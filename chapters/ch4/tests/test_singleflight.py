@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from airspace.singleflight import SingleFlight, SingleFlightError, query_key
+
+
+CALLERS = 8
+KEY = query_key("SELECT * FROM routes WHERE src = @src", {"src": "PDX"})
+
+
+class Backend:
+    """a backend call that blocks until released, so that every caller joins the same flight"""
+
+    def __init__(self, result=None, error:BaseException=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def wait_for_waiters(flights:SingleFlight, waiters:int) -> None:
+    deadline = time.monotonic() + 5
+    while flights.stats()["waiting"] < waiters:
+        assert time.monotonic() < deadline, "callers did not join the flight"
+        time.sleep(0.001)
+
+
+def run_callers(flights:SingleFlight, backend:Backend) -> list:
+    """calls `flights.do()` from CALLERS threads at once; returns each caller's result or exception"""
+
+    def call():
+        try:
+            return flights.do(KEY, backend)
+        except BaseException as err:
+            return err
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+        futures = [pool.submit(call) for _ in range(CALLERS)]
+        wait_for_waiters(flights, CALLERS - 1)
+        backend.release.set()
+        return [future.result() for future in futures]
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    result = [{"src": "PDX", "dest": "SEA"}]
+    backend = Backend(result=result)
+
+    results = run_callers(flights, backend)
+
+    assert backend.calls == 1
+    assert all(r is result for r in results)
+    stats = flights.stats()
+    assert stats["executions"] == 1
+    assert stats["deduplicated"] == CALLERS - 1
+    assert stats["in_flight"] == 0
+
+
+def test_error_propagates_to_every_waiter():
+    flights = SingleFlight()
+    backend = Backend(error=ValueError("bq job failed"))
+
+    errors = run_callers(flights, backend)
+
+    assert backend.calls == 1
+    assert all(isinstance(err, ValueError) and str(err) == "bq job failed" for err in errors)
+    # each caller raises its own exception object
+    assert len({id(err) for err in errors}) == CALLERS
+    assert flights.stats()["errors"] == 1
+
+
+def test_interrupted_leader_fails_the_waiters():
+    flights = SingleFlight()
+    backend = Backend(error=KeyboardInterrupt())
+
+    errors = run_callers(flights, backend)
+
+    assert sum(isinstance(err, KeyboardInterrupt) for err in errors) == 1
+    waiter_errors = [err for err in errors if not isinstance(err, KeyboardInterrupt)]
+    assert len(waiter_errors) == CALLERS - 1
+    assert all(isinstance(err, SingleFlightError) for err in waiter_errors)
+    assert all(isinstance(err.__cause__, KeyboardInterrupt) for err in waiter_errors)
+
+
+def test_key_is_released_after_an_error():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError("bq job failed")
+
+    with pytest.raises(ValueError):
+        flights.do(KEY, fail)
+
+    assert flights.stats()["in_flight"] == 0
+    assert flights.do(KEY, lambda: "retried") == "retried"
+    assert flights.stats()["executions"] == 2
@@ -0,0 +1,93 @@
+import pytest
+
+from airspace.backends import create_repository
+from airspace.suggest import AirportIndex
+
+from conftest import load_app_module
+
+
+AIRPORTS = [
+    {"iata": "SFO", "airport": "San Francisco International", "city": "San Francisco"},
+    {"iata": "SAN", "airport": "San Diego International-Lindbergh", "city": "San Diego"},
+    {"iata": "SEA", "airport": "Seattle-Tacoma Intl", "city": "Seattle"},
+    {"iata": "SMF", "airport": "Sacramento International", "city": "Sacramento"},
+    {"iata": "PDX", "airport": "Portland Intl", "city": "Portland"},
+]
+ROUTE_COUNTS = {"SEA": 7, "PDX": 5, "SFO": 5, "SAN": 2}
+
+
+def iata_codes(rows:list) -> list:
+    return [row["iata"] for row in rows]
+
+
+def test_suggestions_are_ranked_by_route_count():
+    index = AirportIndex(AIRPORTS, ROUTE_COUNTS)
+
+    assert iata_codes(index.suggest("s")) == ["SEA", "SFO", "SAN", "SMF"]
+    assert index.suggest("s")[0]["routes"] == 7
+
+
+def test_suggestions_match_any_word_ignoring_case():
+    index = AirportIndex(AIRPORTS, ROUTE_COUNTS)
+
+    assert iata_codes(index.suggest("FRAN")) == ["SFO"]
+    assert iata_codes(index.suggest("international")) == ["SFO", "SAN", "SMF"]
+    assert iata_codes(index.suggest("seattle-tac")) == ["SEA"]
+    assert index.suggest("xyz") == []
+    assert index.suggest("  ") == []
+
+
+def test_exact_iata_code_comes_first():
+    index = AirportIndex(AIRPORTS, ROUTE_COUNTS)
+
+    # SFO has more routes, but "san" is the iata code of San Diego
+    assert iata_codes(index.suggest("san")) == ["SAN", "SFO"]
+
+
+def test_limit():
+    index = AirportIndex(AIRPORTS, ROUTE_COUNTS)
+
+    assert iata_codes(index.suggest("s", limit=2)) == ["SEA", "SFO"]
+    assert index.suggest("s", limit=0) == []
+
+
+def test_long_queries_are_matched_past_the_key_length():
+    long_name = "Aeropuerto Internacional de la Ciudad de Mexico Benito Juarez"
+    index = AirportIndex(AIRPORTS + [{"iata": "MEX", "airport": long_name, "city": "Mexico City"}], ROUTE_COUNTS)
+
+    assert iata_codes(index.suggest(long_name)) == ["MEX"]
+    assert index.suggest(long_name + " X") == []
+
+
+def test_repository_builds_the_index_from_its_backend(airspace_conf):
+    repo = create_repository(airspace_conf)
+
+    assert iata_codes(repo.suggest_airports("s")) == ["SEA", "SFO", "SAN", "SMF"]
+    assert iata_codes(repo.suggest_airports("p")) == ["PDX", "PSC"]
+
+
+@pytest.fixture(params=["ep2/python/ex3", "ep4/python/ex2"])
+def app_module(request):
+    return load_app_module(request.param)
+
+
+def suggest(app_module, config_file:str, query:str) -> list:
+    response = app_module.create_app(config_file).test_client().get(f"/airports/suggest?{query}")
+    assert response.status_code == 200
+    body = response.get_json()
+    # the mysql app returns "results", the bigquery app "result"
+    return iata_codes(body.get("results", body.get("result")))
+
+
+def test_suggest_endpoint_ranks_and_limits(app_module, config_file):
+    assert suggest(app_module, config_file, "q=s") == ["SEA", "SFO", "SAN", "SMF"]
+    assert suggest(app_module, config_file, "q=san") == ["SAN", "SFO"]
+    assert suggest(app_module, config_file, "q=s&limit=2") == ["SEA", "SFO"]
+
+
+def test_suggest_endpoint_clamps_the_limit(app_module, config_file, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_SUGGEST_LIMIT", 3)
+
+    assert suggest(app_module, config_file, "q=s&limit=0") == ["SEA"]
+    assert suggest(app_module, config_file, "q=s&limit=-5") == ["SEA"]
+    assert suggest(app_module, config_file, "q=s&limit=1000") == ["SEA", "SFO", "SAN"]
@@ -0,0 +1,5 @@
+"""
+Helpers shared by the chapters of the bootcamp, installed with `pip install -e chapters/common`:
+
+    from dsa_common.logs import sampled, setup_logging
+"""
@@ -0,0 +1,241 @@
+"""
+Non-blocking, structured logging for the chapter 4 flask apps and the chapter 2 profiles ETL.
+
+    from dsa_common.logs import sampled, setup_logging
+
+`setup_logging()` replaces `logging.basicConfig(...)`: log calls only put their record on a queue (`QueueHandler`),
+and a background thread (`QueueListener`) formats the records and writes them to stderr. The message is formatted by
+the background thread too; so log with %-style args instead of f-strings:
+
+    logger.info("query routes for src: %s and dest: %s", src, dest, extra={"src": src, "dest": dest})
+
+Records are written as one json object per line, with the `extra` fields of the log call:
+
+    {"ts": "2026-10-19T07:13:02.357Z", "level": "INFO", "logger": "main", "module": "main", "line": 161,
+     "msg": "query routes for src: PDX and dest: SEA", "src": "PDX", "dest": "SEA"}
+
+High volume logs (one or more per request, or per row) go through a `sampled()` logger, which only keeps a
+LOG_SAMPLE_RATE fraction of its INFO and DEBUG records; warnings and errors are always kept. The werkzeug request
+log is sampled the same way. Environment variables:
+
+    LOG_LEVEL         minimum level. Defaults to INFO.
+    LOG_FORMAT        json, or text for the `[LEVEL][time][module:line] : message` lines. Defaults to json.
+    LOG_SAMPLE_RATE   fraction of the sampled records to keep, for example 0.01. Defaults to 1: keep all.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import itertools
+from logging.handlers import QueueHandler, QueueListener
+
+
+LOG_FORMATS = ["json", "text"]
+TEXT_FORMAT = '[%(levelname)-5s][%(asctime)s][%(module)s:%(lineno)04d] : %(message)s'
+# `Logger.log(stacklevel=)` needs python 3.8 (app.yaml targets python37): on 3.7, sampled records report this module
+STACKLEVEL = sys.version_info >= (3, 8)
+# attributes of every log record; any other attribute comes from the `extra` arg of the log call
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+# formats tracebacks in the logging thread
+_traceback_formatter = logging.Formatter()
+# set by setup_logging()
+_queue_handler = None
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single line json object, including the `extra` fields of the log call. Values that are
+    not json types are converted with str().
+    """
+
+    def __init__(self):
+        super().__init__()
+        # reused for every record (json.dumps() with arguments creates a new encoder on every call)
+        self.encoder = json.JSONEncoder(default=str)
+        # the timestamp of the last second formatted
+        self._second = None
+        self._second_text = None
+
+    def format(self, record:logging.LogRecord) -> str:
+        second = int(record.created)
+        if second != self._second:
+            self._second_text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._second = second
+        entry = {
+            "ts": f"{self._second_text}.{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return self.encoder.encode(entry)
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Queues records without formatting their message: the logging thread formats it. Logged args must not be
+    changed after the log call.
+    """
+
+    def prepare(self, record:logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # the traceback refers to frames of the calling thread: format it now
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps 1 in every 1/rate INFO and DEBUG records; warnings and errors are always kept. Add it to a logger
+    that doesn't go through `sampled()` (for example: the werkzeug request log).
+    """
+
+    def __init__(self, rate:float):
+        """
+        Args:
+            rate (float): fraction of the records to keep, from 0 to 1
+        """
+        super().__init__()
+        self.every = sample_every(rate)
+        self._counter = itertools.count()
+
+    def filter(self, record:logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or (self.every > 0 and next(self._counter) % self.every == 0)
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """
+    Logger that keeps 1 in every 1/rate INFO and DEBUG calls; warnings and errors are always logged. The other
+    calls return before creating a log record. When sampling, kept records get a `sample_rate` field.
+    """
+
+    def __init__(self, logger:logging.Logger, rate:float):
+        """
+        Args:
+            logger (logging.Logger): logger
+            rate (float): fraction of the calls to keep, from 0 to 1
+        """
+        super().__init__(logger, {"sample_rate": rate} if rate < 1 else {})
+        self.every = sample_every(rate)
+        self._counter = itertools.count()
+
+    def log(self, level:int, msg, *args, **kwargs) -> None:
+        if not self.isEnabledFor(level):
+            return
+        if level < logging.WARNING and (self.every == 0 or next(self._counter) % self.every):
+            return
+        msg, kwargs = self.process(msg, kwargs)
+        if STACKLEVEL:
+            # report the caller's module and line, not this method's
+            kwargs["stacklevel"] = kwargs.get("stacklevel", 1) + 1
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def process(self, msg, kwargs):
+        # keep the call's extra fields
+        kwargs["extra"] = {**self.extra, **kwargs["extra"]} if "extra" in kwargs else self.extra
+        return msg, kwargs
+
+
+def sample_every(rate:float) -> int:
+    """returns N to keep 1 in every N records, or 0 to keep none"""
+    if not 0 <= rate <= 1:
+        raise ValueError(f"Invalid log sample rate: {rate}. Must be from 0 to 1")
+    return round(1 / rate) if rate > 0 else 0
+
+
+def sample_rate() -> float:
+    """returns the LOG_SAMPLE_RATE environment variable"""
+    return float(os.environ.get("LOG_SAMPLE_RATE", 1))
+
+
+def sampled(logger:logging.Logger, rate:float=None) -> SampledLogger:
+    """
+    Returns a logger for high volume logs, see `SampledLogger`.
+
+    Args:
+        logger (logging.Logger): logger
+        rate (float, optional): fraction of the calls to keep. Defaults to the LOG_SAMPLE_RATE environment variable.
+
+    Returns:
+        SampledLogger: sampled logger
+    """
+    return SampledLogger(logger, sample_rate() if rate is None else rate)
+
+
+def setup_logging(level:str=None, log_format:str=None, stream=None) -> QueueListener:
+    """
+    Sends all the log records through a queue to a background thread, which formats and writes them (see the
+    module docs). Replaces the handlers of the root logger. Calling it again does nothing.
+
+    Args:
+        level (str, optional): minimum level. Defaults to the LOG_LEVEL environment variable, or INFO.
+        log_format (str, optional): json or text. Defaults to the LOG_FORMAT environment variable, or json.
+        stream (file, optional): output stream. Defaults to stderr.
+
+    Returns:
+        QueueListener: background writer
+
+    Raises:
+        ValueError: unknown log format
+    """
+    global _queue_handler, _listener
+    if _listener is not None:
+        return _listener
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    log_format = log_format or os.environ.get("LOG_FORMAT", "json")
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format: {log_format}. Must be one of {LOG_FORMATS}")
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.SimpleQueue()
+    _queue_handler = LazyQueueHandler(log_queue)
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    if sample_rate() < 1:
+        logging.getLogger("werkzeug").addFilter(SampleFilter(sample_rate()))
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    # write the queued records before exiting
+    atexit.register(stop_logging)
+    # forked processes (see `airspace.prefork`) don't have the logging thread: start a new one
+    os.register_at_fork(after_in_child=_restart_listener)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Writes the queued records and stops the logging thread (call it before `os._exit()`)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_listener() -> None:
+    global _listener
+    if _listener is not None:
+        log_queue = queue.SimpleQueue()
+        _queue_handler.queue = log_queue
+        _listener = QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()